@@ -0,0 +1,540 @@
+import csv
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from PySide import QtCore
+import requests
+from Http import GetSession
+from Health import GetHealthMonitor
+from Repositories import GetRegistry
+from Utils import DownloadToCache, IntegrityError, ParameterValues, BuildModelURL, WaitForJob
+
+# Columns of a CSV manifest that are not component parameters
+ENTRY_COLUMNS = ['namespace', 'version', 'repository']
+PLACEMENT_COLUMNS = ['x', 'y', 'z', 'yaw', 'pitch', 'roll']
+
+# Batch inserters that are still running, kept so that they are not garbage collected
+running_batches = []
+
+
+class ManifestError(Exception):
+    """
+    Raised when a bill of materials manifest cannot be read.
+    """
+    pass
+
+
+class BatchError(Exception):
+    """
+    Raised when a single component of a batch cannot be loaded, with a message for the user.
+    """
+    pass
+
+
+def ParsePlacement(values, where):
+    """
+    Turns a list of up to six numbers (x, y, z, yaw, pitch, roll) into a
+    placement tuple, with anything that is missing set to 0.
+    """
+    try:
+        placement = [float(value) if value not in [None, ''] else 0.0 for value in values]
+    except (TypeError, ValueError):
+        raise ManifestError("The placement of " + where + " is not a list of numbers.")
+
+    if len(placement) > len(PLACEMENT_COLUMNS):
+        raise ManifestError("The placement of " + where + " has more than " + str(len(PLACEMENT_COLUMNS)) + " values.")
+
+    return tuple(placement + [0.0] * (len(PLACEMENT_COLUMNS) - len(placement)))
+
+
+def ReadManifest(path):
+    """
+    Reads a bill of materials manifest and returns its entries as dicts with
+    the namespace, version, repository, params and placement of each
+    component. CSV manifests have namespace, version, repository and x, y, z,
+    yaw, pitch and roll columns, and every other column is a parameter. JSON
+    manifests are a list of objects with namespace, version, repository,
+    params and placement fields, where the placement is either a list of
+    those six numbers or an object with position and rotation lists. Only the
+    namespace is required.
+    """
+    entries = []
+
+    try:
+        if os.path.splitext(path)[1].lower() == '.csv':
+            with open(path, 'r', newline='') as manifest_file:
+                for line, row in enumerate(csv.DictReader(manifest_file), start=2):
+                    where = "line " + str(line)
+                    params = {}
+                    for name, value in row.items():
+                        if name != None and name.strip() not in ENTRY_COLUMNS + PLACEMENT_COLUMNS and value not in [None, '']:
+                            params[name.strip()] = value.strip()
+
+                    placement = ParsePlacement([row.get(column) for column in PLACEMENT_COLUMNS], where)
+                    entries.append(MakeEntry(row.get('namespace'), row.get('version'), row.get('repository'), params, placement, where))
+        else:
+            with open(path, 'r') as manifest_file:
+                document = json.load(manifest_file)
+
+            # The components can either be the whole document or a list inside it
+            if isinstance(document, dict):
+                document = document.get('components')
+            if not isinstance(document, list):
+                raise ManifestError("A JSON manifest has to be a list of components.")
+
+            for index, item in enumerate(document):
+                where = "component " + str(index + 1)
+                if not isinstance(item, dict):
+                    raise ManifestError("The entry for " + where + " is not an object.")
+
+                placement = item.get('placement', [])
+                if isinstance(placement, dict):
+                    placement = list(placement.get('position', [0, 0, 0]))[:3] + list(placement.get('rotation', []))
+
+                params = item.get('params', {})
+                if not isinstance(params, dict):
+                    raise ManifestError("The params of " + where + " are not an object.")
+
+                entries.append(MakeEntry(item.get('namespace'), item.get('version'), item.get('repository'), params, ParsePlacement(placement, where), where))
+    except OSError:
+        raise ManifestError("The manifest file could not be opened.")
+    except (ValueError, csv.Error) as error:
+        raise ManifestError("The manifest file could not be parsed: " + str(error))
+
+    if len(entries) == 0:
+        raise ManifestError("The manifest does not list any components.")
+
+    return entries
+
+
+def MakeEntry(namespace, version, repository, params, placement, where):
+    """
+    Checks and assembles a single manifest entry.
+    """
+    if namespace == None or str(namespace).strip() == '':
+        raise ManifestError("There is no namespace for " + where + ".")
+
+    return {'namespace': str(namespace).strip(),
+            'version': str(version).strip() if version not in [None, ''] else None,
+            'repository': str(repository).strip().rstrip('/') if repository not in [None, ''] else None,
+            'params': params,
+            'placement': placement}
+
+
+def ParameterKeys(json_result, params):
+    """
+    Re-keys the parameters of a manifest entry, which can be given by either
+    their key or their name, by the keys the component uses. Raises KeyError
+    for a parameter the component does not have.
+    """
+    keys_by_name = {}
+    for key, param_info in json_result['params'].items():
+        keys_by_name[param_info['name'].strip()] = key
+
+    values = {}
+    for name, value in params.items():
+        if name in json_result['params']:
+            values[name] = value
+        elif name.strip() in keys_by_name:
+            values[keys_by_name[name.strip()]] = value
+        else:
+            raise KeyError(name)
+
+    return values
+
+
+class BatchWorker(QtCore.QThread):
+    """
+    Threaded worker that resolves every component of a manifest, then downloads
+    and parses each distinct model once, several at a time.
+    """
+
+    entries = []  # The manifest entries to load
+    repo_urls = []  # The models URLs of the repositories to look components up in
+    max_concurrent = 4  # The number of models that can be downloaded at the same time
+    deadline = 600.0  # The number of seconds a long-running model job is given to finish
+    cancelled = False  # Set when the user no longer wants the batch
+    revalidate = False  # Whether cached models are checked with the server before they are used
+
+    # Progress is the percentage of distinct models that have been loaded, and
+    # the batch finishes with a list of (entry index, shape, identity)
+    batchProgress = QtCore.Signal(int)
+    entryFailed = QtCore.Signal(int, str)
+    batchFinished = QtCore.Signal(object)
+
+    def __init__(self):
+        from PySide import QtCore
+        QtCore.QThread.__init__(self)
+
+    def Cancel(self):
+        """
+        Asks the worker to stop at the next opportunity.
+        """
+        self.cancelled = True
+
+    def IsCancelled(self):
+        """
+        Returns whether the batch has been cancelled.
+        """
+        return self.cancelled
+
+    def Resolve(self, namespace, version, repository):
+        """
+        Finds the search result of a component in the repositories. The local
+        catalogue is used when it is enabled, otherwise the repositories are
+        searched for the namespace. Returns None if the component cannot be found.
+        """
+        from Catalogue import GetCatalogue, IsCatalogueEnabled
+
+        repo_urls = [repository] if repository != None else self.repo_urls
+
+        for models_url in repo_urls:
+            json_results = None
+            if IsCatalogueEnabled():
+                json_results = GetCatalogue().Search(models_url, namespace)
+
+            # A catalogue that does not know the component may just be out of date
+            if json_results == None or not any(json_result.get('namespace') == namespace for json_result in json_results):
+                try:
+                    response = GetSession().get(models_url + '/search', params={'q': namespace})
+                    json_results = response.json() if response.status_code == 200 else []
+                except (requests.exceptions.RequestException, ValueError):
+                    continue
+
+            for json_result in json_results:
+                if json_result.get('namespace') == namespace and (version == None or json_result.get('version') == version):
+                    return json_result
+
+            # The search only lists the latest version, but older versions can be downloaded from the same place
+            for json_result in json_results:
+                if json_result.get('namespace') == namespace and version != None:
+                    return dict(json_result, version=version)
+
+        return None
+
+    def FetchModel(self, download_url, base_url, namespace, version, step_cache):
+        """
+        Downloads and parses a single model, waiting for the server to generate
+        it first if it has to. Raises BatchError if the model cannot be loaded.
+        """
+        from Cache import IsOffline, ReadShape
+
+        step_file_path = step_cache.Lookup(download_url)
+
+        # A refresh asks the server whether each cached model has changed, which only costs a header exchange if it has not
+        if step_file_path != None and self.revalidate and not IsOffline() and step_cache.Validators(download_url) != None:
+            try:
+                response, new_file_path = DownloadToCache(download_url, step_cache, is_cancelled=self.IsCancelled,
+                                                          validators=step_cache.Validators(download_url))
+                if response.status_code == 304:
+                    step_cache.MarkValidated(download_url)
+                elif new_file_path != None:
+                    step_file_path = new_file_path
+            except (requests.exceptions.RequestException, IntegrityError):
+                pass
+
+        if step_file_path == None:
+            if IsOffline():
+                raise BatchError("has not been cached and offline mode is enabled")
+
+            try:
+                response, step_file_path = DownloadToCache(download_url, step_cache, is_cancelled=self.IsCancelled)
+
+                # Models that take a while to generate are downloaded once their job finishes
+                if response.status_code == 307 and '/job/' in response.headers.get('location', ''):
+                    server_url = base_url.replace('/' + namespace + '/' + version, '')
+                    if not WaitForJob(server_url + response.headers['location'], self.deadline, self.IsCancelled):
+                        raise BatchError("took too long to generate")
+
+                    response, step_file_path = DownloadToCache(download_url, step_cache, is_cancelled=self.IsCancelled)
+            except requests.exceptions.RequestException:
+                raise BatchError("could not be downloaded because of a problem connecting to the server")
+            except IntegrityError as error:
+                raise BatchError("was incomplete or corrupted (" + str(error) + ")")
+
+            if step_file_path == None:
+                if self.cancelled:
+                    raise BatchError("was cancelled")
+                raise BatchError("could not be downloaded, status code " + str(response.status_code))
+
+        try:
+            return ReadShape(step_file_path)
+        except Exception:
+            raise BatchError("could not be read")
+
+    def PlanModels(self, step_cache, pool):
+        """
+        Resolves every entry to the model it needs. Returns a dict mapping the
+        cache key of each distinct model to its identity and the indices of the
+        entries that use it.
+        """
+
+        # Each component only needs to be looked up once, no matter how many times it is used
+        lookups = {}
+        for entry in self.entries:
+            lookup = (entry['namespace'], entry['version'], entry['repository'])
+            if lookup not in lookups:
+                lookups[lookup] = pool.submit(self.Resolve, *lookup)
+
+        # Work out the model each entry needs, and group the entries that need the same one
+        models = {}
+        for index, entry in enumerate(self.entries):
+            json_result = lookups[(entry['namespace'], entry['version'], entry['repository'])].result()
+            if json_result == None:
+                self.entryFailed.emit(index, "could not be found in any of the repositories")
+                continue
+
+            try:
+                base_url = json_result['url'] + '/' + json_result['version']
+                download_url = BuildModelURL(base_url, ParameterValues(json_result, ParameterKeys(json_result, entry['params'])))
+            except KeyError as error:
+                self.entryFailed.emit(index, "has a parameter the component does not have: " + str(error))
+                continue
+            except (TypeError, ValueError):
+                self.entryFailed.emit(index, "has parameter values that do not fit the component")
+                continue
+
+            key = step_cache.Key(download_url)
+            if key not in models:
+                models[key] = {'identity': {'namespace': json_result['namespace'], 'version': json_result['version'],
+                                            'base_url': base_url, 'model_url': download_url}, 'indices': []}
+            models[key]['indices'].append(index)
+
+        return models
+
+    def run(self):
+        """
+        Resolves, downloads and parses all of the components, each distinct model once.
+        """
+        from Cache import GetStepCache
+
+        step_cache = GetStepCache()
+        pool = ThreadPoolExecutor(max_workers=self.max_concurrent)
+        models = self.PlanModels(step_cache, pool)
+
+        # Download and parse each distinct model once
+        futures = {}
+        for key, model in models.items():
+            identity = model['identity']
+            futures[pool.submit(self.FetchModel, identity['model_url'], identity['base_url'], identity['namespace'], identity['version'], step_cache)] = model
+
+        shapes = []
+        for done, future in enumerate(as_completed(futures), start=1):
+            model = futures[future]
+
+            try:
+                shape = future.result()
+                for index in model['indices']:
+                    shapes.append((index, shape, model['identity']))
+            except BatchError as error:
+                for index in model['indices']:
+                    self.entryFailed.emit(index, str(error))
+
+            self.batchProgress.emit(int(100 * done / len(futures)))
+
+        pool.shutdown(wait=True)
+
+        if not self.cancelled:
+            self.batchFinished.emit(sorted(shapes, key=lambda item: item[0]))
+
+
+class RefreshWorker(BatchWorker):
+    """
+    Batch worker that loads the current models for components that are
+    already in a document. The entries are the identities stored on the
+    features, so there is nothing to look up.
+    """
+
+    revalidate = True
+
+    def PlanModels(self, step_cache, pool):
+        """
+        Groups the entries by the model they were made from.
+        """
+        models = {}
+        for index, identity in enumerate(self.entries):
+            key = step_cache.Key(identity['model_url'])
+            if key not in models:
+                models[key] = {'identity': identity, 'indices': []}
+            models[key]['indices'].append(index)
+
+        return models
+
+
+class BatchRunner:
+    """
+    Runs a batch worker with a progress dialog, and hands the loaded shapes to
+    apply_shapes once they have all arrived, so that the document only has to
+    be changed and recomputed once. apply_shapes is called with (entry index,
+    shape, identity) for every component that was loaded.
+    """
+
+    title = "OCCI Batch"  # The title of the progress dialog
+
+    def __init__(self, worker, entries, message, apply_shapes):
+        from PySide import QtGui
+
+        self.entries = entries  # The entries the worker is loading
+        settings = QtCore.QSettings("OCCI", "occi-freecad-plugin")
+
+        self.progress = QtGui.QProgressDialog(message, "Cancel", 0, 100)
+        self.progress.setWindowTitle(self.title)
+        self.progress.setMinimumDuration(0)
+
+        self.worker = worker
+        self.worker.entries = entries
+        self.worker.max_concurrent = int(settings.value('batch/max_concurrent', 4))
+        self.worker.deadline = float(settings.value('jobs/deadline', 600.0))
+        self.worker.batchProgress.connect(self.progress.setValue)
+        self.worker.entryFailed.connect(self.EntryFailed)
+        self.worker.batchFinished.connect(apply_shapes)
+        self.worker.finished.connect(self.BatchDone)
+        self.progress.canceled.connect(self.worker.Cancel)
+
+    def Start(self):
+        """
+        Starts loading the components in the background.
+        """
+        running_batches.append(self)
+        self.worker.start()
+
+    def EntryName(self, index):
+        """
+        Returns how an entry is described to the user.
+        """
+        return self.entries[index]['namespace']
+
+    def EntryFailed(self, index, message):
+        """
+        Called by the worker when a component cannot be loaded.
+        """
+        import FreeCAD
+
+        FreeCAD.Console.PrintError("OCCI ERROR: " + self.EntryName(index) + " " + message + ".\r\n")
+
+    def BatchDone(self):
+        """
+        Called when the worker's thread has finished, whether it succeeded or not.
+        """
+        self.progress.close()
+
+        if self in running_batches:
+            running_batches.remove(self)
+
+
+class BatchInserter(BatchRunner):
+    """
+    Inserts all of the components of a manifest into the active document.
+    """
+
+    title = "OCCI Batch Insert"
+
+    def __init__(self, entries):
+        BatchRunner.__init__(self, BatchWorker(), entries, "Loading " + str(len(entries)) + " OCCI components...", self.ApplyShapes)
+        # Repositories that are down are left out, and the quickest ones are asked first
+        self.worker.repo_urls = GetHealthMonitor().Route(GetRegistry().EnabledURLs())[0]
+
+    def EntryName(self, index):
+        """
+        Returns how an entry is described to the user.
+        """
+        return "Component " + str(index + 1) + " of the manifest (" + self.entries[index]['namespace'] + ")"
+
+    def ApplyShapes(self, shapes):
+        """
+        Adds a feature for every component that was loaded, as a single step
+        that can be undone, and recomputes the document once. When instancing
+        is enabled, repeats of a component become links to a single feature.
+        """
+        import FreeCAD
+        import FreeCADGui
+        from Cache import CanonicalURL
+        from Utils import AddComponentFeature, AddComponentLink, MasterFeatures, IsInstancingEnabled
+
+        # If there is not an active document, add one
+        ad = FreeCAD.activeDocument()
+        is_new_doc = ad == None
+        if is_new_doc:
+            ad = FreeCAD.newDocument("untitled occi assembly")
+
+        # Features already in the document can be linked to as well as the ones this batch adds
+        masters = MasterFeatures(ad) if IsInstancingEnabled() else None
+
+        ad.openTransaction("Insert OCCI components")
+        for index, shape, identity in shapes:
+            x, y, z, yaw, pitch, roll = self.entries[index]['placement']
+
+            model_key = CanonicalURL(identity['model_url'])
+            if masters != None and model_key in masters:
+                new_feature = AddComponentLink(ad, masters[model_key])
+            else:
+                new_feature = AddComponentFeature(ad, identity, shape)
+                if masters != None:
+                    masters[model_key] = new_feature
+            new_feature.Placement = FreeCAD.Placement(FreeCAD.Vector(x, y, z), FreeCAD.Rotation(yaw, pitch, roll))
+        ad.commitTransaction()
+
+        # Everything is recomputed once instead of after every component
+        ad.recompute()
+
+        if is_new_doc:
+            FreeCADGui.activeDocument().activeView().viewIsometric()
+            FreeCADGui.SendMsgToActiveView("ViewFit")
+
+        FreeCAD.Console.PrintMessage("OCCI: Inserted " + str(len(shapes)) + " of " + str(len(self.entries)) + " components from the manifest.\r\n")
+
+
+class ComponentUpdater(BatchRunner):
+    """
+    Refreshes every feature in a document that was made by the plugin.
+    """
+
+    title = "OCCI Update All Components"
+
+    def __init__(self, document, features):
+        from Utils import ComponentIdentity
+
+        self.document_name = document.Name  # The document the features are in
+        self.feature_names = [feature.Name for feature in features]  # The features being refreshed, in entry order
+
+        identities = [ComponentIdentity(feature) for feature in features]
+        BatchRunner.__init__(self, RefreshWorker(), identities, "Refreshing " + str(len(features)) + " OCCI components...", self.ApplyShapes)
+
+    def EntryName(self, index):
+        """
+        Returns how an entry is described to the user.
+        """
+        return self.feature_names[index] + " (" + self.entries[index]['namespace'] + ")"
+
+    def ApplyShapes(self, shapes):
+        """
+        Gives every feature its refreshed shape as a single step that can be
+        undone, and recomputes the document once.
+        """
+        import FreeCAD
+        from Utils import SetFeatureShape
+
+        # The document may have been closed in the meantime
+        ad = FreeCAD.listDocuments().get(self.document_name)
+        if ad == None:
+            return
+
+        ad.openTransaction("Update OCCI components")
+        for index, shape, identity in shapes:
+            feature = ad.getObject(self.feature_names[index])
+            if feature != None:
+                SetFeatureShape(feature, shape)
+        ad.commitTransaction()
+
+        ad.recompute()
+
+        FreeCAD.Console.PrintMessage("OCCI: Refreshed " + str(len(shapes)) + " of " + str(len(self.entries)) + " components.\r\n")
+
+
+def OCCIFeatures(document):
+    """
+    Returns every feature in a document that was made by the plugin.
+    """
+    from Utils import ComponentIdentity
+
+    return [feature for feature in document.Objects if ComponentIdentity(feature) != None]
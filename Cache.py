@@ -0,0 +1,813 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# The number of seconds an interrupted download is kept around to be resumed
+PARTIAL_MAX_AGE = 24 * 3600
+
+# The number of seconds a temporary file can go without being written to before it is taken to be left over from a crash
+TEMP_MAX_AGE = 3600
+
+# Models with at least this many STEP entities are worth starting a separate process to import
+PROCESS_MIN_ENTITIES = 20000
+
+# The number of seconds a worker process is given to import a model
+PROCESS_TIMEOUT = 600
+
+# Only one STEP file is parsed inside FreeCAD at a time, and the worker processes that can import others at the same time
+parse_lock = threading.Lock()
+process_slots = None
+
+# The plugin-wide STEP, shape, search and JSON document caches, created on first use
+step_cache = None
+shape_cache = None
+query_cache = None
+json_cache = None
+
+
+def CanonicalURL(url):
+    """
+    Puts a model URL into a canonical form so that the same component, version and
+    parameter set always produce the same cache key, no matter what order the
+    parameters were added in.
+    """
+    parts = urlsplit(url)
+
+    # Parameter order does not change the model, so sort the parameters
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip('/'), query, ''))
+
+
+class StepCache:
+    """
+    Persistent, size-bounded cache of downloaded STEP files. Each file is named
+    after a hash of the canonical URL it was downloaded from, and the least
+    recently used files are evicted once the cache grows past its maximum size.
+    Interrupted downloads are kept as .partial files so that they can be resumed.
+    """
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir  # Where the cached STEP files are kept
+        self.max_size = max_size  # Maximum number of bytes the cache can hold
+        self.hits = 0  # Number of lookups that were answered from the cache
+        self.misses = 0  # Number of lookups that had to go to the server
+        self.claimed = set()  # The keys of the partial files that downloads are writing to
+        self.lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def Key(self, url):
+        """
+        Returns the cache key for a model URL.
+        """
+        return hashlib.sha256(CanonicalURL(url).encode('utf-8')).hexdigest()
+
+    def PathForKey(self, key):
+        """
+        Returns the path that the STEP file with the given key is stored at.
+        """
+        return os.path.join(self.cache_dir, key + '.step')
+
+    def Contains(self, url):
+        """
+        Returns whether the model at the URL is cached, without counting it as a
+        hit or a miss or marking it as used.
+        """
+        return os.path.isfile(self.PathForKey(self.Key(url)))
+
+    def Lookup(self, url):
+        """
+        Returns the path to the cached STEP file for the URL, or None if it has
+        not been downloaded yet.
+        """
+        path = self.PathForKey(self.Key(url))
+
+        with self.lock:
+            if os.path.isfile(path):
+                self.hits += 1
+
+                # Mark the file as recently used so that it is evicted last
+                os.utime(path, None)
+
+                return path
+
+            self.misses += 1
+
+        return None
+
+    def NewTempFile(self):
+        """
+        Opens a temporary file inside the cache directory for a download to be
+        written into, so that it can be moved into place without a copy.
+        """
+        return tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix='.part', delete=False, mode='wb')
+
+    def Store(self, url, temp_path, validators=None, entities=None):
+        """
+        Moves a completed download into the cache and returns its new path. The
+        validators the server sent with the download are kept so that the file
+        can be revalidated later, along with the number of STEP entities in it
+        if that was counted while it downloaded.
+        """
+        key = self.Key(url)
+        path = self.PathForKey(key)
+
+        with self.lock:
+            os.replace(temp_path, path)
+
+            # Anything made from an older download of this model is out of date, and there is nothing left to resume
+            for stale_path in [self.SidecarPath(path), os.path.join(self.cache_dir, key + '.partial.meta')]:
+                try:
+                    os.remove(stale_path)
+                except OSError:
+                    pass
+            if shape_cache != None:
+                shape_cache.Remove(key)
+
+            self.WriteMeta(path, validators or {}, entities)
+
+        # The file that was just stored is about to be used, so it stays even if it is bigger than the cache on its own
+        self.Evict(keep=path)
+
+        return path
+
+    def MetaPath(self, path):
+        """
+        Returns the path of the file holding the validators of a cached STEP file.
+        """
+        return os.path.splitext(path)[0] + '.meta'
+
+    def ReadMeta(self, path):
+        """
+        Returns the validators, last validation time and entity count stored for
+        a cached STEP file, or None if there are none.
+        """
+        try:
+            with open(self.MetaPath(path), 'r') as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+
+    def WriteMeta(self, path, validators, entities=None):
+        """
+        Stores the validators and entity count of a cached STEP file and marks it as just validated.
+        """
+        meta_path = self.MetaPath(path)
+
+        try:
+            with open(meta_path + '.part', 'w') as meta_file:
+                json.dump({'validators': validators, 'validated_at': time.time(), 'entities': entities}, meta_file)
+            os.replace(meta_path + '.part', meta_path)
+        except OSError:
+            pass
+
+    def Validators(self, url):
+        """
+        Returns the validators stored for the model at the URL, or None if the
+        server did not send any.
+        """
+        meta = self.ReadMeta(self.PathForKey(self.Key(url)))
+        if meta == None or len(meta['validators']) == 0:
+            return None
+
+        return meta['validators']
+
+    def NeedsRevalidation(self, url, max_age):
+        """
+        Returns whether the cached model at the URL was last validated more than
+        max_age seconds ago and can be checked with the server. Files without
+        validators can only be refreshed by downloading them again, so they are
+        trusted as they are.
+        """
+        meta = self.ReadMeta(self.PathForKey(self.Key(url)))
+        if meta == None or len(meta['validators']) == 0:
+            return False
+
+        return time.time() - meta['validated_at'] > max_age
+
+    def MarkValidated(self, url):
+        """
+        Records that the server has confirmed the cached model at the URL is still current.
+        """
+        path = self.PathForKey(self.Key(url))
+
+        with self.lock:
+            meta = self.ReadMeta(path)
+            if meta != None:
+                self.WriteMeta(path, meta['validators'], meta.get('entities'))
+
+    def PartialPath(self, url):
+        """
+        Returns the path that an interrupted download of the model at the URL is kept at.
+        """
+        return os.path.join(self.cache_dir, self.Key(url) + '.partial')
+
+    def ClaimPartial(self, url):
+        """
+        Reserves the partial file of the model at the URL for a download and
+        returns its path, or None if another download is already using it.
+        """
+        key = self.Key(url)
+
+        with self.lock:
+            if key in self.claimed:
+                return None
+
+            self.claimed.add(key)
+
+        return self.PartialPath(url)
+
+    def ReleasePartial(self, url):
+        """
+        Gives up the reservation made by ClaimPartial.
+        """
+        with self.lock:
+            self.claimed.discard(self.Key(url))
+
+    def PartialValidators(self, url):
+        """
+        Returns the validators of an interrupted download of the model at the
+        URL, or None if there is no download that can be resumed.
+        """
+        partial_path = self.PartialPath(url)
+
+        try:
+            if os.path.getsize(partial_path) == 0:
+                return None
+
+            with open(partial_path + '.meta', 'r') as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+
+    def KeepPartial(self, url, validators):
+        """
+        Records the validators of an interrupted download so that it can be resumed later.
+        """
+        try:
+            with open(self.PartialPath(url) + '.meta', 'w') as meta_file:
+                json.dump(validators, meta_file)
+        except OSError:
+            self.DiscardPartial(url)
+
+    def DiscardPartial(self, url):
+        """
+        Removes an interrupted download that cannot be resumed.
+        """
+        partial_path = self.PartialPath(url)
+        self.Discard(partial_path)
+        self.Discard(partial_path + '.meta')
+
+    def Discard(self, temp_path):
+        """
+        Removes a download that did not complete.
+        """
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+    def SidecarPath(self, path):
+        """
+        Returns the path of the BREP copy of a cached STEP file.
+        """
+        return os.path.splitext(path)[0] + '.brep'
+
+    def Entries(self):
+        """
+        Returns a list of (path, size, last used time) for every cached STEP
+        file. The size includes the file's BREP sidecar, if there is one.
+        """
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith('.step'):
+                continue
+
+            path = os.path.join(self.cache_dir, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            size = stat.st_size
+            try:
+                size += os.path.getsize(self.SidecarPath(path))
+            except OSError:
+                pass
+
+            entries.append((path, size, stat.st_mtime))
+
+        return entries
+
+    def TempFiles(self):
+        """
+        Returns a list of (path, size, last written time) for every temporary
+        file in the cache, which are downloads and sidecars still being written
+        or ones that were left behind.
+        """
+        temp_files = []
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith('.part'):
+                continue
+
+            path = os.path.join(self.cache_dir, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            temp_files.append((path, stat.st_size, stat.st_mtime))
+
+        return temp_files
+
+    def RemoveStaleTempFiles(self):
+        """
+        Removes the temporary files that nothing has written to for a long time,
+        and returns the total size of the ones that are left. The caller must
+        hold the lock.
+        """
+        remaining_size = 0
+        for path, size, last_written in self.TempFiles():
+            try:
+                if time.time() - last_written > TEMP_MAX_AGE:
+                    os.remove(path)
+                    continue
+            except OSError:
+                pass
+
+            remaining_size += size
+
+        return remaining_size
+
+    def Evict(self, keep=None):
+        """
+        Removes the least recently used files until the cache fits within its
+        maximum size, along with any interrupted downloads that are too old to
+        resume and any temporary files that were left behind. Temporary files
+        that are still being written count towards the size. The file at the
+        keep path is never removed.
+        """
+        with self.lock:
+            temp_size = self.RemoveStaleTempFiles()
+
+            for file_name in os.listdir(self.cache_dir):
+                if not file_name.endswith('.partial') or file_name.split('.')[0] in self.claimed:
+                    continue
+
+                partial_path = os.path.join(self.cache_dir, file_name)
+                try:
+                    if time.time() - os.path.getmtime(partial_path) > PARTIAL_MAX_AGE:
+                        os.remove(partial_path)
+                        os.remove(partial_path + '.meta')
+                except OSError:
+                    pass
+
+            entries = sorted(self.Entries(), key=lambda entry: entry[2])
+            total_size = sum(entry[1] for entry in entries) + temp_size
+
+            for path, size, last_used in entries:
+                if total_size <= self.max_size:
+                    break
+                if path == keep:
+                    continue
+
+                try:
+                    os.remove(path)
+                    total_size -= size
+                except OSError:
+                    pass
+
+                # The BREP copy and validators are useless without the STEP file they belong to
+                for sidecar_path in [self.SidecarPath(path), self.MetaPath(path)]:
+                    try:
+                        os.remove(sidecar_path)
+                    except OSError:
+                        pass
+
+    def Clear(self):
+        """
+        Removes every file from the cache.
+        """
+        with self.lock:
+            self.RemoveStaleTempFiles()
+
+            for file_name in os.listdir(self.cache_dir):
+                # Leave any downloads that are still in progress alone, the temporary files left behind are already gone
+                if file_name.endswith('.part') or file_name.split('.')[0] in self.claimed:
+                    continue
+
+                try:
+                    os.remove(os.path.join(self.cache_dir, file_name))
+                except OSError:
+                    pass
+
+    def Stats(self):
+        """
+        Returns the hit/miss counts along with the number and total size of
+        cached files. The size includes the temporary files.
+        """
+        entries = self.Entries()
+        temp_files = self.TempFiles()
+
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(entries), 'temp_files': len(temp_files),
+                'size': sum(entry[1] for entry in entries) + sum(temp_file[1] for temp_file in temp_files)}
+
+
+class ShapeCache:
+    """
+    In-memory LRU cache of parsed shapes so that repeated inserts of the same
+    model do not need to parse its file again. The cache is bounded by the
+    approximate memory footprint of the shapes, estimated from their file size.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size  # Approximate maximum number of bytes the shapes can use
+        self.size = 0  # Approximate number of bytes the cached shapes are using
+        self.shapes = OrderedDict()  # Maps each key to a (shape, size) tuple, least recently used first
+        self.lock = threading.Lock()
+
+    def Get(self, key):
+        """
+        Returns a copy of the cached shape for the key, or None if it is not cached.
+        """
+        with self.lock:
+            if key not in self.shapes:
+                return None
+
+            # Mark the shape as recently used so that it is evicted last
+            self.shapes.move_to_end(key)
+            shape = self.shapes[key][0]
+
+        # Callers get their own copy so that the cached shape is never changed
+        return shape.copy()
+
+    def Put(self, key, shape, size):
+        """
+        Adds a shape to the cache, evicting the least recently used shapes to make room.
+        """
+
+        # A shape that would not fit on its own is not worth caching
+        if size > self.max_size:
+            return
+
+        with self.lock:
+            if key in self.shapes:
+                self.size -= self.shapes.pop(key)[1]
+
+            self.shapes[key] = (shape, size)
+            self.size += size
+
+            while self.size > self.max_size:
+                evicted_key, (evicted_shape, evicted_size) = self.shapes.popitem(last=False)
+                self.size -= evicted_size
+
+    def Remove(self, key):
+        """
+        Drops the shape for the key, if it is cached.
+        """
+        with self.lock:
+            if key in self.shapes:
+                self.size -= self.shapes.pop(key)[1]
+
+    def Clear(self):
+        """
+        Removes every shape from the cache.
+        """
+        with self.lock:
+            self.shapes.clear()
+            self.size = 0
+
+
+class QueryCache:
+    """
+    In-memory LRU cache of the search results each repository returned for
+    each query. Entries expire after a time-to-live so that new components
+    on the servers still show up, but expired results are kept along with
+    their validators so that the server can confirm they are still current
+    instead of sending them again.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries  # The number of (repository, query) results to keep
+        self.ttl = ttl  # The number of seconds the results of a query are trusted
+        self.entries = OrderedDict()  # Maps (repository, query) to (time stored, results, validators), least recently used first
+        self.lock = threading.Lock()
+
+    def Key(self, repository, query):
+        """
+        Returns the key of a query, so that queries differing only in case or
+        surrounding spaces share results.
+        """
+        return (repository, query.strip().lower())
+
+    def Get(self, repository, query):
+        """
+        Returns the cached results of the query, or None if there are none or they have expired.
+        """
+        key = self.Key(repository, query)
+
+        with self.lock:
+            if key not in self.entries:
+                return None
+
+            stored_at, results, validators = self.entries[key]
+            if time.monotonic() - stored_at > self.ttl:
+                return None
+
+            # Mark the results as recently used so that they are evicted last
+            self.entries.move_to_end(key)
+
+        return results
+
+    def GetStale(self, repository, query):
+        """
+        Returns the cached results of the query along with their validators,
+        even if they have expired, or None if there are none that can be
+        revalidated.
+        """
+        key = self.Key(repository, query)
+
+        with self.lock:
+            if key not in self.entries:
+                return None
+
+            stored_at, results, validators = self.entries[key]
+            if validators == None or len(validators) == 0:
+                return None
+
+        return results, validators
+
+    def Put(self, repository, query, results, validators=None):
+        """
+        Stores the results of a query, evicting the least recently used results to make room.
+        """
+        key = self.Key(repository, query)
+
+        with self.lock:
+            self.entries[key] = (time.monotonic(), results, validators)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def Clear(self):
+        """
+        Removes all of the cached results.
+        """
+        with self.lock:
+            self.entries.clear()
+
+
+def GetStepCache():
+    """
+    Returns the plugin-wide STEP cache, creating it from the settings the first time.
+    """
+    import FreeCAD
+    from PySide.QtCore import QSettings
+
+    global step_cache
+
+    if step_cache == None:
+        settings = QSettings("OCCI", "occi-freecad-plugin")
+        max_size_mb = float(settings.value('cache/max_size_mb', 1024))
+        cache_dir = os.path.join(FreeCAD.getUserAppDataDir(), "OCCI", "cache", "step")
+        step_cache = StepCache(cache_dir, int(max_size_mb * 1024 * 1024))
+
+    return step_cache
+
+
+def IsOffline():
+    """
+    Returns whether the user has asked for models to only be loaded from the cache.
+    """
+    from PySide.QtCore import QSettings
+
+    settings = QSettings("OCCI", "occi-freecad-plugin")
+
+    return settings.value('cache/offline', 'no') == 'yes'
+
+
+def GetShapeCache():
+    """
+    Returns the plugin-wide parsed shape cache, creating it from the settings the first time.
+    """
+    from PySide.QtCore import QSettings
+
+    global shape_cache
+
+    if shape_cache == None:
+        settings = QSettings("OCCI", "occi-freecad-plugin")
+        max_size_mb = float(settings.value('cache/shape_memory_mb', 256))
+        shape_cache = ShapeCache(int(max_size_mb * 1024 * 1024))
+
+    return shape_cache
+
+
+def ReadShape(step_file_path):
+    """
+    Loads a cached STEP file into a shape. Shapes that have already been parsed
+    are copied from memory, and a BREP copy is saved next to the STEP file
+    because OpenCascade loads BREP much faster than STEP. Large models that
+    arrive while another model is being parsed are imported in a worker
+    process so that they do not have to wait for it.
+    """
+    import Part
+    from PySide.QtCore import QSettings
+
+    # The STEP file is named after its cache key, so the shape can share it
+    key = os.path.splitext(os.path.basename(step_file_path))[0]
+
+    # Parsing can be skipped entirely if the shape is still in memory
+    shapes = GetShapeCache()
+    shape = shapes.Get(key)
+    if shape != None:
+        return shape
+
+    settings = QSettings("OCCI", "occi-freecad-plugin")
+    use_sidecar = settings.value('cache/brep_sidecar', 'yes') == 'yes'
+    brep_path = os.path.splitext(step_file_path)[0] + '.brep'
+
+    # While another model is being parsed here, a large one is imported in a worker process instead of waiting its turn
+    if use_sidecar and not os.path.isfile(brep_path) and parse_lock.locked():
+        meta = GetStepCache().ReadMeta(step_file_path)
+        if meta != None and (meta.get('entities') or 0) >= PROCESS_MIN_ENTITIES:
+            ConvertInWorkerProcess(step_file_path, brep_path)
+
+    shape = Part.Shape()
+    if use_sidecar and os.path.isfile(brep_path):
+        shape.read(brep_path)
+    else:
+        with parse_lock:
+            shape.read(step_file_path)
+
+        # Write the BREP copy under a temporary name so that a partial file is never read
+        if use_sidecar:
+            try:
+                shape.exportBrep(brep_path + '.part')
+                os.replace(brep_path + '.part', brep_path)
+            except Exception:
+                pass
+
+    shapes.Put(key, shape, os.path.getsize(step_file_path))
+
+    return shape.copy()
+
+
+def GetProcessSlots():
+    """
+    Returns the semaphore that limits how many worker processes can import
+    models at the same time, or None if worker processes are turned off.
+    """
+    from PySide.QtCore import QSettings
+
+    global process_slots
+
+    if process_slots == None:
+        settings = QSettings("OCCI", "occi-freecad-plugin")
+        processes = int(settings.value('import/worker_processes', max(1, (os.cpu_count() or 2) - 1)))
+        process_slots = threading.BoundedSemaphore(processes) if processes > 0 else False
+
+    return process_slots if process_slots != False else None
+
+
+def ConverterCommand():
+    """
+    Returns the path of the FreeCAD console executable that worker processes
+    are run with, or None if it cannot be found.
+    """
+    import FreeCAD
+
+    for name in ['FreeCADCmd', 'FreeCADCmd.exe', 'freecadcmd']:
+        path = os.path.join(FreeCAD.getHomePath(), 'bin', name)
+        if os.path.isfile(path):
+            return path
+
+    return None
+
+
+def ConvertInWorkerProcess(step_file_path, brep_path):
+    """
+    Imports a STEP file in a separate FreeCAD process that writes its BREP
+    sidecar, so that several models can be imported on different cores at the
+    same time. Returns whether the sidecar was written. Waiting on the process
+    does not hold up any other threads.
+    """
+    import subprocess
+
+    slots = GetProcessSlots()
+    command = ConverterCommand()
+    if slots == None or command == None:
+        return False
+
+    env = dict(os.environ)
+    env['OCCI_STEP_PATH'] = step_file_path
+    env['OCCI_BREP_PATH'] = brep_path
+    script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ConvertStep.py')
+
+    with slots:
+        try:
+            subprocess.run([command, script_path], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=PROCESS_TIMEOUT)
+        except (OSError, subprocess.SubprocessError):
+            return False
+
+    return os.path.isfile(brep_path)
+
+
+def GetQueryCache():
+    """
+    Returns the plugin-wide search results cache, creating it from the settings the first time.
+    """
+    from PySide.QtCore import QSettings
+
+    global query_cache
+
+    if query_cache == None:
+        settings = QSettings("OCCI", "occi-freecad-plugin")
+        query_cache = QueryCache(int(settings.value('search/cache_size', 200)), float(settings.value('search/cache_ttl', 300)))
+
+    return query_cache
+
+
+class JSONCache:
+    """
+    Persistent cache of small JSON documents, such as repository information,
+    kept along with the validators the server sent so that they can be
+    revalidated instead of transferred again.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir  # Where the cached documents are kept
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def PathForURL(self, url):
+        """
+        Returns the path that the document from the URL is stored at.
+        """
+        return os.path.join(self.cache_dir, hashlib.sha256(CanonicalURL(url).encode('utf-8')).hexdigest() + '.json')
+
+    def Get(self, url):
+        """
+        Returns the (validators, document) stored for the URL, or None if there is nothing stored.
+        """
+        try:
+            with open(self.PathForURL(url), 'r') as json_file:
+                entry = json.load(json_file)
+        except (OSError, ValueError):
+            return None
+
+        return entry['validators'], entry['document']
+
+    def Put(self, url, validators, document):
+        """
+        Stores a document along with its validators.
+        """
+        path = self.PathForURL(url)
+
+        try:
+            with open(path + '.part', 'w') as json_file:
+                json.dump({'validators': validators, 'document': document}, json_file)
+            os.replace(path + '.part', path)
+        except OSError:
+            pass
+
+    def Clear(self):
+        """
+        Removes every stored document.
+        """
+        for file_name in os.listdir(self.cache_dir):
+            try:
+                os.remove(os.path.join(self.cache_dir, file_name))
+            except OSError:
+                pass
+
+
+def GetJSONCache():
+    """
+    Returns the plugin-wide JSON document cache, creating it the first time.
+    """
+    import FreeCAD
+
+    global json_cache
+
+    if json_cache == None:
+        json_cache = JSONCache(os.path.join(FreeCAD.getUserAppDataDir(), "OCCI", "cache", "json"))
+
+    return json_cache
+
+
+def RevalidateAfter():
+    """
+    Returns the number of seconds a cached model is trusted before the server is asked whether it has changed.
+    """
+    from PySide.QtCore import QSettings
+
+    settings = QSettings("OCCI", "occi-freecad-plugin")
+
+    return float(settings.value('cache/revalidate_after_hours', 24)) * 3600.0
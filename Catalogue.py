@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# The plugin-wide catalogue, created on first use
+catalogue = None
+
+# The most components a search of a repository's catalogue returns
+SEARCH_LIMIT = 1000
+
+
+class Catalogue:
+    """
+    On-disk mirror of the component metadata of each repository, indexed for
+    full-text search so that searches can be answered locally without going
+    to the servers. SQLite FTS5 is used when it is available, falling back to
+    FTS4 and then to plain substring matching.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path  # Where the catalogue database is stored
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS repositories (models_url TEXT PRIMARY KEY, synced_at REAL, etag TEXT, last_modified TEXT)")
+
+        # Catalogues created before validators were stored need the columns added
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(repositories)")]
+        for column in ['etag', 'last_modified']:
+            if column not in columns:
+                self.connection.execute("ALTER TABLE repositories ADD COLUMN " + column + " TEXT")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS components (id INTEGER PRIMARY KEY, repository TEXT, namespace TEXT, version TEXT, digest TEXT, search_text TEXT, json TEXT, UNIQUE (repository, namespace, version))")
+
+        # Use the best full-text search engine that this SQLite build has
+        self.fts = None
+        for module in ['fts5', 'fts4']:
+            try:
+                self.connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS components_fts USING " + module + "(search_text)")
+                self.fts = module
+                break
+            except sqlite3.OperationalError:
+                continue
+
+        self.connection.commit()
+
+    def SearchText(self, json_result):
+        """
+        Returns all of the searchable text of a component in one string.
+        """
+        fields = [json_result.get('name'), json_result.get('author'), json_result.get('description'), json_result.get('namespace')]
+
+        # Parameter and preset names are searchable as well
+        fields.extend(json_result.get('params', {}).keys())
+        fields.extend(json_result.get('param_presets', {}).keys())
+
+        return " ".join(str(field) for field in fields if field != None)
+
+    def IsFresh(self, models_url, max_age):
+        """
+        Returns whether the repository has been synced within the last max_age seconds.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT synced_at FROM repositories WHERE models_url = ?", (models_url,)).fetchone()
+
+        return row != None and time.time() - row[0] < max_age
+
+    def Validators(self, models_url):
+        """
+        Returns the validators the server sent with the component list at the
+        last sync, or None if it sent none.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT etag, last_modified FROM repositories WHERE models_url = ?", (models_url,)).fetchone()
+
+        if row == None:
+            return None
+
+        validators = {}
+        if row[0] != None:
+            validators['etag'] = row[0]
+        if row[1] != None:
+            validators['last_modified'] = row[1]
+
+        return validators if len(validators) > 0 else None
+
+    def MarkSynced(self, models_url):
+        """
+        Records that the server has confirmed the catalogue of a repository is still current.
+        """
+        with self.lock:
+            self.connection.execute("UPDATE repositories SET synced_at = ? WHERE models_url = ?", (time.time(), models_url))
+            self.connection.commit()
+
+    def SyncRepository(self, models_url, json_results, validators=None):
+        """
+        Brings the catalogue of a repository up to date with the full list of
+        its components. Only the components that were added, changed or removed
+        are written. The validators the server sent with the list are kept so
+        that the next sync can be skipped if nothing has changed.
+        """
+        validators = validators or {}
+
+        with self.lock:
+            existing = {}
+            for row in self.connection.execute("SELECT id, namespace, version, digest FROM components WHERE repository = ?", (models_url,)):
+                existing[(row[1], row[2])] = (row[0], row[3])
+
+            seen = set()
+            for json_result in json_results:
+                if 'namespace' not in json_result:
+                    continue
+
+                key = (json_result['namespace'], json_result.get('version'))
+                seen.add(key)
+
+                # Components that have not changed since the last sync are left alone
+                json_text = json.dumps(json_result, sort_keys=True)
+                digest = hashlib.sha1(json_text.encode('utf-8')).hexdigest()
+                if key in existing and existing[key][1] == digest:
+                    continue
+
+                if key in existing:
+                    self.DeleteComponent(existing[key][0])
+
+                search_text = self.SearchText(json_result)
+                cursor = self.connection.execute("INSERT INTO components (repository, namespace, version, digest, search_text, json) VALUES (?, ?, ?, ?, ?, ?)",
+                                                 (models_url, key[0], key[1], digest, search_text, json_text))
+                if self.fts != None:
+                    self.connection.execute("INSERT INTO components_fts (rowid, search_text) VALUES (?, ?)", (cursor.lastrowid, search_text))
+
+            # Anything the repository no longer lists has been removed from it
+            for key in existing.keys():
+                if key not in seen:
+                    self.DeleteComponent(existing[key][0])
+
+            self.connection.execute("INSERT OR REPLACE INTO repositories (models_url, synced_at, etag, last_modified) VALUES (?, ?, ?, ?)",
+                                    (models_url, time.time(), validators.get('etag'), validators.get('last_modified')))
+            self.connection.commit()
+
+    def DeleteComponent(self, component_id):
+        """
+        Removes a single component from the catalogue. The caller must hold the lock.
+        """
+        self.connection.execute("DELETE FROM components WHERE id = ?", (component_id,))
+        if self.fts != None:
+            self.connection.execute("DELETE FROM components_fts WHERE rowid = ?", (component_id,))
+
+    def Search(self, models_url, query, limit=SEARCH_LIMIT):
+        """
+        Returns the catalogued components of a repository that match every word
+        of the query, in the same form the server's search would return them,
+        up to limit of them.
+        """
+        words = re.findall(r"\w+", query.lower())
+
+        with self.lock:
+            if len(words) == 0:
+                # An empty search lists everything, just like the servers do
+                rows = self.connection.execute("SELECT json FROM components WHERE repository = ? LIMIT ?", (models_url, limit)).fetchall()
+            elif self.fts != None:
+                # Every word has to match, and partially typed words match as prefixes
+                match = " ".join(word + '*' for word in words)
+                rows = self.connection.execute("SELECT components.json FROM components_fts JOIN components ON components.id = components_fts.rowid "
+                                               "WHERE components_fts MATCH ? AND components.repository = ? LIMIT ?", (match, models_url, limit)).fetchall()
+            else:
+                conditions = " AND ".join("LOWER(search_text) LIKE ?" for word in words)
+                rows = self.connection.execute("SELECT json FROM components WHERE repository = ? AND " + conditions + " LIMIT ?",
+                                               [models_url] + ['%' + word + '%' for word in words] + [limit]).fetchall()
+
+        return [json.loads(row[0]) for row in rows]
+
+    def RemoveRepository(self, models_url):
+        """
+        Removes everything catalogued for a repository.
+        """
+        with self.lock:
+            for row in self.connection.execute("SELECT id FROM components WHERE repository = ?", (models_url,)).fetchall():
+                self.DeleteComponent(row[0])
+
+            self.connection.execute("DELETE FROM repositories WHERE models_url = ?", (models_url,))
+            self.connection.commit()
+
+
+def GetCatalogue():
+    """
+    Returns the plugin-wide catalogue, opening it the first time.
+    """
+    import FreeCAD
+
+    global catalogue
+
+    if catalogue == None:
+        catalogue_dir = os.path.join(FreeCAD.getUserAppDataDir(), "OCCI", "cache")
+        os.makedirs(catalogue_dir, exist_ok=True)
+        catalogue = Catalogue(os.path.join(catalogue_dir, "catalogue.sqlite"))
+
+    return catalogue
+
+
+def IsCatalogueEnabled():
+    """
+    Returns whether the user wants searches to be answered from the local catalogue.
+    """
+    from PySide.QtCore import QSettings
+
+    settings = QSettings("OCCI", "occi-freecad-plugin")
+
+    return settings.value('catalogue/enabled', 'no') == 'yes'
+
+
+def CatalogueMaxAge():
+    """
+    Returns the number of seconds a repository's catalogue is trusted before it is synced again.
+    """
+    from PySide.QtCore import QSettings
+
+    settings = QSettings("OCCI", "occi-freecad-plugin")
+
+    return float(settings.value('catalogue/max_age_hours', 24)) * 3600.0
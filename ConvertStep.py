@@ -0,0 +1,18 @@
+# Converts a cached STEP file into its BREP sidecar in a separate FreeCAD
+# process, so that several models can be imported on different cores at the
+# same time. It is run by FreeCADCmd, with the paths passed in the
+# OCCI_STEP_PATH and OCCI_BREP_PATH environment variables.
+import os
+
+if __name__ == '__main__':
+    import Part
+
+    step_path = os.environ['OCCI_STEP_PATH']
+    brep_path = os.environ['OCCI_BREP_PATH']
+
+    shape = Part.Shape()
+    shape.read(step_path)
+
+    # Write the BREP copy under a temporary name so that a partial file is never read
+    shape.exportBrep(brep_path + '.part')
+    os.replace(brep_path + '.part', brep_path)
@@ -0,0 +1,169 @@
+import threading
+import time
+
+# The plugin-wide health monitor, created on first use
+health_monitor = None
+
+
+class RepositoryHealth:
+    """
+    What is known about how well a single repository is responding.
+    """
+
+    def __init__(self):
+        self.latency = None  # Smoothed time in seconds that the repository takes to answer, or None if it has not answered yet
+        self.failures = 0  # The number of requests in a row that have failed
+        self.open_until = 0.0  # Until when searches skip the repository, on the time.monotonic() clock
+        self.checked_at = None  # When the repository last answered or failed, on the time.monotonic() clock
+
+
+class HealthMonitor:
+    """
+    Keeps track of the availability and latency of each repository from the
+    probes and the searches that are sent to it. After a number of failures
+    in a row, the circuit breaker of a repository opens and searches skip it
+    for a while. Once that time is up, the next request decides whether it
+    stays open. Can be used from any thread.
+    """
+
+    # How much weight the newest latency measurement is given in the smoothed latency
+    smoothing = 0.3
+
+    # The states a repository can be in, from best to worst
+    UNKNOWN = 'unknown'
+    UP = 'up'
+    SLOW = 'slow'
+    DOWN = 'down'
+
+    def __init__(self, failure_threshold, open_seconds, slow_seconds):
+        self.failure_threshold = failure_threshold  # The failures in a row that open the circuit breaker
+        self.open_seconds = open_seconds  # How long searches skip a repository once its circuit breaker opens
+        self.slow_seconds = slow_seconds  # A repository slower than this is tried after the others
+        self.repositories = {}  # Maps each models URL to its RepositoryHealth
+        self.lock = threading.Lock()
+
+    def Health(self, models_url):
+        """
+        Returns the health of a repository, adding it if it is new. The caller must hold the lock.
+        """
+        if models_url not in self.repositories:
+            self.repositories[models_url] = RepositoryHealth()
+
+        return self.repositories[models_url]
+
+    def RecordSuccess(self, models_url, latency):
+        """
+        Records that the repository answered in latency seconds, which closes its circuit breaker.
+        """
+        with self.lock:
+            health = self.Health(models_url)
+
+            if health.latency == None:
+                health.latency = latency
+            else:
+                health.latency = self.smoothing * latency + (1.0 - self.smoothing) * health.latency
+
+            health.failures = 0
+            health.open_until = 0.0
+            health.checked_at = time.monotonic()
+
+    def RecordFailure(self, models_url):
+        """
+        Records that the repository could not be reached or had a server error.
+        """
+        with self.lock:
+            health = self.Health(models_url)
+            health.failures += 1
+            health.checked_at = time.monotonic()
+
+            # A repository that keeps failing is left alone for a while
+            if health.failures >= self.failure_threshold:
+                health.open_until = health.checked_at + self.open_seconds
+
+    def RecordResponse(self, models_url, status_code, latency):
+        """
+        Records a response from the repository. Server errors count as failures, anything else shows it is up.
+        """
+        if status_code >= 500:
+            self.RecordFailure(models_url)
+        else:
+            self.RecordSuccess(models_url, latency)
+
+    def Status(self, models_url):
+        """
+        Returns the state of a repository and its smoothed latency in seconds, which may be None.
+        """
+        with self.lock:
+            health = self.repositories.get(models_url)
+            if health == None:
+                return self.UNKNOWN, None
+
+            if health.failures >= self.failure_threshold:
+                return self.DOWN, health.latency
+            elif health.latency == None:
+                return self.UNKNOWN, None
+            elif health.latency > self.slow_seconds:
+                return self.SLOW, health.latency
+
+            return self.UP, health.latency
+
+    def IsAvailable(self, models_url):
+        """
+        Returns whether searches should be sent to the repository.
+        """
+        with self.lock:
+            health = self.repositories.get(models_url)
+
+            return health == None or time.monotonic() >= health.open_until
+
+    def Route(self, repo_urls):
+        """
+        Splits the repositories into the ones that should be searched, the
+        fastest first and the slow ones last, and the ones that are skipped
+        because their circuit breaker is open.
+        """
+        available = []
+        skipped = []
+        for models_url in repo_urls:
+            if self.IsAvailable(models_url):
+                available.append(models_url)
+            else:
+                skipped.append(models_url)
+
+        def priority(models_url):
+            status, latency = self.Status(models_url)
+
+            # Repositories that have not been measured yet keep their place after the ones that are known to be quick
+            return (1 if status in [self.SLOW, self.DOWN] else 0, latency if latency != None else float('inf'))
+
+        # The sort is stable, so repositories that are equally healthy stay in the user's order
+        available.sort(key=priority)
+
+        return available, skipped
+
+
+def GetHealthMonitor():
+    """
+    Returns the plugin-wide health monitor, creating it from the settings the first time.
+    """
+    from PySide.QtCore import QSettings
+
+    global health_monitor
+
+    if health_monitor == None:
+        settings = QSettings("OCCI", "occi-freecad-plugin")
+        health_monitor = HealthMonitor(int(settings.value('health/failure_threshold', 3)), float(settings.value('health/open_seconds', 120)),
+                                       float(settings.value('health/slow_ms', 1500)) / 1000.0)
+
+    return health_monitor
+
+
+def IsProbingEnabled():
+    """
+    Returns whether the repositories should be probed in the background.
+    """
+    from PySide.QtCore import QSettings
+
+    settings = QSettings("OCCI", "occi-freecad-plugin")
+
+    return settings.value('health/probe_enabled', 'yes') == 'yes'
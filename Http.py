@@ -0,0 +1,384 @@
+import base64
+import socket
+import threading
+import zlib
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ClosedPoolError
+from urllib3.poolmanager import PoolManager
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
+
+# zstd is optional, models are only requested with it if the module is available
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# The (connect, read) timeouts in seconds for any request that does not set its own
+DEFAULT_TIMEOUT = (5.0, 30.0)
+
+# The number of hosts to keep pools for, and the number of connections kept open to each host
+POOL_CONNECTIONS = 16
+POOL_MAXSIZE = 16
+
+# The first bytes of gzip and zstd data, used to recognise models that are stored compressed on the server
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# The plugin-wide session, created on first use
+session = None
+session_lock = threading.Lock()
+
+
+class OCCISession(requests.Session):
+    """
+    Session that applies a default timeout to every request that does not set one.
+    """
+
+    def request(self, method, url, **kwargs):
+        if 'timeout' not in kwargs:
+            kwargs['timeout'] = DEFAULT_TIMEOUT
+
+        return requests.Session.request(self, method, url, **kwargs)
+
+
+class TrackedPoolMixin:
+    """
+    Lets a CancellableAdapter know which connections of a pool are in use, so
+    that it can cut them off.
+    """
+
+    adapter = None  # The CancellableAdapter the pool belongs to
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+
+        # Once the requests are cancelled, retries and new requests fail without connecting
+        if not self.adapter.Track(conn):
+            conn.close()
+            raise ClosedPoolError(self, "The requests have been cancelled.")
+
+        return conn
+
+    def _put_conn(self, conn):
+        if conn != None:
+            self.adapter.Release(conn)
+
+        super()._put_conn(conn)
+
+    def _validate_conn(self, conn):
+        super()._validate_conn(conn)
+
+        # Connect now instead of when the request is sent, so that a request cancelled while it was connecting can be cut off
+        if getattr(conn, 'sock', None) == None:
+            conn.connect()
+
+        self.adapter.Connected(conn)
+
+
+class TrackedHTTPConnectionPool(TrackedPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class TrackedHTTPSConnectionPool(TrackedPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class TrackedPoolManager(PoolManager):
+    """
+    Pool manager that hands out pools whose connections its adapter can cut off.
+    """
+
+    def __init__(self, adapter, **kwargs):
+        PoolManager.__init__(self, **kwargs)
+
+        self.adapter = adapter
+        self.pool_classes_by_scheme = {'http': TrackedHTTPConnectionPool, 'https': TrackedHTTPSConnectionPool}
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        pool = PoolManager._new_pool(self, scheme, host, port, request_context)
+        pool.adapter = self.adapter
+
+        return pool
+
+
+class CancellableAdapter(HTTPAdapter):
+    """
+    Adapter whose requests can all be abandoned from another thread. Cancel
+    shuts down the sockets of the requests that are in flight, so that they
+    fail straight away instead of waiting for the server to answer, and any
+    request made after that fails without connecting.
+    """
+
+    def __init__(self, **kwargs):
+        self.connections = set()  # The connections that requests are using right now
+        self.opened = set()  # The connections in use that have finished connecting
+        self.cancelled = False
+        self.lock = threading.Lock()
+
+        HTTPAdapter.__init__(self, **kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+
+        self.poolmanager = TrackedPoolManager(self, num_pools=connections, maxsize=maxsize, block=block, strict=True, **pool_kwargs)
+
+    def Track(self, conn):
+        """
+        Records that a request is using the connection. Returns False if the requests have been cancelled.
+        """
+        with self.lock:
+            if self.cancelled:
+                return False
+
+            self.connections.add(conn)
+
+        return True
+
+    def Release(self, conn):
+        """
+        Records that a request has finished with the connection.
+        """
+        with self.lock:
+            self.connections.discard(conn)
+            self.opened.discard(conn)
+
+    def Prune(self):
+        """
+        Forgets the connections that have been closed. A request that fails
+        closes its connection without handing it back, so this is the only way
+        to tell that it is done with it. The caller must hold the lock.
+        """
+        for conn in [conn for conn in self.opened if getattr(conn, 'sock', None) == None]:
+            self.connections.discard(conn)
+            self.opened.discard(conn)
+
+    def Connected(self, conn):
+        """
+        Called once a connection is open, to cut it off if the requests were cancelled while it was connecting.
+        """
+        with self.lock:
+            self.opened.add(conn)
+
+            if self.cancelled:
+                self.Shutdown(conn)
+
+    def Shutdown(self, conn):
+        """
+        Shuts down the socket of a connection, which wakes up a request that is waiting on it.
+        """
+        sock = getattr(conn, 'sock', None)
+        if sock == None:
+            return
+
+        # The plain socket is shut down underneath any TLS layer, which would not be safe to touch from this thread
+        try:
+            socket.socket.shutdown(sock, socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def Cancel(self):
+        """
+        Makes every request that is in flight fail, and every later one fail without connecting.
+        """
+        with self.lock:
+            self.cancelled = True
+
+            self.Prune()
+            for conn in self.connections:
+                self.Shutdown(conn)
+
+    def InFlight(self):
+        """
+        Returns the number of connections that requests are still using.
+        """
+        with self.lock:
+            self.Prune()
+
+            return len(self.connections)
+
+
+def NewSession(adapter_class=HTTPAdapter):
+    """
+    Returns a new session set up with the plugin's retries, connection pools
+    and headers. adapter_class is the requests adapter that is mounted for
+    both http and https.
+    """
+    new_session = OCCISession()
+
+    # Only retry requests that are safe to repeat, and only for errors that are likely to be temporary
+    retries = Retry(total=3, connect=3, read=2, backoff_factor=0.3,
+                    status_forcelist=[502, 503, 504], allowed_methods=['GET', 'HEAD'],
+                    raise_on_status=False, respect_retry_after_header=True)
+
+    # Each host gets a pool big enough for searches and downloads to run in parallel
+    adapter = adapter_class(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=retries)
+    new_session.mount('http://', adapter)
+    new_session.mount('https://', adapter)
+
+    new_session.headers['User-Agent'] = 'occi-freecad-plugin'
+    new_session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+
+    return new_session
+
+
+def GetSession():
+    """
+    Returns the HTTP session shared by all of the plugin's network traffic, so
+    that connections to each OCCI server are kept alive and reused instead of
+    being set up again for every request.
+    """
+    global session
+
+    with session_lock:
+        if session == None:
+            session = NewSession()
+
+    return session
+
+
+def ResponseValidators(response):
+    """
+    Returns the validators a server sent with a response, which can be used to
+    ask later whether the resource has changed. The dict is empty if the
+    server sent none.
+    """
+    validators = {}
+
+    if 'ETag' in response.headers:
+        validators['etag'] = response.headers['ETag']
+    if 'Last-Modified' in response.headers:
+        validators['last_modified'] = response.headers['Last-Modified']
+
+    return validators
+
+
+def ConditionalHeaders(validators):
+    """
+    Returns the headers that ask the server to answer 304 Not Modified if the
+    resource still matches the validators, instead of sending it again.
+    """
+    headers = {}
+
+    if validators == None:
+        return headers
+
+    if 'etag' in validators:
+        headers['If-None-Match'] = validators['etag']
+    if 'last_modified' in validators:
+        headers['If-Modified-Since'] = validators['last_modified']
+
+    return headers
+
+
+def GetJSON(url, **kwargs):
+    """
+    Fetches a JSON document, revalidating the copy kept from the last time it
+    was fetched instead of transferring it again if the server supports it.
+    Returns the status code along with the parsed document, which is None
+    unless the status code is 200. Raises ValueError if the document is not
+    valid JSON.
+    """
+    from Cache import GetJSONCache
+
+    json_cache = GetJSONCache()
+    cached = json_cache.Get(url)
+
+    headers = ConditionalHeaders(cached[0] if cached != None else None)
+    response = GetSession().get(url, headers=headers, **kwargs)
+
+    # The copy we already have is still current
+    if response.status_code == 304 and cached != None:
+        return 200, cached[1]
+
+    if response.status_code != 200:
+        return response.status_code, None
+
+    document = response.json()
+
+    # Only documents that can be revalidated are worth keeping
+    validators = ResponseValidators(response)
+    if len(validators) > 0:
+        json_cache.Put(url, validators, document)
+
+    return 200, document
+
+
+def ModelAcceptEncoding():
+    """
+    Returns the Accept-Encoding header for model downloads. zstd is only
+    offered for models because they are decompressed by Decompressor, which
+    requests does not do for zstd by itself.
+    """
+    if zstandard != None:
+        return ACCEPT_ENCODING + ',zstd'
+
+    return ACCEPT_ENCODING
+
+
+def Decompressor(first_bytes):
+    """
+    Returns a decompressor for a model download based on its first bytes, or
+    None if the model is not compressed. gzip and deflate transfer encodings
+    are already undone by requests, so this catches models that are stored
+    compressed on the server (such as .step.gz files) and zstd transfers.
+    """
+    if first_bytes.startswith(GZIP_MAGIC):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif first_bytes.startswith(ZSTD_MAGIC) and zstandard != None:
+        return zstandard.ZstdDecompressor().decompressobj()
+
+    return None
+
+
+def RangeValidator(validators):
+    """
+    Returns the validator to send in an If-Range header, or None if there is
+    none. Weak ETags cannot be used to resume a download, so the date is used
+    instead if that is all there is.
+    """
+    if validators == None:
+        return None
+
+    if 'etag' in validators and not validators['etag'].startswith('W/'):
+        return validators['etag']
+
+    return validators.get('last_modified')
+
+
+def ResponseDigests(response):
+    """
+    Returns the checksums a server sent for the whole of a model as a list of
+    (hashlib algorithm name, digest bytes). Repr-Digest and Digest headers are
+    understood, along with Content-MD5 on complete responses.
+    """
+    algorithms = {'sha-256': 'sha256', 'sha-512': 'sha512', 'sha': 'sha1', 'md5': 'md5'}
+    digests = []
+
+    for header in ['Repr-Digest', 'Digest']:
+        for entry in response.headers.get(header, '').split(','):
+            if '=' not in entry:
+                continue
+
+            name, value = entry.split('=', 1)
+            name = name.strip().lower()
+            if name not in algorithms:
+                continue
+
+            try:
+                digests.append((algorithms[name], base64.b64decode(value.strip().strip(':'))))
+            except ValueError:
+                continue
+
+    # Content-MD5 only covers the bytes in this response, which is the whole model only if it is not a range
+    if response.status_code == 200 and 'Content-MD5' in response.headers:
+        try:
+            digests.append(('md5', base64.b64decode(response.headers['Content-MD5'].strip())))
+        except ValueError:
+            pass
+
+    return digests
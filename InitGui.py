@@ -9,25 +9,57 @@ class OCCIWorkbench ( Workbench ):
     Icon = FreeCAD.getUserAppDataDir() + "Mod/occi-freecad-plugin/Resources/icons/OCCIWorkbench.svg"
     MenuText = "OCCI"
     ToolTip = "OCCI workbench"
-    json_search_results = None  # Holds the results when a user searches for an OCCI component
+    search_results = None  # Holds the results from all repositories when a user searches for an OCCI component
     presets_layout = None  # Holds all of the preset buttons, but needs to be reset when a new component is selected
     presets_controls = []  # Keeps the preset button objects separate from each other
     presets = {}  # All of the presets that have been dynamically loaded
-    use_checks = []  # Holds the check boxes for whether or not to include each repository in searches
-    remove_buttons = []  # Holds the buttons to remove each of the repository entries
+    param_rows = {}  # Maps each parameter key and name of the loaded component to (row, value widget, parameter info)
+    use_checks = {}  # Maps each repository ID to its check box for whether or not to include it in searches
+    remove_buttons = {}  # Maps each repository ID to the button that removes it
+    search_workers = []  # Keeps running search workers alive until they finish
+    search_generation = 0  # Incremented for every search so that stale results can be ignored
+    downloads = {}  # Maps each download worker in flight to its progress
+    job_manager = None  # Tracks all of the long-running model generation jobs
+    job_contexts = {}  # Maps the model URL of each long-running job to the requests waiting on it
+    job_progress = {}  # Maps the model URL of each long-running job to its progress
+    update_sequence = 0  # Incremented for every update so that updates can be put in order
+    latest_updates = {}  # Maps each (document, label) to the sequence number of its latest update
+    pending_documents = {}  # Maps each document name to the {feature name: (shape, identity)} changes waiting to be applied
+    prefetchers = []  # Keeps running prefetchers alive until they finish
+    catalogue_workers = []  # Keeps running catalogue sync workers alive until they finish
+    catalogue_syncing = set()  # The models URLs of the repositories whose catalogues are being synced
+    catalogue_sync_tried = set()  # The models URLs of the repositories whose catalogues searches have synced this session
+    prober = None  # Checks how each repository is responding in the background
+    probing_requested = False  # Set once the repositories have been used since the workbench was activated
+    stopped_probers = []  # Keeps probers that have been stopped alive until their threads finish
+    status_labels = {}  # Maps each repository ID to the label showing how it is responding
+    repos_tbl = None  # The table of repositories, which is only built once its section is first expanded
+    params_tbl = None  # The table of parameters, which is only built once its section is first needed
+
+    # The toggle and basic button styles
+    toggle_button_css = "border:none;background-color:#D8D8D8;font-size:18px;"
+    general_button_css = "background-color:#555555;color:white;font-size:12px;border:none;padding:8px;border-radius:4px;"
+    search_field_css = "font-size:12px;border:none;background-color:#EEEEEE;padding-top:5px;padding-bottom:5px;"
 
 
     def Initialize(self):
+        from importlib.util import find_spec
         from PySide.QtCore import QSettings
+        from Repositories import DEFAULT_REPOSITORIES
 
         # Make sure the requests module is present
         extra_libs_path = os.path.join(FreeCAD.getUserAppDataDir(), *["Mod", "occi-freecad-plugin", "ext_lib"])
+
+        # The precompiled archive built by tools/BuildExtLib.py is quicker to import from, but only works with the Python that built it
+        extra_libs_archive = extra_libs_path + "-" + sys.implementation.cache_tag + ".zip"
+        if os.path.exists(extra_libs_archive):
+            sys.path.append(extra_libs_archive)
+
+        # The loose libraries are still needed for anything that is not in the archive
         sys.path.append(extra_libs_path)
 
-        # Ensure that the requests module is available
-        try:
-            import requests
-        except:
+        # Ensure that the requests module is available, without importing it until the first request is made
+        if find_spec("requests") == None:
             from PySide import QtGui
             msg_box = QtGui.QMessageBox()
             msg_box.setText("The requests Python module is not installed.")
@@ -37,7 +69,7 @@ class OCCIWorkbench ( Workbench ):
 
         # load the module
         import OCCIGui
-        self.appendMenu('OCCI',['OCCI_Reset_Repos'])
+        self.appendMenu('OCCI',['OCCI_Reset_Repos', 'OCCI_Batch_Insert', 'OCCI_Update_All', 'OCCI_Model_Cache'])
 
         # Check to see if this is the first time the plugin has run
         settings = QSettings("OCCI", "occi-freecad-plugin")
@@ -56,7 +88,38 @@ class OCCIWorkbench ( Workbench ):
             settings.setValue('ui/comps_expanded', 'yes')
             settings.setValue('ui/params_expanded', 'no')
             settings.setValue('ui/auto_update', 'no')
-            settings.setValue('data/repo_list', {'list': [{'use': True, 'library': 'OCCI test', 'maintainer': 'Mark van der Net', 'models_url': 'https://occi.archiyou.nl'}]})
+            settings.setValue('ui/auto_update_delay_ms', 400)
+            settings.setValue('ui/recompute_delay_ms', 100)
+            settings.setValue('ui/instancing', 'no')
+            settings.setValue('prefetch/enabled', 'no')
+            settings.setValue('catalogue/enabled', 'no')
+            settings.setValue('catalogue/max_age_hours', 24)
+            settings.setValue('prefetch/neighbours', 'no')
+            settings.setValue('prefetch/max_concurrent', 2)
+            settings.setValue('prefetch/max_mb', 50)
+            settings.setValue('prefetch/max_kb_per_second', 512)
+            settings.setValue('search/deadline', 10.0)
+            settings.setValue('search/as_you_type', 'no')
+            settings.setValue('search/as_you_type_delay_ms', 300)
+            settings.setValue('search/cache_size', 200)
+            settings.setValue('search/cache_ttl', 300)
+            settings.setValue('jobs/deadline', 600.0)
+            settings.setValue('cache/offline', 'no')
+            settings.setValue('cache/max_size_mb', 1024)
+            settings.setValue('cache/shape_memory_mb', 256)
+            settings.setValue('cache/brep_sidecar', 'yes')
+            settings.setValue('cache/revalidate_after_hours', 24)
+            settings.setValue('download/segments', 1)
+            settings.setValue('download/segment_min_mb', 32)
+            settings.setValue('import/worker_processes', max(1, (os.cpu_count() or 2) - 1))
+            settings.setValue('batch/max_concurrent', 4)
+            settings.setValue('health/probe_enabled', 'yes')
+            settings.setValue('health/probe_interval_s', 60)
+            settings.setValue('health/probe_timeout', 5.0)
+            settings.setValue('health/failure_threshold', 3)
+            settings.setValue('health/open_seconds', 120)
+            settings.setValue('health/slow_ms', 1500)
+            settings.setValue('data/repo_list', {'list': DEFAULT_REPOSITORIES})
 
             # Write all the settings to disk
             settings.sync()
@@ -85,12 +148,24 @@ class OCCIWorkbench ( Workbench ):
         # Populate the OCCI dock with all of the required controls
         self.PopulateOCCIDock(occi_dock)
 
+        # The repositories are only probed once they are used, so that activating the workbench stays off the network
+        self.probing_requested = False
+
+        # Out of date local catalogues are brought up to date by the first search that needs them, not here
+
 
     def Deactivated(self):
         """
         Called when another module other than OCCI is selected in the workbench drop-down list.
         """
         from PySide import QtGui, QtCore
+        from Repositories import GetRegistry
+
+        # Repository changes that are still waiting to be saved are written now
+        GetRegistry().Flush()
+
+        # There is no table to show the repository health in anymore
+        self.StopProber()
 
         # A handle to the main window will allow us to configure the GUI
         main_win = FreeCADGui.getMainWindow()
@@ -108,22 +183,21 @@ class OCCIWorkbench ( Workbench ):
         Does the heavy lifting of populating the OCCI right side dock
         with controls.
         """
-        from functools import partial
         from PySide import QtGui, QtCore
-        from PySide.QtCore import QSettings
-
-        # The toggle and basic button styles
-        toggle_button_css = "border:none;background-color:#D8D8D8;font-size:18px;"
-        general_button_css = "background-color:#555555;color:white;font-size:12px;border:none;padding:8px;border-radius:4px;"
-        search_field_css = "font-size:12px;border:none;background-color:#EEEEEE;padding-top:5px;padding-bottom:5px;"
+        from Results import ResultStore, ResultsTableModel
 
         # Make sure this method has access to the settings
         settings = QtCore.QSettings("OCCI", "occi-freecad-plugin")
 
+        # The repositories and configuration sections are built when they are first expanded
+        self.repos_tbl = None
+        self.status_labels = {}
+        self.params_tbl = None
+
         # Build a collapsible GUI widget
-        tree_widget = QtGui.QTreeWidget()
-        tree_widget.header().hide()
-        tree_widget.setRootIsDecorated(False)
+        self.tree_widget = QtGui.QTreeWidget()
+        self.tree_widget.header().hide()
+        self.tree_widget.setRootIsDecorated(False)
 
         # Assemble the contents of the Repositories expandable widget
         main_vbox = QtGui.QVBoxLayout()
@@ -155,7 +229,245 @@ class OCCIWorkbench ( Workbench ):
         self.progress_bar.setAlignment(QtCore.Qt.AlignCenter)
         self.progress_bar.setMinimum(0)
         self.progress_bar.setMaximum(100)
-        main_vbox.addWidget(self.progress_bar)
+        progress_layout = QtGui.QHBoxLayout()
+        progress_layout.addWidget(self.progress_bar)
+
+        # Allows the user to stop any downloads that are in flight
+        self.cancel_btn = QtGui.QPushButton(text="Cancel")
+        self.cancel_btn.setStyleSheet(self.general_button_css)
+        self.cancel_btn.clicked.connect(self.CancelDownloads)
+        self.cancel_btn.setVisible(len(self.downloads) > 0 or len(self.job_contexts) > 0)
+        progress_layout.addWidget(self.cancel_btn)
+        main_vbox.addLayout(progress_layout)
+
+        #####################################################################
+        # Add component collapsible widget start                            #
+        #####################################################################
+
+        # Set up the add component controls widget
+        comps_controls_widget = QtGui.QWidget()
+        comps_controls_layout = QtGui.QVBoxLayout()
+        comps_controls_widget.setLayout(comps_controls_layout)
+
+        # Controls to search for a component
+        search_layout = QtGui.QHBoxLayout()
+        self.search_txt = QtGui.QLineEdit()
+        self.search_txt.setPlaceholderText("Component search text")
+        self.search_txt.setStyleSheet(self.search_field_css)
+        self.search_txt.returnPressed.connect(self.DoSearch)
+        search_layout.addWidget(self.search_txt)
+        search_btn = QtGui.QPushButton(text="Search")
+        search_btn.setStyleSheet(self.general_button_css)
+        search_btn.clicked.connect(self.SearchComponents)
+        search_layout.addWidget(search_btn)
+        comps_controls_layout.addLayout(search_layout)
+
+        # Allows searches to run while the user types, once they pause for a moment
+        self.search_as_you_type_chk = QtGui.QCheckBox(text="search as you type")
+        self.search_as_you_type_chk.setStyleSheet("font-size:12px;")
+        self.search_as_you_type_chk.setChecked(settings.value('search/as_you_type', 'no') == 'yes')
+        self.search_as_you_type_chk.stateChanged.connect(self.SearchAsYouTypeCheckBoxChanged)
+        comps_controls_layout.addWidget(self.search_as_you_type_chk)
+        self.search_timer = QtCore.QTimer()
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(int(settings.value('search/as_you_type_delay_ms', 300)))
+        self.search_timer.timeout.connect(self.SearchComponents)
+        self.search_txt.textChanged.connect(self.SearchTextChanged)
+
+        # Label that tells the user how many results were returned
+        self.results_num_lbl = QtGui.QLabel(text="")
+        self.results_num_lbl.setAlignment(QtCore.Qt.AlignCenter)
+        self.results_num_lbl.setStyleSheet("font-size:12px;")
+        comps_controls_layout.addWidget(self.results_num_lbl)
+
+        # The table that holds the searched-for components, backed by a model so only visible rows are rendered
+        self.search_results = ResultStore()
+        self.results_model = ResultsTableModel(self.search_results)
+        self.results_tbl = QtGui.QTableView()
+        self.results_tbl.setModel(self.results_model)
+        self.results_tbl.setStyleSheet("font-size:12px;")
+        self.results_tbl.setMinimumHeight(50)
+        self.results_tbl.setMaximumHeight(50)
+        self.results_tbl.setSelectionBehavior(QtGui.QAbstractItemView.SelectRows)
+        self.results_tbl.setSelectionMode(QtGui.QAbstractItemView.SingleSelection)
+        self.results_tbl.clicked.connect(self.LoadParameters)
+        header = self.results_tbl.horizontalHeader()
+        header.setSectionResizeMode(0, QtGui.QHeaderView.ResizeMode.ResizeToContents)
+        header.setSectionResizeMode(1, QtGui.QHeaderView.ResizeMode.ResizeToContents)
+        header.setSectionResizeMode(2, QtGui.QHeaderView.ResizeMode.Stretch)
+
+        # All the rows are one line of text, so they can share a fixed height instead of each being measured
+        self.results_tbl.verticalHeader().setSectionResizeMode(QtGui.QHeaderView.ResizeMode.Fixed)
+        comps_controls_layout.addWidget(self.results_tbl)
+
+        # Button to add and configure the component
+        component_btn_layout = QtGui.QHBoxLayout()
+        component_btn = QtGui.QPushButton(text="Add Component")
+        component_btn.setStyleSheet(self.general_button_css)
+        component_btn.clicked.connect(self.LoadComponent)
+        self.instancing_chk = QtGui.QCheckBox(text="link identical components")
+        self.instancing_chk.setStyleSheet("font-size:12px;")
+        self.instancing_chk.setToolTip("Components that are already in the document with the same parameters are added as links to the existing one")
+        self.instancing_chk.setChecked(settings.value('ui/instancing', 'no') == 'yes')
+        self.instancing_chk.stateChanged.connect(self.InstancingCheckBoxChanged)
+        component_btn_layout.addWidget(self.instancing_chk)
+        component_btn_layout.addStretch()
+        component_btn_layout.addWidget(component_btn)
+        comps_controls_layout.addLayout(component_btn_layout)
+
+        #####################################################################
+        # Add component collapsible widget end                              #
+        #####################################################################
+
+        # Bursts of parameter changes are coalesced into a single auto update once they settle down
+        self.update_timer = QtCore.QTimer()
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(int(settings.value('ui/auto_update_delay_ms', 400)))
+        self.update_timer.timeout.connect(self.UpdateComponent)
+
+        # Components that finish at about the same time are applied together with a single recompute
+        self.recompute_timer = QtCore.QTimer()
+        self.recompute_timer.setSingleShot(True)
+        self.recompute_timer.setInterval(int(settings.value('ui/recompute_delay_ms', 100)))
+        self.recompute_timer.timeout.connect(self.ApplyPendingChanges)
+
+        ##################################################################
+        # Custom repositories collapsible area button
+        self.repos_toggle_widget = QtGui.QWidget()
+        self.repos_toggle_widget.setStyleSheet(self.toggle_button_css)
+        self.repos_toggle_widget.setMaximumHeight(40)
+        self.repos_toggle_layout = QtGui.QGridLayout()
+        self.repos_toggle_button = QtGui.QToolButton(text="Repositories")
+        self.repos_toggle_button.setStyleSheet(self.toggle_button_css)
+        self.repos_toggle_button.clicked.connect(self.ToggleRepoWidgets)
+        self.repos_toggle_layout.addWidget(self.repos_toggle_button, 0, 0, 1, 11, QtCore.Qt.AlignCenter)
+        self.toggle_repos_arrow = QtGui.QToolButton(text="")
+        self.toggle_repos_arrow.setStyleSheet(self.toggle_button_css)
+        self.toggle_repos_arrow.setArrowType(QtGui.Qt.UpArrow)
+        self.toggle_repos_arrow.clicked.connect(self.ToggleRepoWidgets)
+        self.repos_toggle_layout.addWidget(self.toggle_repos_arrow, 0, 12, 1, 1)
+        self.repos_toggle_widget.setLayout(self.repos_toggle_layout)
+
+        # Set up the repos widget tree item
+        self.repo_widget_item = QtGui.QTreeWidgetItem(["Repositories"])
+        self.repo_controls_item = QtGui.QTreeWidgetItem(["item1"])
+        self.repo_widget_item.addChild(self.repo_controls_item)
+
+        # Custom components collapsible area button
+        self.comps_toggle_widget = QtGui.QWidget()
+        self.comps_toggle_widget.setStyleSheet(self.toggle_button_css)
+        self.comps_toggle_widget.setMaximumHeight(40)
+        self.comps_toggle_layout = QtGui.QGridLayout()
+        self.comps_toggle_button = QtGui.QToolButton(text="Add Parametric Component")
+        self.comps_toggle_button.setStyleSheet(self.toggle_button_css)
+        self.comps_toggle_button.clicked.connect(self.ToggleCompsWidgets)
+        self.comps_toggle_layout.addWidget(self.comps_toggle_button, 0, 0, 1, 11, QtCore.Qt.AlignCenter)
+        self.toggle_comps_arrow = QtGui.QToolButton(text="")
+        self.toggle_comps_arrow.setStyleSheet(self.toggle_button_css)
+        self.toggle_comps_arrow.setArrowType(QtGui.Qt.UpArrow)
+        self.toggle_comps_arrow.clicked.connect(self.ToggleCompsWidgets)
+        self.comps_toggle_layout.addWidget(self.toggle_comps_arrow, 0, 12, 1, 1)
+        self.comps_toggle_widget.setLayout(self.comps_toggle_layout)
+
+        # Set up the components widget tree item
+        self.comps_widget_item = QtGui.QTreeWidgetItem(["Components"])
+        comps_controls_item = QtGui.QTreeWidgetItem(["item2"])
+        self.comps_widget_item.addChild(comps_controls_item)
+        self.comps_widget_item.setExpanded(True)
+
+        # Custom configuration button
+        self.conf_toggle_widget = QtGui.QWidget()
+        self.conf_toggle_widget.setStyleSheet(self.toggle_button_css)
+        self.conf_toggle_widget.setMaximumHeight(40)
+        self.conf_toggle_layout = QtGui.QGridLayout()
+        self.conf_toggle_button = QtGui.QPushButton(text="Configure Selected Component")
+        self.conf_toggle_button.setStyleSheet(self.toggle_button_css)
+        self.conf_toggle_button.clicked.connect(self.ToggleParamsWidgets)
+        self.conf_toggle_layout.addWidget(self.conf_toggle_button, 0, 0, 1, 11, QtCore.Qt.AlignCenter)
+        self.toggle_conf_arrow = QtGui.QToolButton(text="")
+        self.toggle_conf_arrow.setStyleSheet(self.toggle_button_css)
+        self.toggle_conf_arrow.setArrowType(QtGui.Qt.UpArrow)
+        self.toggle_conf_arrow.clicked.connect(self.ToggleParamsWidgets)
+        self.conf_toggle_layout.addWidget(self.toggle_conf_arrow, 0, 12, 1, 1)
+        self.conf_toggle_widget.setLayout(self.conf_toggle_layout)
+
+        # Set up the configuration widget tree item
+        self.conf_widget_item = QtGui.QTreeWidgetItem(["Configuration"])
+        self.config_controls_item = QtGui.QTreeWidgetItem(["item3"])
+        self.conf_widget_item.addChild(self.config_controls_item)
+        self.conf_widget_item.setExpanded(True)
+
+        # Set up the tree widgets
+        self.tree_widget.addTopLevelItems([self.repo_widget_item, self.comps_widget_item, self.conf_widget_item])
+        self.tree_widget.setItemWidget(self.repo_widget_item, 0, self.repos_toggle_widget)
+        self.tree_widget.setItemWidget(self.comps_widget_item, 0, self.comps_toggle_widget)
+        self.tree_widget.setItemWidget(self.conf_widget_item, 0, self.conf_toggle_widget)
+        self.tree_widget.setItemWidget(comps_controls_item, 0, comps_controls_widget)
+
+        # Only the sections that start out expanded are built now
+        if settings.value('ui/repos_expanded') == 'yes':
+            self.EnsureReposSection()
+        if settings.value('ui/params_expanded') == 'yes':
+            self.EnsureConfigSection()
+
+        # Expand the top level tree widgets as appropriate
+        self.repo_widget_item.setExpanded(settings.value('ui/repos_expanded') == 'yes')
+        self.comps_widget_item.setExpanded(settings.value('ui/comps_expanded') == 'yes')
+        self.conf_widget_item.setExpanded(settings.value('ui/params_expanded') == 'yes')
+
+        # Make sure all the toggle icons start out in the right state
+        self.UpdateTreeToggleIcons()
+
+        # Add our collapsible tree GUI arrangement to the dock
+        main_vbox.addWidget(self.tree_widget)
+
+        # We can only add widgets to a dock, so we need a top-level widget
+        container = QtGui.QWidget()
+        container.setStyleSheet("background-color:white;")
+
+        # Set the layout for the dock with all the UI controls added to it
+        main_vbox.setMargin(0)
+        container.setLayout(main_vbox)
+        scroll_area = QtGui.QScrollArea()
+        self.tree_widget.setSizePolicy(QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Expanding)
+        container.setSizePolicy(QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Expanding)
+        scroll_area.setSizePolicy(QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Expanding)
+        scroll_area.setWidgetResizable(True)
+        scroll_area.setWidget(container)
+        occi_dock.setMinimumWidth(350)
+        occi_dock.setWidget(scroll_area)
+
+
+    def EnsureReposSection(self):
+        """
+        Builds the repositories section of the dock the first time it is needed.
+        """
+        if self.repos_tbl == None:
+            self.tree_widget.setItemWidget(self.repo_controls_item, 0, self.BuildReposSection())
+
+
+    def EnsureConfigSection(self):
+        """
+        Builds the configuration section of the dock the first time it is needed.
+        """
+        if self.params_tbl == None:
+            self.tree_widget.setItemWidget(self.config_controls_item, 0, self.BuildConfigSection())
+
+
+    def BuildReposSection(self):
+        """
+        Builds the controls of the repositories section and returns the widget holding them.
+        """
+        from PySide import QtGui, QtCore
+        from Repositories import GetRegistry
+
+        # Make sure this method has access to the settings
+        settings = QtCore.QSettings("OCCI", "occi-freecad-plugin")
+
+        # The controls for each repository are collected again for the new table
+        self.use_checks = {}
+        self.status_labels = {}
+        self.remove_buttons = {}
 
         #####################################################################
         # Repos collapsible widget start                                    #
@@ -181,30 +493,26 @@ class OCCIWorkbench ( Workbench ):
         repos_controls_layout.addWidget(repos_2_lbl)
 
         # The table holding the list of repositories
-        self.repos_tbl = QtGui.QTableWidget(1, 4)
+        self.repos_tbl = QtGui.QTableWidget(1, 5)
         self.repos_tbl.setStyleSheet("font-size:12px;")
         self.repos_tbl.setMinimumHeight(50)
         self.repos_tbl.setMaximumHeight(50)
         self.repos_tbl.setSizePolicy(QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Expanding)
-        self.repos_tbl.setHorizontalHeaderLabels(['use', 'name', 'curated by', 'remove'])
+        self.repos_tbl.setHorizontalHeaderLabels(['use', 'name', 'curated by', 'status', 'remove'])
         self.repos_tbl.verticalHeader().setVisible(False)
         header = self.repos_tbl.horizontalHeader()
         header.setSectionResizeMode(0, QtGui.QHeaderView.ResizeMode.ResizeToContents)
         header.setSectionResizeMode(1, QtGui.QHeaderView.ResizeMode.Stretch)
         header.setSectionResizeMode(2, QtGui.QHeaderView.ResizeMode.Stretch)
         header.setSectionResizeMode(3, QtGui.QHeaderView.ResizeMode.ResizeToContents)
+        header.setSectionResizeMode(4, QtGui.QHeaderView.ResizeMode.ResizeToContents)
 
         # Header row height to try to resize the table correctly
         header_row_height = self.repos_tbl.rowHeight(0)
 
-        # Load the default repositories into the table
-        row = 0
-        # self.default_settings = self.LoadDefaults()
-        repos = settings.value('data/repo_list')
-        for repo in repos['list']:
-            # Add rows, if needed
-            if row > 0:
-                self.repos_tbl.insertRow(row)
+        # Load the registered repositories into the table
+        for repository in GetRegistry().All():
+            self.AddRepositoryRow(repository)
 
             # Resize the table up to a maximum of 2 rows
             if self.repos_tbl.rowCount() == 1:
@@ -215,41 +523,12 @@ class OCCIWorkbench ( Workbench ):
                 self.repos_tbl.setMinimumHeight(header_row_height + 2 * max_results_row_height)
                 self.repos_tbl.setMaximumHeight(header_row_height + 2 * max_results_row_height)
 
-            # Set the 'use' checkbox for the repo
-            self.use_checks.append(QtGui.QCheckBox(objectName=repo['library'] + "~" + repo['maintainer']))
-            self.use_checks[-1].setChecked(repo['use'])
-            self.use_checks[-1].stateChanged.connect(partial(self.UseCheckboxChanged, self.use_checks[-1]))
-            self.repos_tbl.setCellWidget(row, 0, self.use_checks[-1])
-
-            # Set the name text label for the repo
-            cur_name_txt = QtGui.QLabel()
-            cur_name_txt.setAlignment(QtCore.Qt.AlignCenter)
-            cur_name_txt.setTextFormat(QtCore.Qt.RichText)
-            cur_name_txt.setTextInteractionFlags(QtCore.Qt.TextBrowserInteraction)
-            cur_name_txt.setOpenExternalLinks(True)
-            cur_name_txt.setText('<a href="' + repo['models_url'] + '">' + repo['library'] + '</a>')
-            self.repos_tbl.setCellWidget(row, 1, cur_name_txt)
-
-            # Set the host URL label for the repo
-            cur_host_txt = QtGui.QLabel()
-            cur_host_txt.setAlignment(QtCore.Qt.AlignCenter)
-            cur_host_txt.setText(repo['maintainer'])
-            self.repos_tbl.setCellWidget(row, 2, cur_host_txt)
-
-            # Create the remove button for this repository
-            self.remove_buttons.append(QtGui.QPushButton(objectName=repo['library'] + "~" + repo['maintainer']))
-            self.remove_buttons[row].setFlat(True)
-            self.remove_buttons[row].setIcon(QtGui.QIcon(':/icons/delete.svg'))
-            self.remove_buttons[row].clicked.connect(partial(self.RemoveRepository, self.remove_buttons[row]))
-            self.repos_tbl.setCellWidget(row, 3, self.remove_buttons[row])
-
-            row += 1
-
         # Make sure all the columns are the correct size
         self.repos_tbl.resizeColumnToContents(0)
         self.repos_tbl.resizeColumnToContents(1)
         self.repos_tbl.resizeColumnToContents(2)
         self.repos_tbl.resizeColumnToContents(3)
+        self.repos_tbl.resizeColumnToContents(4)
 
         # Add the finished table to the collapsible widget
         repos_controls_layout.addWidget(self.repos_tbl)
@@ -259,75 +538,45 @@ class OCCIWorkbench ( Workbench ):
         self.add_txt = QtGui.QLineEdit()
         # self.add_txt.setStyleSheet("border: 1px solid gray;")
         self.add_txt.setPlaceholderText("New OCCI URL")
-        self.add_txt.setStyleSheet(search_field_css)
+        self.add_txt.setStyleSheet(self.search_field_css)
         self.add_txt.returnPressed.connect(self.AddRepository)
         add_layout.addWidget(self.add_txt)
         add_btn = QtGui.QPushButton(text="Add Repository")
         add_btn.clicked.connect(self.AddRepository)
         add_btn.setMinimumHeight(30)
-        add_btn.setStyleSheet(general_button_css)
+        add_btn.setStyleSheet(self.general_button_css)
         add_layout.addWidget(add_btn)
         repos_controls_layout.addLayout(add_layout)
 
-        #####################################################################
-        # Repos collapsible widget end                                      #
-        #####################################################################
+        # Allows the user to work only from models that have already been downloaded
+        self.offline_chk = QtGui.QCheckBox(text="offline (only use cached models)")
+        self.offline_chk.setStyleSheet("font-size:12px;")
+        self.offline_chk.setChecked(settings.value('cache/offline', 'no') == 'yes')
+        self.offline_chk.stateChanged.connect(self.OfflineCheckBoxChanged)
+        repos_controls_layout.addWidget(self.offline_chk)
+
+        # Allows searches to be answered from a local copy of each repository's catalogue
+        self.catalogue_chk = QtGui.QCheckBox(text="search local catalogue (synced in the background)")
+        self.catalogue_chk.setStyleSheet("font-size:12px;")
+        self.catalogue_chk.setChecked(settings.value('catalogue/enabled', 'no') == 'yes')
+        self.catalogue_chk.stateChanged.connect(self.CatalogueCheckBoxChanged)
+        repos_controls_layout.addWidget(self.catalogue_chk)
 
         #####################################################################
-        # Add component collapsible widget start                            #
+        # Repos collapsible widget end                                      #
         #####################################################################
 
-        # Set up the add component controls widget
-        comps_controls_widget = QtGui.QWidget()
-        comps_controls_layout = QtGui.QVBoxLayout()
-        comps_controls_widget.setLayout(comps_controls_layout)
-
-        # Controls to search for a component
-        search_layout = QtGui.QHBoxLayout()
-        self.search_txt = QtGui.QLineEdit()
-        self.search_txt.setPlaceholderText("Component search text")
-        self.search_txt.setStyleSheet(search_field_css)
-        self.search_txt.returnPressed.connect(self.DoSearch)
-        search_layout.addWidget(self.search_txt)
-        search_btn = QtGui.QPushButton(text="Search")
-        search_btn.setStyleSheet(general_button_css)
-        search_btn.clicked.connect(self.SearchComponents)
-        search_layout.addWidget(search_btn)
-        comps_controls_layout.addLayout(search_layout)
-
-        # Label that tells the user how many results were returned
-        self.results_num_lbl = QtGui.QLabel(text="")
-        self.results_num_lbl.setAlignment(QtCore.Qt.AlignCenter)
-        self.results_num_lbl.setStyleSheet("font-size:12px;")
-        comps_controls_layout.addWidget(self.results_num_lbl)
+        return repos_controls_widget
 
-        # The table that holds the searched-for components
-        self.results_tbl = QtGui.QTableWidget(1, 4)
-        self.results_tbl.setStyleSheet("font-size:12px;")
-        self.results_tbl.setMinimumHeight(50)
-        self.results_tbl.setMaximumHeight(50)
-        self.results_tbl.setSelectionBehavior(QtGui.QAbstractItemView.SelectRows)
-        self.results_tbl.clicked.connect(self.LoadParameters)
-        self.results_tbl.setHorizontalHeaderLabels(['name', 'author', 'description'])
-        header = self.results_tbl.horizontalHeader()
-        header.setSectionResizeMode(0, QtGui.QHeaderView.ResizeMode.ResizeToContents)
-        header.setSectionResizeMode(1, QtGui.QHeaderView.ResizeMode.ResizeToContents)
-        header.setSectionResizeMode(2, QtGui.QHeaderView.ResizeMode.Stretch)
-        header.setSectionHidden(3, True)
-        comps_controls_layout.addWidget(self.results_tbl)
 
-        # Button to add and configure the component
-        component_btn_layout = QtGui.QHBoxLayout()
-        component_btn = QtGui.QPushButton(text="Add Component")
-        component_btn.setStyleSheet(general_button_css)
-        component_btn.clicked.connect(self.LoadComponent)
-        component_btn_layout.addStretch()
-        component_btn_layout.addWidget(component_btn)
-        comps_controls_layout.addLayout(component_btn_layout)
+    def BuildConfigSection(self):
+        """
+        Builds the controls of the configuration section and returns the widget holding them.
+        """
+        from PySide import QtGui, QtCore
 
-        #####################################################################
-        # Add component collapsible widget end                              #
-        #####################################################################
+        # Make sure this method has access to the settings
+        settings = QtCore.QSettings("OCCI", "occi-freecad-plugin")
 
         #####################################################################
         # Configuration collapsible widget start                            #
@@ -378,8 +627,13 @@ class OCCIWorkbench ( Workbench ):
         self.auto_update_chk.setChecked(settings.value('ui/auto_update') == 'yes')
         self.auto_update_chk.stateChanged.connect(self.CheckBoxChanged)
         update_layout.addWidget(self.auto_update_chk)
+        self.prefetch_chk = QtGui.QCheckBox(text="prefetch presets")
+        self.prefetch_chk.setStyleSheet("font-size:12px;")
+        self.prefetch_chk.setChecked(settings.value('prefetch/enabled', 'no') == 'yes')
+        self.prefetch_chk.stateChanged.connect(self.PrefetchCheckBoxChanged)
+        update_layout.addWidget(self.prefetch_chk)
         update_btn = QtGui.QPushButton(text="Update Component")
-        update_btn.setStyleSheet(general_button_css)
+        update_btn.setStyleSheet(self.general_button_css)
         update_btn.clicked.connect(self.UpdateComponent)
         update_layout.addWidget(update_btn)
         self.config_controls_layout.addLayout(update_layout)
@@ -401,114 +655,14 @@ class OCCIWorkbench ( Workbench ):
         # Configuration collapsible widget end                              #
         #####################################################################
 
-        ##################################################################
-        # Custom repositories collapsible area button
-        self.repos_toggle_widget = QtGui.QWidget()
-        self.repos_toggle_widget.setStyleSheet(toggle_button_css)
-        self.repos_toggle_widget.setMaximumHeight(40)
-        self.repos_toggle_layout = QtGui.QGridLayout()
-        self.repos_toggle_button = QtGui.QToolButton(text="Repositories")
-        self.repos_toggle_button.setStyleSheet(toggle_button_css)
-        self.repos_toggle_button.clicked.connect(self.ToggleRepoWidgets)
-        self.repos_toggle_layout.addWidget(self.repos_toggle_button, 0, 0, 1, 11, QtCore.Qt.AlignCenter)
-        self.toggle_repos_arrow = QtGui.QToolButton(text="")
-        self.toggle_repos_arrow.setStyleSheet(toggle_button_css)
-        self.toggle_repos_arrow.setArrowType(QtGui.Qt.UpArrow)
-        self.toggle_repos_arrow.clicked.connect(self.ToggleRepoWidgets)
-        self.repos_toggle_layout.addWidget(self.toggle_repos_arrow, 0, 12, 1, 1)
-        self.repos_toggle_widget.setLayout(self.repos_toggle_layout)
-
-        # Set up the repos widget tree item
-        self.repo_widget_item = QtGui.QTreeWidgetItem(["Repositories"])
-        repo_controls_item = QtGui.QTreeWidgetItem(["item1"])
-        self.repo_widget_item.addChild(repo_controls_item)
+        return self.config_controls_widget
 
-        # Custom components collapsible area button
-        self.comps_toggle_widget = QtGui.QWidget()
-        self.comps_toggle_widget.setStyleSheet(toggle_button_css)
-        self.comps_toggle_widget.setMaximumHeight(40)
-        self.comps_toggle_layout = QtGui.QGridLayout()
-        self.comps_toggle_button = QtGui.QToolButton(text="Add Parametric Component")
-        self.comps_toggle_button.setStyleSheet(toggle_button_css)
-        self.comps_toggle_button.clicked.connect(self.ToggleCompsWidgets)
-        self.comps_toggle_layout.addWidget(self.comps_toggle_button, 0, 0, 1, 11, QtCore.Qt.AlignCenter)
-        self.toggle_comps_arrow = QtGui.QToolButton(text="")
-        self.toggle_comps_arrow.setStyleSheet(toggle_button_css)
-        self.toggle_comps_arrow.setArrowType(QtGui.Qt.UpArrow)
-        self.toggle_comps_arrow.clicked.connect(self.ToggleCompsWidgets)
-        self.comps_toggle_layout.addWidget(self.toggle_comps_arrow, 0, 12, 1, 1)
-        self.comps_toggle_widget.setLayout(self.comps_toggle_layout)
 
-        # Set up the components widget tree item
-        self.comps_widget_item = QtGui.QTreeWidgetItem(["Components"])
-        comps_controls_item = QtGui.QTreeWidgetItem(["item2"])
-        self.comps_widget_item.addChild(comps_controls_item)
-        self.comps_widget_item.setExpanded(True)
-
-        # Custom configuration button
-        self.conf_toggle_widget = QtGui.QWidget()
-        self.conf_toggle_widget.setStyleSheet(toggle_button_css)
-        self.conf_toggle_widget.setMaximumHeight(40)
-        self.conf_toggle_layout = QtGui.QGridLayout()
-        self.conf_toggle_button = QtGui.QPushButton(text="Configure Selected Component")
-        self.conf_toggle_button.setStyleSheet(toggle_button_css)
-        self.conf_toggle_button.clicked.connect(self.ToggleParamsWidgets)
-        self.conf_toggle_layout.addWidget(self.conf_toggle_button, 0, 0, 1, 11, QtCore.Qt.AlignCenter)
-        self.toggle_conf_arrow = QtGui.QToolButton(text="")
-        self.toggle_conf_arrow.setStyleSheet(toggle_button_css)
-        self.toggle_conf_arrow.setArrowType(QtGui.Qt.UpArrow)
-        self.toggle_conf_arrow.clicked.connect(self.ToggleParamsWidgets)
-        self.conf_toggle_layout.addWidget(self.toggle_conf_arrow, 0, 12, 1, 1)
-        self.conf_toggle_widget.setLayout(self.conf_toggle_layout)
-
-        # Set up the configuration widget tree item
-        self.conf_widget_item = QtGui.QTreeWidgetItem(["Configuration"])
-        config_controls_item = QtGui.QTreeWidgetItem(["item3"])
-        self.conf_widget_item.addChild(config_controls_item)
-        self.conf_widget_item.setExpanded(True)
-
-        # Set up the tree widgets
-        tree_widget.addTopLevelItems([self.repo_widget_item, self.comps_widget_item, self.conf_widget_item])
-        tree_widget.setItemWidget(self.repo_widget_item, 0, self.repos_toggle_widget)
-        tree_widget.setItemWidget(self.comps_widget_item, 0, self.comps_toggle_widget)
-        tree_widget.setItemWidget(self.conf_widget_item, 0, self.conf_toggle_widget)
-        tree_widget.setItemWidget(repo_controls_item, 0, repos_controls_widget)
-        tree_widget.setItemWidget(comps_controls_item, 0, comps_controls_widget)
-        tree_widget.setItemWidget(config_controls_item, 0, self.config_controls_widget)
-
-        # Expand the top level tree widgets as appropriate
-        self.repo_widget_item.setExpanded(settings.value('ui/repos_expanded') == 'yes')
-        self.comps_widget_item.setExpanded(settings.value('ui/comps_expanded') == 'yes')
-        self.conf_widget_item.setExpanded(settings.value('ui/params_expanded') == 'yes')
-
-        # Make sure all the toggle icons start out in the right state
-        self.UpdateTreeToggleIcons()
-
-        # Add our collapsible tree GUI arrangement to the dock
-        main_vbox.addWidget(tree_widget)
-
-        # We can only add widgets to a dock, so we need a top-level widget
-        container = QtGui.QWidget()
-        container.setStyleSheet("background-color:white;")
-
-        # Set the layout for the dock with all the UI controls added to it
-        main_vbox.setMargin(0)
-        container.setLayout(main_vbox)
-        scroll_area = QtGui.QScrollArea()
-        tree_widget.setSizePolicy(QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Expanding)
-        container.setSizePolicy(QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Expanding)
-        scroll_area.setSizePolicy(QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Expanding)
-        scroll_area.setWidgetResizable(True)
-        scroll_area.setWidget(container)
-        occi_dock.setMinimumWidth(350)
-        occi_dock.setWidget(scroll_area)
-
-
-    def UpdateTreeToggleIcons(self):
-        """
-        The toggle indicators on this UI are custom, so they have to be handled manually.
-        """
-        from PySide import QtGui
+    def UpdateTreeToggleIcons(self):
+        """
+        The toggle indicators on this UI are custom, so they have to be handled manually.
+        """
+        from PySide import QtGui
 
         # The repos indicator
         if self.repo_widget_item.isExpanded() == True:
@@ -536,6 +690,13 @@ class OCCIWorkbench ( Workbench ):
         from PySide import QtGui
         from PySide.QtCore import QSettings
 
+        # The controls are only built the first time they are shown
+        self.EnsureReposSection()
+
+        # The status column is only worth filling in once the user looks at it
+        if not self.repo_widget_item.isExpanded():
+            self.RequestProbing()
+
         # Save the new state as a setting
         settings = QSettings("OCCI", "occi-freecad-plugin")
         settings.setValue("ui/repos_expanded", 'yes' if not self.repo_widget_item.isExpanded() else 'no')
@@ -572,6 +733,9 @@ class OCCIWorkbench ( Workbench ):
         """
         from PySide.QtCore import QSettings
 
+        # The controls are only built the first time they are shown
+        self.EnsureConfigSection()
+
         # Save the new state as a setting
         settings = QSettings("OCCI", "occi-freecad-plugin")
         settings.setValue("ui/params_expanded", 'yes' if not self.conf_widget_item.isExpanded() else 'no')
@@ -588,10 +752,8 @@ class OCCIWorkbench ( Workbench ):
         """
         Loads the data for the given repository and adds it to the table.
         """
-        from functools import partial
-        import requests
-        import json
-        from PySide import QtGui, QtCore
+        from Http import GetJSON
+        from Repositories import GetRegistry
 
         # Get the repository URL entered by the user
         repo_url = self.add_txt.text()
@@ -610,15 +772,23 @@ class OCCIWorkbench ( Workbench ):
         # Let the user know that something is going on
         self.SetProgress(20)
 
-        # Attempt to load the URL
-        response = None
+        # Attempt to load the URL, which only costs a header exchange if the repository information is already known
+        status_code = None
+        server_info = None
         try:
-            response = requests.get(repo_url)
+            status_code, server_info = GetJSON(repo_url)
+        except ValueError:
+            FreeCAD.Console.PrintError("OCCI ERROR: There was an error parsing the JSON content. Please ensure that the provided URL points to a valid OCCI server.\r\n")
+
+            # Make sure that the progress bar does not hang
+            self.ResetProgress()
+
+            return
         except:
             FreeCAD.Console.PrintError("OCCI ERROR: There was a problem loading the URL. Please verify that the URL is valid.\r\n")
 
         # If there was no response, there is no reason to continue
-        if response == None:
+        if status_code == None:
             # Make sure that the progress bar does not hang
             self.ResetProgress()
             return
@@ -627,17 +797,7 @@ class OCCIWorkbench ( Workbench ):
         self.SetProgress(70)
 
         # Check the status code to see if the request succeeded
-        if response.status_code == 200:
-            # Attempt to parse the response into JSON
-            try:
-                server_info = json.loads(response.content)
-            except:
-                FreeCAD.Console.PrintError("OCCI ERROR: There was an error parsing the JSON content. Please ensure that the provided URL points to a valid OCCI server.\r\n")
-
-                # Make sure that the progress bar does not hang
-                self.ResetProgress()
-
-                return
+        if status_code == 200:
 
             # Check to make sure the data has the appropriate fields
             if not "library" in server_info or not "maintainer" in server_info:
@@ -648,8 +808,9 @@ class OCCIWorkbench ( Workbench ):
 
                 return
 
-            # Check to make sure this is not a duplicate entry
-            if self.FindRepositoryRow(server_info['library'], server_info['maintainer']) != None:
+            # Duplicate entries are not added to the registry
+            repository = GetRegistry().Add(server_info['library'], server_info['maintainer'], repo_url)
+            if repository == None:
                 FreeCAD.Console.PrintWarning("OCCI: Duplicate repository entries are not permitted. If this repository server should not be a duplicate, contact the system administrator to make sure they do not have a conflicting name.\r\n")
 
                 # Make sure that the progress bar does not hang
@@ -657,64 +818,19 @@ class OCCIWorkbench ( Workbench ):
 
                 return
 
-            # Find the end of the repositories table so we can add an entry
-            row_count = self.repos_tbl.rowCount()
-            new_row_index = 0
-            for row_index in range(0, row_count + 1):
-                # If we are past the end of the table, we need to add a new row
-                if row_index == row_count:
-                    self.repos_tbl.insertRow(row_count)
-                    new_row_index = row_index
-
-                # If there is nothing in the row, we know it is ready to be filled
-                chkbox = self.repos_tbl.cellWidget(row_index, 0)
-                if chkbox == None:
-                    new_row_index = row_index
-                    break
-
-            # Add a new set of widgets to the last line
-            new_chkbox = QtGui.QCheckBox(Checked=True)
-
-            # The repository name text
-            new_name_txt = QtGui.QLabel()
-            new_name_txt.setAlignment(QtCore.Qt.AlignCenter)
-            new_name_txt.setTextFormat(QtCore.Qt.RichText)
-            new_name_txt.setTextInteractionFlags(QtCore.Qt.TextBrowserInteraction)
-            new_name_txt.setOpenExternalLinks(True)
-            new_name_txt.setText('<a href="' + repo_url + '">' + server_info['library'] + '</a>')
-
-            # The curator text
-            new_curator_txt = QtGui.QLabel(text=server_info['maintainer'])
-            new_curator_txt.setAlignment(QtCore.Qt.AlignCenter)
-
-            # The remove button
-            self.remove_buttons.append(QtGui.QPushButton(objectName=server_info['library'] + "~" + server_info['maintainer']))
-            self.remove_buttons[new_row_index].setFlat(True)
-            self.remove_buttons[new_row_index].setIcon(QtGui.QIcon(':/icons/delete.svg'))
-            self.remove_buttons[new_row_index].clicked.connect(partial(self.RemoveRepository, self.remove_buttons[new_row_index]))
-
-            # Add all the widgets to the table
-            self.repos_tbl.setCellWidget(new_row_index, 0, new_chkbox)
-            self.repos_tbl.setCellWidget(new_row_index, 1, new_name_txt)
-            self.repos_tbl.setCellWidget(new_row_index, 2, new_curator_txt)
-            self.repos_tbl.setCellWidget(new_row_index, 3, self.remove_buttons[new_row_index])
+            # Add an entry to the end of the table
+            self.AddRepositoryRow(repository)
+
+            # Find out how the new repository is responding without waiting for the next round of probes
+            self.UpdateProberRepositories()
+            if self.prober != None:
+                self.prober.ProbeNow()
 
             # Resize the table up to a maximum of 2 rows
             self.ResizeReposTable()
-
-            # Save the new repository's information in the settings
-            settings = QtCore.QSettings("OCCI", "occi-freecad-plugin")
-            repo_list = settings.value('data/repo_list')
-
-            # Assemble the new entry and make sure it is actually a new one
-            new_repo_item = {'use': True, 'library': server_info['library'], 'maintainer': server_info['maintainer'], 'models_url': repo_url}
-            if new_repo_item not in repo_list['list']:
-                repo_list['list'].append(new_repo_item)
-            settings.setValue('data/repo_list', repo_list)
-            settings.sync()
-        elif response.status_code == 404:
+        elif status_code == 404:
             FreeCAD.Console.PrintError("OCCI ERROR: The OCCI repository URL provided does is not found.\r\n")
-        elif response.status_code == 500:
+        elif status_code == 500:
             FreeCAD.Console.PrintError("OCCI ERROR: There was a server error while trying to load the OCCI repository data.\r\n")
         else:
             FreeCAD.Console.PrintError("OCCI ERROR: There was a general error while trying to load the OCCI repository data.\r\n")
@@ -726,6 +842,64 @@ class OCCIWorkbench ( Workbench ):
         self.ResetProgress()
 
 
+    def AddRepositoryRow(self, repository):
+        """
+        Adds the controls for a repository to the end of the repositories table.
+        """
+        from functools import partial
+        from PySide import QtGui, QtCore
+
+        # Find the end of the repositories table so we can add an entry
+        row_count = self.repos_tbl.rowCount()
+        new_row_index = 0
+        for row_index in range(0, row_count + 1):
+            # If we are past the end of the table, we need to add a new row
+            if row_index == row_count:
+                self.repos_tbl.insertRow(row_count)
+                new_row_index = row_index
+
+            # If there is nothing in the row, we know it is ready to be filled
+            chkbox = self.repos_tbl.cellWidget(row_index, 0)
+            if chkbox == None:
+                new_row_index = row_index
+                break
+
+        # Set the 'use' checkbox for the repo
+        self.use_checks[repository.repo_id] = QtGui.QCheckBox()
+        self.use_checks[repository.repo_id].setChecked(repository.use)
+        self.use_checks[repository.repo_id].stateChanged.connect(partial(self.UseCheckboxChanged, repository.repo_id))
+
+        # The repository name text
+        new_name_txt = QtGui.QLabel()
+        new_name_txt.setAlignment(QtCore.Qt.AlignCenter)
+        new_name_txt.setTextFormat(QtCore.Qt.RichText)
+        new_name_txt.setTextInteractionFlags(QtCore.Qt.TextBrowserInteraction)
+        new_name_txt.setOpenExternalLinks(True)
+        new_name_txt.setText('<a href="' + repository.models_url + '">' + repository.library + '</a>')
+
+        # The curator text
+        new_curator_txt = QtGui.QLabel(text=repository.maintainer)
+        new_curator_txt.setAlignment(QtCore.Qt.AlignCenter)
+
+        # How the repository has been responding
+        self.status_labels[repository.repo_id] = QtGui.QLabel()
+        self.status_labels[repository.repo_id].setAlignment(QtCore.Qt.AlignCenter)
+        self.UpdateRepositoryStatus(repository.repo_id)
+
+        # The remove button
+        self.remove_buttons[repository.repo_id] = QtGui.QPushButton()
+        self.remove_buttons[repository.repo_id].setFlat(True)
+        self.remove_buttons[repository.repo_id].setIcon(QtGui.QIcon(':/icons/delete.svg'))
+        self.remove_buttons[repository.repo_id].clicked.connect(partial(self.RemoveRepository, repository.repo_id))
+
+        # Add all the widgets to the table
+        self.repos_tbl.setCellWidget(new_row_index, 0, self.use_checks[repository.repo_id])
+        self.repos_tbl.setCellWidget(new_row_index, 1, new_name_txt)
+        self.repos_tbl.setCellWidget(new_row_index, 2, new_curator_txt)
+        self.repos_tbl.setCellWidget(new_row_index, 3, self.status_labels[repository.repo_id])
+        self.repos_tbl.setCellWidget(new_row_index, 4, self.remove_buttons[repository.repo_id])
+
+
     def LoadDefaults(self):
         """
         Loads the repository defaults from disk.
@@ -742,6 +916,28 @@ class OCCIWorkbench ( Workbench ):
         return default_settings
 
 
+    def SearchTextChanged(self):
+        """
+        Restarts the search timer as the user types, so that a search only runs
+        once they pause.
+        """
+        if self.search_as_you_type_chk.isChecked():
+            self.search_timer.start()
+
+
+    def SearchAsYouTypeCheckBoxChanged(self):
+        """
+        The state of the search as you type checkbox needs to be saved.
+        """
+        from PySide.QtCore import QSettings
+
+        # Make sure this method has access to the settings
+        settings = QSettings("OCCI", "occi-freecad-plugin")
+
+        settings.setValue('search/as_you_type', 'yes' if self.search_as_you_type_chk.isChecked() else 'no')
+        settings.sync()
+
+
     def DoSearch(self):
         """
         Allows the user to hit the Enter key in the search box to search.
@@ -749,258 +945,650 @@ class OCCIWorkbench ( Workbench ):
         self.SearchComponents()
 
 
-    def ResizeResultsTable(self):
+    def ResizeResultsTable(self):
+        """
+        Handles the task of resizing the search results table height to fit an
+        appropriate number of rows.
+        """
+
+        # Set the size of the table appropriately, up to a max number of rows
+        max_results_rows = 5 # Including the header row
+        max_results_row_height = self.results_tbl.verticalHeader().defaultSectionSize()
+        num_results = self.results_model.rowCount() + 1
+        if num_results == 0:
+            table_height = max_results_row_height * 2
+        elif num_results >= 1 and num_results <= max_results_rows:
+            table_height = num_results * max_results_row_height
+        else:
+            table_height = max_results_rows * max_results_row_height
+
+        # Results keep streaming in once the table is as tall as it gets, and there is nothing to redo for them
+        if self.results_tbl.minimumHeight() == table_height and self.results_tbl.maximumHeight() == table_height:
+            return
+
+        self.results_tbl.setMinimumHeight(table_height)
+        self.results_tbl.setMaximumHeight(table_height)
+
+        # Work-around to make sure resizing changes take effect. The expanded state ends up where it
+        # started, so it is not saved the way a click on the header saves it.
+        is_expanded = self.comps_widget_item.isExpanded()
+        self.comps_widget_item.setExpanded(not is_expanded)
+        self.comps_widget_item.setExpanded(is_expanded)
+
+    def SearchComponents(self):
+        """
+        Searches the specified repositories for the given component.
+        """
+        from functools import partial
+        from PySide import QtCore
+        from Utils import SearchWorker
+        from Cache import IsOffline, GetQueryCache
+        from Catalogue import GetCatalogue, IsCatalogueEnabled, CatalogueMaxAge, SEARCH_LIMIT
+        from Health import GetHealthMonitor
+
+        # A search that was waiting for the user to stop typing is covered by this one
+        self.search_timer.stop()
+
+        # Clear any previous results
+        self.ClearPreviousComponentResults()
+        self.results_model.Clear()
+        self.results_num_lbl.setText("Searching...")
+
+        # Let the user know that something is going on
+        self.SetProgress(5)
+
+        # Let the user know if there is nothing to search
+        repo_urls = self.EnabledRepositoryURLs()
+        if len(repo_urls) == 0:
+            self.results_num_lbl.setText("No repositories selected")
+            self.ResetProgress()
+            return
+
+        # Any search that is still running has been superseded by this one
+        self.search_generation += 1
+        for running_worker in self.search_workers:
+            running_worker.Cancel()
+
+        # Keep track of which repositories are responding from now on, so that later searches do not wait on the ones that are down
+        self.RequestProbing()
+
+        # Repositories with an up to date local catalogue are searched locally, the rest go to the server
+        if IsCatalogueEnabled():
+            catalogue = GetCatalogue()
+
+            # When offline, an out of date catalogue is better than nothing
+            max_age = float('inf') if IsOffline() else CatalogueMaxAge()
+
+            remote_urls = []
+            for models_url in repo_urls:
+                if catalogue.IsFresh(models_url, max_age):
+                    # One more than the limit is asked for, to tell whether there were more matches than are shown
+                    json_results = catalogue.Search(models_url, self.search_txt.text(), SEARCH_LIMIT + 1)
+                    if len(json_results) > SEARCH_LIMIT:
+                        json_results = json_results[:SEARCH_LIMIT]
+                        FreeCAD.Console.PrintWarning("OCCI: Only the first " + str(SEARCH_LIMIT) + " matches in the local catalogue of " + models_url +
+                                                     " are shown. Add more words to the search to narrow it down.\r\n")
+                    self.AddSearchResults(models_url, json_results)
+                else:
+                    remote_urls.append(models_url)
+
+            # Refresh the catalogues that are missing or out of date in the background, once per session
+            sync_urls = [models_url for models_url in remote_urls if models_url not in self.catalogue_sync_tried]
+            if len(sync_urls) > 0 and not IsOffline():
+                self.catalogue_sync_tried.update(sync_urls)
+                self.SyncCatalogue(sync_urls)
+
+            repo_urls = remote_urls
+
+        # Repositories that have answered the same query recently do not need to be asked again
+        query_cache = GetQueryCache()
+        remote_urls = []
+        stale_results = {}
+        for models_url in repo_urls:
+            cached_results = query_cache.Get(models_url, self.search_txt.text())
+            if cached_results != None:
+                self.AddSearchResults(models_url, cached_results)
+            else:
+                remote_urls.append(models_url)
+
+                # Expired results can still be revalidated with the server instead of being sent again
+                stale = query_cache.GetStale(models_url, self.search_txt.text())
+                if stale != None:
+                    stale_results[models_url] = stale
+        repo_urls = remote_urls
+
+        # Repositories that keep failing are skipped until they answer again, and slow ones are asked last
+        repo_urls, skipped_urls = GetHealthMonitor().Route(repo_urls)
+        if len(skipped_urls) > 0:
+            FreeCAD.Console.PrintWarning("OCCI: Skipping " + str(len(skipped_urls)) + " repositories that are not responding.\r\n")
+
+            # Expired results from a repository that is down are better than nothing
+            for models_url in skipped_urls:
+                if models_url in stale_results:
+                    self.AddSearchResults(models_url, stale_results.pop(models_url)[0])
+
+        # Everything may have been answered locally
+        if len(repo_urls) == 0:
+            if self.results_model.rowCount() == 0:
+                self.results_num_lbl.setText("0 results")
+            self.SetProgress(100)
+            self.ResetProgress()
+            return
+
+        # Set up the worker that will search all of the repositories at once
+        settings = QtCore.QSettings("OCCI", "occi-freecad-plugin")
+        worker = SearchWorker()
+        worker.repo_urls = repo_urls
+        worker.search_text = self.search_txt.text()
+        worker.stale_results = stale_results
+        worker.deadline = float(settings.value('search/deadline', 10.0))
+        worker.resultsReady.connect(partial(self.SearchResultsReady, self.search_generation, worker))
+        worker.searchFailed.connect(partial(self.SearchFailed, self.search_generation))
+        worker.searchFinished.connect(partial(self.SearchFinished, self.search_generation))
+        worker.finished.connect(partial(self.SearchDone, worker))
+        self.search_repos_total = len(repo_urls)
+        self.search_repos_done = 0
+
+        # Keep a reference to the worker so that it is not garbage collected while it runs
+        self.search_workers.append(worker)
+        worker.start()
+
+
+    def SearchResultsReady(self, generation, worker, models_url, json_results, validators):
+        """
+        Called by the search worker each time a repository returns its results,
+        which it has already put in the query cache.
+        """
+
+        # Results from a superseded search are not displayed
+        if generation != self.search_generation:
+            return
+
+        self.UpdateSearchProgress()
+
+        self.AddSearchResults(models_url, json_results)
+
+
+    def AddSearchResults(self, models_url, json_results):
+        """
+        Adds the search results from a repository to the results table, whether
+        they came from the server or from the local catalogue.
+        """
+
+        # Only keep the results that have the fields we need
+        valid_results = []
+        for json_result in json_results:
+            # Temporary until the API is fixed
+            if 'author' not in json_result:
+                json_result['author'] = 'test'
+
+            # Make sure that we got the fields we need in the result
+            if 'name' not in json_result or 'author' not in json_result or 'description' not in json_result or 'namespace' not in json_result:
+                FreeCAD.Console.PrintError("OCCI ERROR: The response from the server did not have the required information.\r\n")
+                continue
+
+            valid_results.append(json_result)
+
+        # Add all the search results to the table in one go, skipping duplicates
+        self.results_model.AppendResults(models_url, valid_results)
+
+        # Let the user know how many search results there are
+        num_results = self.results_model.rowCount()
+        if (num_results == 1):
+            self.results_num_lbl.setText(str(num_results) + " result")
+        else:
+            self.results_num_lbl.setText(str(num_results) + " results")
+
+        # Resize the table height to fit the contents appropriately
+        self.ResizeResultsTable()
+
+
+    def EnabledRepositoryURLs(self):
+        """
+        Returns the models URLs of all the repositories the user wants to search.
+        """
+        from Repositories import GetRegistry
+
+        return GetRegistry().EnabledURLs()
+
+
+    def SyncCatalogue(self, repo_urls):
+        """
+        Starts refreshing the local catalogue of the given repositories in the background.
+        """
+        from functools import partial
+        from Utils import CatalogueSyncWorker
+
+        # Do not sync a repository that is already being synced
+        repo_urls = [models_url for models_url in repo_urls if models_url not in self.catalogue_syncing]
+        if len(repo_urls) == 0:
+            return
+
+        self.catalogue_syncing.update(repo_urls)
+
+        worker = CatalogueSyncWorker()
+        worker.repo_urls = repo_urls
+        worker.syncFailed.connect(self.CatalogueSyncFailed)
+        worker.finished.connect(partial(self.CatalogueSyncDone, worker))
+
+        # Keep a reference to the worker so that it is not garbage collected while it runs
+        self.catalogue_workers.append(worker)
+        worker.start()
+
+
+    def CatalogueSyncFailed(self, models_url):
+        """
+        Called when a repository's catalogue could not be refreshed.
+        """
+        FreeCAD.Console.PrintWarning("OCCI: The local catalogue of the repository at " + models_url + " could not be refreshed.\r\n")
+
+
+    def CatalogueSyncDone(self, worker):
+        """
+        Called when a catalogue sync worker has finished.
+        """
+        for models_url in worker.repo_urls:
+            self.catalogue_syncing.discard(models_url)
+
+        if worker in self.catalogue_workers:
+            self.catalogue_workers.remove(worker)
+
+
+    def CatalogueCheckBoxChanged(self):
+        """
+        The state of the local catalogue checkbox needs to be saved, and the
+        catalogue synced if it has just been turned on.
+        """
+        from PySide.QtCore import QSettings
+        from Cache import IsOffline
+
+        # Make sure this method has access to the settings
+        settings = QSettings("OCCI", "occi-freecad-plugin")
+
+        settings.setValue('catalogue/enabled', 'yes' if self.catalogue_chk.isChecked() else 'no')
+        settings.sync()
+
+        if self.catalogue_chk.isChecked() and not IsOffline():
+            self.SyncCatalogue(self.EnabledRepositoryURLs())
+
+
+    def RequestProbing(self):
+        """
+        Starts the background probes the first time the repositories are used
+        after the workbench is activated.
+        """
+        self.probing_requested = True
+        self.StartProber()
+
+
+    def StartProber(self):
+        """
+        Starts probing the repositories that are searched in the background, unless it is turned off.
+        """
+        from PySide.QtCore import QSettings
+        from Utils import HealthProber
+        from Cache import IsOffline
+        from Health import IsProbingEnabled
+
+        if self.prober != None or not IsProbingEnabled() or IsOffline():
+            return
+
+        settings = QSettings("OCCI", "occi-freecad-plugin")
+        self.prober = HealthProber()
+        self.prober.interval = float(settings.value('health/probe_interval_s', 60))
+        self.prober.timeout = float(settings.value('health/probe_timeout', 5.0))
+        self.prober.repositoryProbed.connect(self.RepositoryProbed)
+        self.UpdateProberRepositories()
+        self.prober.start()
+
+
+    def StopProber(self):
+        """
+        Stops the background probes. The prober finishes the probes it has started on its own.
+        """
+        from functools import partial
+
+        if self.prober != None:
+            self.prober.repositoryProbed.disconnect(self.RepositoryProbed)
+            self.prober.Cancel()
+
+            # Keep a reference until the thread has finished so that it is not garbage collected while it runs
+            self.stopped_probers.append(self.prober)
+            self.prober.finished.connect(partial(self.stopped_probers.remove, self.prober))
+            self.prober = None
+
+
+    def UpdateProberRepositories(self):
+        """
+        Gives the prober the current list of repositories to probe.
+        """
+        from Repositories import GetRegistry
+
+        if self.prober != None:
+            self.prober.repo_urls = GetRegistry().EnabledURLs()
+
+
+    def RepositoryProbed(self, models_url):
+        """
+        Called by the prober each time it has checked a repository.
+        """
+        from Repositories import GetRegistry
+
+        repository = GetRegistry().FindURL(models_url)
+        if repository != None:
+            self.UpdateRepositoryStatus(repository.repo_id)
+
+
+    def UpdateRepositoryStatuses(self):
+        """
+        Shows how each repository in the table has been responding.
+        """
+        for repo_id in self.status_labels.keys():
+            self.UpdateRepositoryStatus(repo_id)
+
+
+    def UpdateRepositoryStatus(self, repo_id):
+        """
+        Shows how a single repository has been responding in its status label.
+        """
+        from Repositories import GetRegistry
+        from Health import GetHealthMonitor, HealthMonitor
+
+        # The table may not have been built yet, or the repository may have just been removed
+        status_lbl = self.status_labels.get(repo_id)
+        repository = GetRegistry().Get(repo_id)
+        if status_lbl == None or repository == None:
+            return
+
+        status, latency = GetHealthMonitor().Status(repository.models_url)
+        if status == HealthMonitor.DOWN:
+            status_lbl.setText("down")
+            status_lbl.setStyleSheet("color:#cc0000;")
+            status_lbl.setToolTip("Searches skip this repository until it answers again")
+        elif status == HealthMonitor.UNKNOWN:
+            status_lbl.setText("-")
+            status_lbl.setStyleSheet("color:#aaaaaa;")
+            status_lbl.setToolTip("This repository has not been checked yet")
+        else:
+            status_lbl.setText(str(int(latency * 1000.0)) + " ms")
+            status_lbl.setStyleSheet("color:#cc8800;" if status == HealthMonitor.SLOW else "color:#008800;")
+            status_lbl.setToolTip("Searches ask this repository after the quicker ones" if status == HealthMonitor.SLOW else "This repository is answering normally")
+
+
+    def SearchFailed(self, generation, models_url, status_code):
+        """
+        Called by the search worker when a repository could not be searched.
+        """
+        from Utils import SearchWorker
+
+        # Errors from a superseded search are not relevant anymore
+        if generation != self.search_generation:
+            return
+
+        self.UpdateSearchProgress()
+
+        if status_code == 404:
+            FreeCAD.Console.PrintMessage("OCCI: The model was not found in the OCCI repository.\r\n")
+        elif status_code == 500:
+            FreeCAD.Console.PrintError("OCCI ERROR: There was an error on the server that prevented the model from being generated. Please contact that server's administrator.\r\n")
+        elif status_code == SearchWorker.TIMED_OUT:
+            FreeCAD.Console.PrintWarning("OCCI: The repository at " + models_url + " did not answer the search in time.\r\n")
+        else:
+            FreeCAD.Console.PrintError("OCCI ERROR: There was a problem searching the repository at " + models_url + ".\r\n")
+
+        # Only replace the result count if nothing else has been found
+        if self.results_model.rowCount() == 0:
+            self.results_num_lbl.setText("Search error")
+
+
+    def SearchFinished(self, generation):
+        """
+        Called by the search worker when every repository has answered or timed out.
+        """
+
+        # The search has also shown how each of the repositories is responding
+        self.UpdateRepositoryStatuses()
+
+        # A newer search owns the progress bar and results label
+        if generation != self.search_generation:
+            return
+
+        # Make sure the user is not left waiting when nothing came back
+        if self.results_model.rowCount() == 0 and self.results_num_lbl.text() == "Searching...":
+            self.results_num_lbl.setText("0 results")
+
+        # Give the user a flash of 100%
+        self.SetProgress(100)
+
+        # Let the user know that the request is finished
+        self.ResetProgress()
+
+
+    def SearchDone(self, worker):
+        """
+        Called when a search worker's thread has finished, so that it no longer needs to be kept alive.
+        """
+        if worker in self.search_workers:
+            self.search_workers.remove(worker)
+
+
+    def UpdateSearchProgress(self):
+        """
+        Moves the progress bar along each time a repository answers a search.
+        """
+        self.search_repos_done += 1
+        self.SetProgress(5 + int(95 * self.search_repos_done / self.search_repos_total))
+
+
+    def BuildSTEPURL(self, base_url):
+        """
+        Builds the URL to grab the OCCI component STEP file with the
+        parameter values set.
+        """
+        param_values = []
+
+        # Without a parameters table, the component has not been configured yet
+        if self.params_tbl == None:
+            return self.BuildSTEPURLFromValues(base_url, param_values)
+
+        # Step through the parameters table, collecting names and values
+        for row_index in range(0, self.params_tbl.rowCount()):
+            name_widget = self.params_tbl.cellWidget(row_index, 0)
+            value_widget = self.params_tbl.cellWidget(row_index, 2)
+
+            # Check to see if we have reached the last line
+            if name_widget == None and value_widget == None:
+                break
+            else:
+                value = self.WidgetValue(value_widget)
+                param_values.append((name_widget.text().split("(")[0].strip(), value))
+
+        return self.BuildSTEPURLFromValues(base_url, param_values)
+
+
+    def WidgetValue(self, value_widget):
+        """
+        Returns the value of a parameter control in the form it is sent to the server.
+        """
+        from PySide import QtGui
+
+        # We have to extract the value different ways from different controls
+        if isinstance(value_widget, QtGui.QSpinBox) or isinstance(value_widget, QtGui.QDoubleSpinBox):
+            return value_widget.value()
+        elif isinstance(value_widget, QtGui.QComboBox):
+            return value_widget.currentText()
+        elif isinstance(value_widget, QtGui.QCheckBox):
+            return str(value_widget.isChecked())
+        else:
+            return value_widget.text()
+
+
+    def BuildSTEPURLFromValues(self, base_url, param_values):
         """
-        Handles the task of resizing the search results table height to fit an
-        appropriate number of rows.
+        Builds the URL to grab the OCCI component STEP file from a list of
+        (name, value) parameter pairs.
         """
+        from Utils import BuildModelURL
 
-        # Resize each row to fit its contents, which should all be the same height, based on font size
-        for row_index in range(0, self.results_tbl.rowCount()):
-            self.results_tbl.resizeRowToContents(row_index)
-
-        # Set the size of the table appropriately, up to a max number of rows
-        max_results_rows = 5 # Including the header row
-        max_results_row_height = self.results_tbl.rowHeight(0)
-        num_results = self.results_tbl.rowCount() + 1
-        if num_results == 0:
-            self.results_tbl.setMinimumHeight(max_results_row_height * 2)
-            self.results_tbl.setMaximumHeight(max_results_row_height * 2)
-        elif num_results >= 1 and num_results <= max_results_rows:
-            self.results_tbl.setMinimumHeight(num_results * max_results_row_height)
-            self.results_tbl.setMaximumHeight(num_results * max_results_row_height)
-        else:
-            self.results_tbl.setMinimumHeight(max_results_rows * max_results_row_height)
-            self.results_tbl.setMaximumHeight(max_results_rows * max_results_row_height)
+        return BuildModelURL(base_url, param_values)
 
-        # Work-around to make sure resizing changes take effect
-        self.ToggleCompsWidgets()
-        self.ToggleCompsWidgets()
 
-    def SearchComponents(self):
+    def PresetParameterValues(self, result, preset):
         """
-        Searches the specified repositories for the given component.
+        Works out the (name, value) pairs that the parameters table would hold
+        after the given preset was applied, formatted the same way the
+        parameter controls would format them.
         """
-        from PySide import QtGui, QtCore
-        import requests
-        import json
+        from Utils import ParameterValues
 
-        # Clear any previous results
-        self.results_tbl.clearContents()
-        self.ClearPreviousComponentResults()
-        self.results_num_lbl.setText("Searching...")
+        return ParameterValues(result, preset)
 
-        # Let the user know that something is going on
-        self.SetProgress(5)
 
-        # Reset the table to only having one row
-        self.results_tbl.setRowCount(1)
+    def NeighbourParameterValues(self, result):
+        """
+        Returns lists of (name, value) pairs for the default parameters with each
+        number parameter stepped once up and once down.
+        """
+        neighbours = []
 
-        # Walk through each row of the repositories table and search them
-        row_count = self.repos_tbl.rowCount()
-        results_row = 0
-        num_results = 0
-        for row in range(0, row_count):
-            # If there is something in the row, extract data from the row
-            chkbox = self.repos_tbl.cellWidget(row, 0)
-            if chkbox != None:
-                # See if the user wants to use the current repo
-                if chkbox.checkState() == QtCore.Qt.CheckState.Checked:
-                    # Get the models URL text field
-                    models_txt = self.repos_tbl.cellWidget(row, 1)
-                    models_url = models_txt.text().split("\"")[1]
-
-                    # Search the OCCI server for the search text
-                    response = None
-                    try:
-                        # Let the user know progress is being made
-                        self.SetProgress(10)
-
-                        # Request the search from the server
-                        response = requests.get(models_url + '/search?q=' + self.search_txt.text())
-
-                        # Let the user know how far through the search we have progressed
-                        self.SetProgress(int(100 / (self.repos_tbl.rowCount() + 1)))
-                    except:
-                        self.results_num_lbl.setText("Search error")
-
-                        # Reset the progress bar so that it does not hang
-                        self.ResetProgress()
-
-                    # If there was a response, process it
-                    if response != None and response.status_code == 200:
-                        # Parse the JSON search results
-                        self.json_search_results = json.loads(response.content)
-
-                        # Let the user know how many search results there are
-                        num_results += len(self.json_search_results)
-                        if (num_results == 1):
-                            self.results_num_lbl.setText(str(num_results) + " result")
-                        else:
-                            self.results_num_lbl.setText(str(num_results) + " results")
+        for param in result['params'].keys():
+            param_info = result['params'][param]
+            if param_info['type'] != 'number':
+                continue
 
-                        # Add all the search results to the table
-                        for json_result in self.json_search_results:
-                            # If we are past the end of the table, we need to add a new row
-                            if results_row == self.results_tbl.rowCount():
-                                self.results_tbl.insertRow(results_row)
+            for direction in [1, -1]:
+                value = param_info['default'] + direction * param_info['step']
 
-                            # Temporary until the API is fixed
-                            if 'author' not in json_result:
-                                json_result['author'] = 'test'
+                # Stay within the range the spin box allows
+                if value < param_info['start'] or value > param_info['end']:
+                    continue
 
-                            # Make sure that we got the fields we need in the result
-                            if 'name' not in json_result or 'author' not in json_result or 'description' not in json_result:
-                                FreeCAD.Console.PrintError("OCCI ERROR: The response from the server did not have the required information.\r\n")
+                neighbours.append(self.PresetParameterValues(result, {param: value}))
 
-                                # Reset the progress bar so that it does not hang
-                                self.ResetProgress()
+        return neighbours
 
-                                return
 
-                            # The component name field
-                            cur_name_txt = QtGui.QLabel(json_result['name'])
-                            self.results_tbl.setCellWidget(results_row, 0, cur_name_txt)
+    def StartPrefetch(self, result):
+        """
+        Starts warming the STEP cache in the background with the variants of the
+        selected component that the user is likely to ask for next.
+        """
+        from functools import partial
+        from PySide.QtCore import QSettings, QThread
+        from Utils import Prefetcher
+        from Cache import IsOffline
 
-                            # The component author field
-                            cur_author_txt = QtGui.QLabel(json_result["author"])
-                            self.results_tbl.setCellWidget(results_row, 1, cur_author_txt)
+        # The previously selected component's variants are not needed anymore
+        for prefetcher in self.prefetchers:
+            prefetcher.Cancel()
 
-                            # The component description field
-                            cur_description_txt = QtGui.QLabel(json_result["description"])
-                            self.results_tbl.setCellWidget(results_row, 2, cur_description_txt)
+        if not self.prefetch_chk.isChecked() or IsOffline():
+            return
 
-                            # The hidden namespace field
-                            cur_namespace_txt = QtGui.QLabel(json_result["namespace"])
-                            self.results_tbl.setCellWidget(results_row, 3, cur_namespace_txt)
+        settings = QSettings("OCCI", "occi-freecad-plugin")
+        base_url = result['url'] + '/' + result['version']
 
-                            results_row += 1
-                    elif response.status_code == 404:
-                        FreeCAD.Console.PrintMessage("OCCI: The model was not found in the OCCI repository.\r\n")
-                    elif response.status_code == 500:
-                        FreeCAD.Console.PrintError("OCCI ERROR: There was an error on the server that prevented the model from being generated. Please contact that server's administrator.\r\n")
-                    else:
-                        self.results_num_lbl.setText("Search error")
+        # The variant that is loaded now comes first, followed by each of the presets. All of them are worked out
+        # by ParameterValues, the same way inserts work them out, so that the URLs match the ones asked for later.
+        download_urls = [self.BuildSTEPURLFromValues(base_url, self.PresetParameterValues(result, {}))]
+        for preset in self.presets.values():
+            download_urls.append(self.BuildSTEPURLFromValues(base_url, self.PresetParameterValues(result, preset)))
 
-        # Resize the table height to fit the contents appropriately
-        self.ResizeResultsTable()
+        # Optionally try the next step up and down for each number parameter as well
+        if settings.value('prefetch/neighbours', 'no') == 'yes':
+            for param_values in self.NeighbourParameterValues(result):
+                download_urls.append(self.BuildSTEPURLFromValues(base_url, param_values))
 
-        # Make sure all the columns are the correct size
-        self.results_tbl.resizeColumnToContents(0)
-        self.results_tbl.resizeColumnToContents(1)
-        self.results_tbl.resizeColumnToContents(2)
+        prefetcher = Prefetcher()
+        prefetcher.download_urls = list(dict.fromkeys(download_urls))
+        prefetcher.server_url = base_url.replace('/' + result['namespace'] + '/' + result['version'], '')
+        prefetcher.deadline = float(settings.value('jobs/deadline', 600.0))
+        prefetcher.max_concurrent = int(settings.value('prefetch/max_concurrent', 2))
+        prefetcher.max_bytes = int(float(settings.value('prefetch/max_mb', 50)) * 1024 * 1024)
+        prefetcher.max_rate = int(float(settings.value('prefetch/max_kb_per_second', 512)) * 1024)
+        prefetcher.finished.connect(partial(self.PrefetchDone, prefetcher))
 
-        # Give the user a flash of 100%
-        self.SetProgress(100)
+        # Keep a reference to the prefetcher so that it is not garbage collected while it runs
+        self.prefetchers.append(prefetcher)
+        prefetcher.start(QThread.LowestPriority)
 
-        # Let the user know that the request is finished
-        self.ResetProgress()
+
+    def PrefetchDone(self, prefetcher):
+        """
+        Called when a prefetcher has finished, so that it no longer needs to be kept alive.
+        """
+        if prefetcher in self.prefetchers:
+            self.prefetchers.remove(prefetcher)
 
 
-    def BuildSTEPURL(self, base_url):
+    def InstancingCheckBoxChanged(self):
         """
-        Builds the URL to grab the OCCI component STEP file with the
-        parameter values set.
+        The state of the instancing checkbox needs to be saved.
         """
-        from PySide import QtGui
+        from PySide.QtCore import QSettings
 
-        download_url = base_url
+        # Make sure this method has access to the settings
+        settings = QSettings("OCCI", "occi-freecad-plugin")
 
-        # Step through the parameters table, adding names and values
-        for row_index in range(0, self.params_tbl.rowCount()):
-            name_widget = self.params_tbl.cellWidget(row_index, 0)
-            value_widget = self.params_tbl.cellWidget(row_index, 2)
+        settings.setValue('ui/instancing', 'yes' if self.instancing_chk.isChecked() else 'no')
+        settings.sync()
 
-            # Check to see if we have reached the last line
-            if name_widget == None and value_widget == None:
-                break
-            else:
-                # If this is the first parameter, add the question mark
-                if row_index == 0:
-                    download_url += "?"
-                else:
-                    download_url += "&"
 
-                # We have to extract the value different ways from different controls
-                if isinstance(value_widget, QtGui.QSpinBox) or isinstance(value_widget, QtGui.QDoubleSpinBox):
-                    value = value_widget.value()
-                elif isinstance(value_widget, QtGui.QComboBox):
-                    value = value_widget.currentText()
-                elif isinstance(value_widget, QtGui.QCheckBox):
-                    value = str(value_widget.isChecked())
-                else:
-                    value = value_widget.text()
+    def PrefetchCheckBoxChanged(self):
+        """
+        The state of the prefetch checkbox needs to be saved.
+        """
+        from PySide.QtCore import QSettings
 
-                download_url += name_widget.text().split("(")[0].strip().replace(" ", "+") + "=" + str(value)
+        # Make sure this method has access to the settings
+        settings = QSettings("OCCI", "occi-freecad-plugin")
 
-        return download_url
+        settings.setValue('prefetch/enabled', 'yes' if self.prefetch_chk.isChecked() else 'no')
+        settings.sync()
 
 
     def FindSelectedComponent(self):
         """
         Finds the highlighted component in the components table and returns
-        the namespace of a match. Returns None for both if nothing no row is
-        highlighted.
+        the (repository, namespace, version) key of a match. Returns None if
+        no row is highlighted.
         """
-        namespace = None
+        key = None
 
         # Get any selected rows
-        selected_rows = self.results_tbl.selectedIndexes()
-        if (len(selected_rows) > 0):
+        selected_rows = self.results_tbl.selectionModel().selectedRows()
+        if (len(selected_rows) > 0 and self.search_results != None):
             # Simply grab the first selected row
-            selected_row = self.results_tbl.selectedIndexes()[0].row()
+            selected_row = selected_rows[0].row()
 
-            # If there is something in the row, extract data from the row
-            namespace_txt = self.results_tbl.cellWidget(selected_row, 3)
-            if namespace_txt != None:
-                namespace = namespace_txt.text()
+            # Look up which result is displayed in the row
+            key = self.search_results.KeyForRow(selected_row)
 
-        return namespace
+        return key
 
 
-    def FindMatchingJSON(self, namespace):
+    def FindMatchingJSON(self, key):
         """
-        Finds a match in the returned JSON result and returns it
+        Finds a match in the returned JSON results and returns it
         so that it can be queried.
         """
 
         # Make sure we have some search results loaded
-        # If there are search results, look for the matching object in them
-        if self.json_search_results != None:
-            # Keeps track of any units used
-            units_used = ""
-            default_preset = {}
-
-            # Look through all of the results
-            for result in self.json_search_results:
-                # See if we have a match
-                if namespace != None and result['namespace'] == namespace:
-                    return result
+        if self.search_results == None or key == None:
+            return None
 
-        # If no match was found, tell the caller by returning None
-        return None
+        # If no match was found, the store tells the caller by returning None
+        return self.search_results.Get(key)
 
 
-    def FindRepositoryRow(self, library, maintainer):
+    def FindRepositoryRow(self, repo_id):
         """
-        Finds a matching row in the repositories table.
+        Finds the row of a repository in the repositories table, which lists
+        the repositories in the same order as the registry.
         """
+        from Repositories import GetRegistry
 
-        # Step through each row of the repositories table
-        for row_index in range(0, self.repos_tbl.rowCount()):
-            # Try to get the controls in the table
-            lib_txt = self.repos_tbl.cellWidget(row_index, 1)
-            maint_txt = self.repos_tbl.cellWidget(row_index, 2)
-
-            # If the library control is None, there is no need to check it
-            if lib_txt == None or maint_txt == None:
-                break
-
-            # If the library and maintainer match, we assume we have a row match
-            if library == lib_txt.text().split(">")[1].split("<")[0] and maintainer == maint_txt.text():
-                return row_index
-
-        return None
+        return GetRegistry().Index(repo_id)
 
 
     def SetProgress(self, progress):
@@ -1026,40 +1614,106 @@ class OCCIWorkbench ( Workbench ):
         QtCore.QCoreApplication.processEvents()
 
 
+    def TrackJob(self, job_url, model_url, context):
+        """
+        Hands a long-running model generation job to the job manager so that the
+        model can be downloaded once it is ready. Identical requests share one job.
+        """
+        from PySide.QtCore import QSettings
+        from Utils import JobManager
+
+        # All jobs are tracked by a single scheduler thread
+        if self.job_manager == None:
+            self.job_manager = JobManager()
+            self.job_manager.jobProgress.connect(self.JobProgress)
+            self.job_manager.modelReady.connect(self.ModelReady)
+            self.job_manager.modelTimedOut.connect(self.ModelTimedOut)
+            self.job_manager.jobWarning.connect(self.JobWarning)
+
+        # If the same model is already being generated, just wait for that job
+        if model_url in self.job_contexts:
+            self.job_contexts[model_url].append(context)
+            return
+
+        self.job_contexts[model_url] = [context]
+        self.job_progress[model_url] = 0
+
+        # The request can still be cancelled while the model is being generated
+        self.UpdateCancelButton()
+
+        deadline = float(QSettings("OCCI", "occi-freecad-plugin").value('jobs/deadline', 600.0))
+
+        # A context that the job manager will never report back on must not be left waiting
+        if not self.job_manager.AddJob(job_url, model_url, deadline):
+            self.job_contexts.pop(model_url, None)
+            self.job_progress.pop(model_url, None)
+            if len(self.job_progress) == 0:
+                self.ResetProgress()
+            self.UpdateCancelButton()
+
+            FreeCAD.Console.PrintWarning("OCCI: The model is still being generated for an earlier request, please try again once it is ready.\r\n")
+
+
+    def JobProgress(self, model_url, progress):
+        """
+        Shows the combined progress of all the long-running jobs.
+        """
+        if model_url not in self.job_progress:
+            return
+
+        self.job_progress[model_url] = progress
+        self.SetProgress(int(sum(self.job_progress.values()) / len(self.job_progress)))
+
+
     def ModelReady(self, model_url):
         """
-        Called by the threaded worked when a long-running model is ready for download.
+        Called by the job manager when a long-running model is ready for download.
         """
 
         # Clear the progress bar of whatever progress we set while the job was running
-        self.ResetProgress()
+        self.job_progress.pop(model_url, None)
+        if len(self.job_progress) == 0:
+            self.ResetProgress()
+
+        # Download the newly finished component once for every request that was waiting on it
+        for context in self.job_contexts.pop(model_url, []):
+            # There is no need to download a model for an update that has been superseded
+            if self.IsStaleUpdate(context):
+                continue
 
-        # Load the newly finished component
-        self.LoadComponent()
+            self.StartDownload(model_url, context)
 
+        self.UpdateCancelButton()
 
-    def ModelTimedOut(self):
+
+    def ModelTimedOut(self, model_url):
         """
         Called when a model script takes too long to complete.
         """
 
         # Clear the progress bar of whatever progress we set while the job was running
-        self.ResetProgress()
+        self.job_progress.pop(model_url, None)
+        self.job_contexts.pop(model_url, None)
+        if len(self.job_progress) == 0:
+            self.ResetProgress()
+        self.UpdateCancelButton()
 
         FreeCAD.Console.PrintError("OCCI ERROR: Model execution has timed out because it took too long to complete.\r\n")
 
 
-    def DownloadModel(self, base_url):
+    def JobWarning(self, model_url, message):
         """
-        Handles the task of downloading an OCCI component.
+        Called when a poll of a model generation job did not go as expected.
         """
-        import tempfile
-        import requests
-        from PySide import QtCore
-        from Utils import Worker
+        FreeCAD.Console.PrintWarning(message)
 
-        is_bad_request = False
-        is_long_running = False
+
+    def DownloadModel(self, base_url, context):
+        """
+        Handles the task of downloading an OCCI component with the current
+        parameters. The download happens in the background, and the context
+        tells DownloadFinished what to do with the shape once it is ready.
+        """
 
         # Let the user know that something is going on
         self.SetProgress(5)
@@ -1067,73 +1721,128 @@ class OCCIWorkbench ( Workbench ):
         # Get the STEP download URL with current parameters
         download_url = self.BuildSTEPURL(base_url)
 
-        # We need a temporary file to download the STEP file into
-        self.temp_file = tempfile.NamedTemporaryFile(suffix='.step', delete=False, mode='wb')
+        self.StartDownload(download_url, context)
 
-        # Let the user know that something is going on
-        self.SetProgress(10)
-
-        # A progress indicator
-        progress = 10
-
-        # Request the STEP download from the OCCI server and account for large file size
-        with requests.get(download_url, stream=True, allow_redirects=False) as response:
-            if response.status_code == 200:
-                # with open(self.temp_file.name, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    # Let the user know that work is being done
-                    progress += 10
-                    self.SetProgress(progress)
-
-                    self.temp_file.write(chunk)
-            elif response.status_code == 307:
-                # Get the information for the selected component
-                namespace = self.FindSelectedComponent()
-                json_result = self.FindMatchingJSON(namespace)
-
-                # Distinguish between a model version redirect and a long-running redirect
-                if 'location' in response.headers:
-                    if '/job/' in response.headers['location']:
-                        FreeCAD.Console.PrintMessage("OCCI: Long running script detected. Processing will continue in the background.\r\n")
-
-                        # Figure out what the base server URL is so we can append the job location to it
-                        server_url = base_url.replace('/' + json_result['namespace'] + '/' + json_result['version'], '')
-                        job_url = server_url + response.headers['Location']
-
-                        # Set up the worker that will keep checking to see if the model is ready
-                        self.worker = Worker()
-                        self.worker.updateProgress.connect(self.SetProgress)
-                        self.worker.modelReady.connect(self.ModelReady)
-                        self.worker.modelTimedOut.connect(self.ModelTimedOut)
-                        self.worker.job_url = job_url
-                        self.worker.model_url = download_url
-                        self.worker.start()
-
-                        is_long_running = True
-            elif response.status_code == 404:
-                FreeCAD.Console.PrintError("OCCI ERROR: The model you have requested does not seem to exist on the server.\r\n")
-                is_bad_request = True
-            elif response.status_code == 500:
-                FreeCAD.Console.PrintError("OCCI ERROR: There was an error on the server that prevented the model from being downloaded. Please contact the server administrator.\r\n")
-                is_bad_request = True
-            else:
-                FreeCAD.Console.PrintError("OCCI ERROR: Status code unknown: " + str(response.status_code))
-                is_bad_request = True
 
-        # Give the user a flash of 100% complete
-        self.SetProgress(100)
+    def StartDownload(self, download_url, context):
+        """
+        Starts a worker that downloads and parses the model at the given URL.
+        Any number of downloads can be running at the same time.
+        """
+        from functools import partial
+        from Utils import DownloadWorker
 
-        # Let the user know that the request is done
-        self.ResetProgress()
+        # If the server is already generating this model, wait for that job instead of asking again
+        if download_url in self.job_contexts:
+            self.job_contexts[download_url].append(context)
+            return
 
-        # Close the file so that it can be opened somewhere else
-        self.temp_file.close()
+        worker = DownloadWorker()
+        worker.download_url = download_url
+        worker.context = context
+        worker.downloadProgress.connect(partial(self.DownloadProgress, worker))
+        worker.downloadFinished.connect(partial(self.DownloadFinished, worker))
+        worker.downloadFailed.connect(partial(self.DownloadFailed, worker))
+        worker.jobStarted.connect(partial(self.DownloadJobStarted, worker))
+        worker.finished.connect(partial(self.DownloadDone, worker))
+
+        # Keep a reference to the worker so that it is not garbage collected while it runs
+        self.downloads[worker] = 0
+        self.cancel_btn.setVisible(True)
+
+        worker.start()
+
+
+    def DownloadProgress(self, worker, progress):
+        """
+        Shows the combined progress of all the downloads that are in flight.
+        """
+        if worker not in self.downloads:
+            return
+
+        self.downloads[worker] = progress
+        self.SetProgress(int(sum(self.downloads.values()) / len(self.downloads)))
+
+
+    def DownloadFinished(self, worker, shape):
+        """
+        Called by a download worker when its model has been downloaded and parsed.
+        """
+        if worker.cancelled:
+            return
+
+        if worker.context['action'] == 'insert':
+            self.InsertComponentShape(worker.context, shape, worker.download_url)
+        elif worker.context['action'] == 'update':
+            self.ReplaceComponentShape(worker.context, shape, worker.download_url)
+
+
+    def DownloadFailed(self, worker, message):
+        """
+        Called by a download worker when its model could not be downloaded.
+        """
+        FreeCAD.Console.PrintError(message)
 
-        # Check to see if we have a long running or bad request
-        if is_long_running or is_bad_request:
-            return None
 
-        return self.temp_file.name
+    def DownloadJobStarted(self, worker, location):
+        """
+        Called by a download worker when the server has started a long-running
+        job to generate the model instead of returning it.
+        """
+
+        # A download that was cancelled does not need to wait for its model to be generated
+        if worker.cancelled:
+            return
+
+        FreeCAD.Console.PrintMessage("OCCI: Long running script detected. Processing will continue in the background.\r\n")
+
+        # Figure out what the base server URL is so we can append the job location to it
+        context = worker.context
+        server_url = context['base_url'].replace('/' + context['namespace'] + '/' + context['version'], '')
+        job_url = server_url + location
+
+        self.TrackJob(job_url, worker.download_url, context)
+
+
+    def DownloadDone(self, worker):
+        """
+        Called when a download worker's thread has finished, whether it succeeded or not.
+        """
+        if worker in self.downloads:
+            del self.downloads[worker]
+
+        # Let the user know that the requests are done once the last one finishes
+        if len(self.downloads) == 0:
+            self.UpdateCancelButton()
+            self.ResetProgress()
+
+
+    def UpdateCancelButton(self):
+        """
+        Shows the cancel button while there are downloads or model generation jobs that can be cancelled.
+        """
+        self.cancel_btn.setVisible(len(self.downloads) > 0 or len(self.job_contexts) > 0)
+
+
+    def CancelDownloads(self):
+        """
+        Cancels all of the downloads that are in flight, along with the requests
+        that are waiting for a model to be generated.
+        """
+        for worker in self.downloads.keys():
+            worker.Cancel()
+
+        # The models being generated would otherwise be downloaded and inserted once their jobs finish
+        for model_url in self.job_contexts.keys():
+            if self.job_manager != None:
+                self.job_manager.RemoveJob(model_url)
+        self.job_contexts.clear()
+        self.job_progress.clear()
+        self.UpdateCancelButton()
+        if len(self.downloads) == 0:
+            self.ResetProgress()
+
+        FreeCAD.Console.PrintMessage("OCCI: Model downloads have been cancelled.\r\n")
 
 
     def LoadComponent(self):
@@ -1142,69 +1851,93 @@ class OCCIWorkbench ( Workbench ):
         """
 
         # Get the information for the selected component
-        namespace = self.FindSelectedComponent()
-        json_result = self.FindMatchingJSON(namespace)
+        key = self.FindSelectedComponent()
+        json_result = self.FindMatchingJSON(key)
 
         # Make sure there was a row selected
-        if namespace != None:
-            step_file_path = self.DownloadModel(json_result['url'] + '/' + json_result['version'])
+        if json_result != None:
+            base_url = json_result['url'] + '/' + json_result['version']
+            ad = FreeCAD.activeDocument()
 
-            # If we did not get a path back, it was a bad or long-running request
-            if step_file_path == None:
+            # A component that is already in the document with the same parameters does not need to be downloaded again
+            if ad != None and self.instancing_chk.isChecked() and self.InsertComponentLink(ad, self.BuildSTEPURL(base_url)):
                 return
 
-            # If there is not an active document, add one
-            is_new_doc = False
+            context = {'action': 'insert', 'base_url': base_url, 'namespace': json_result['namespace'], 'version': json_result['version'], 'document': ad.Name if ad != None else None}
+            self.DownloadModel(base_url, context)
+        else:
+            FreeCAD.Console.PrintMessage("OCCI: Please select a component in order to configure and add it.\r\n")
+
+
+    def InsertComponentLink(self, ad, model_url):
+        """
+        Adds a link to the feature that already holds the component at the model
+        URL, if there is one. Returns whether a link was added.
+        """
+        from Cache import CanonicalURL
+        from Utils import MasterFeatures, AddComponentLink
+
+        master = MasterFeatures(ad).get(CanonicalURL(model_url))
+        if master == None:
+            return False
+
+        ad.openTransaction("Insert OCCI component")
+        AddComponentLink(ad, master)
+        ad.commitTransaction()
+        self.ScheduleRecompute(ad.Name)
+
+        return True
+
+
+    def InsertComponentShape(self, context, shape, model_url):
+        """
+        Adds a downloaded component to the active document.
+        """
+        from Utils import AddComponentFeature
+
+        # Use the document that was active when the component was requested, if it is still open
+        is_new_doc = False
+        ad = FreeCAD.listDocuments().get(context['document']) if context['document'] != None else None
+        if ad == None:
             ad = FreeCAD.activeDocument()
-            if ad == None:
-                FreeCAD.newDocument("untitled occi component")
-                ad = FreeCAD.activeDocument()
-                is_new_doc = True
-
-            # Add a feature object and load the step into it
-            name = namespace.replace('/', "_")
-            new_feature = ad.addObject("Part::Feature", name)
-            new_feature.Label = name
-            new_feature.ViewObject.ShapeColor = (0.0, 1.0, 0.5)
-            new_feature.ViewObject.Transparency = 0
-
-            # Load the STEP file into a FreeCAD Shape to display it
-            import Part
-            new_shape = Part.Shape()
-            new_shape.read(step_file_path)
-            new_feature.Shape = new_shape
-            ad.recompute()
 
-            # If we just created a document, then auto-fit everything
-            if is_new_doc:
-                Gui.activeDocument().activeView().viewIsometric()
-                Gui.SendMsgToActiveView("ViewFit")
+        # If there is not an active document, add one
+        if ad == None:
+            FreeCAD.newDocument("untitled occi component")
+            ad = FreeCAD.activeDocument()
+            is_new_doc = True
+
+        # An identical component may have been inserted while this one was downloading
+        if not is_new_doc and self.instancing_chk.isChecked() and self.InsertComponentLink(ad, model_url):
+            return
+
+        # Add a feature object and load the shape into it, as a single step that can be undone
+        identity = {'namespace': context['namespace'], 'version': context['version'], 'base_url': context['base_url'], 'model_url': model_url}
+        ad.openTransaction("Insert OCCI component")
+        AddComponentFeature(ad, identity, shape)
+        ad.commitTransaction()
 
+        # If we just created a document, then auto-fit everything
+        if is_new_doc:
+            ad.recompute()
+            Gui.activeDocument().activeView().viewIsometric()
+            Gui.SendMsgToActiveView("ViewFit")
         else:
-            FreeCAD.Console.PrintMessage("OCCI: Please select a component in order to configure and add it.\r\n")
+            # Inserts that arrive at about the same time share one recompute
+            self.ScheduleRecompute(ad.Name)
 
 
-    def UseCheckboxChanged(self, checkbox, state):
+    def UseCheckboxChanged(self, repo_id, state):
         """
         Called when a use checkbox on a repository entry is changed.
         """
-        from PySide.QtCore import QSettings
+        from Repositories import GetRegistry
 
-        # We need to extract the library and maintainer to match this checkbox to its repo row
-        library = checkbox.objectName().split("~")[0]
-        maintainer = checkbox.objectName().split("~")[1]
-
-        # Try to find the matching row index
-        row_index = self.FindRepositoryRow(library, maintainer)
+        # The registry saves the change once the user stops clicking
+        GetRegistry().SetUse(repo_id, self.use_checks[repo_id].isChecked())
 
-        # Make sure there was a match
-        if row_index != None:
-            # Pull the repo list dictionary from the settings
-            settings = QSettings("OCCI", "occi-freecad-plugin")
-            repo_list = settings.value('data/repo_list')
-            repo_list['list'][row_index]['use'] = checkbox.isChecked()
-            settings.setValue('data/repo_list', repo_list)
-            settings.sync()
+        # Only the repositories that are searched are probed
+        self.UpdateProberRepositories()
 
 
     def CheckBoxChanged(self):
@@ -1220,6 +1953,25 @@ class OCCIWorkbench ( Workbench ):
         settings.sync()
 
 
+    def OfflineCheckBoxChanged(self):
+        """
+        The state of the offline checkbox needs to be saved.
+        """
+        from PySide.QtCore import QSettings
+
+        # Make sure this method has access to the settings
+        settings = QSettings("OCCI", "occi-freecad-plugin")
+
+        settings.setValue('cache/offline', 'yes' if self.offline_chk.isChecked() else 'no')
+        settings.sync()
+
+        # There is no point probing the repositories while they are not being used
+        if self.offline_chk.isChecked():
+            self.StopProber()
+        elif self.probing_requested:
+            self.StartProber()
+
+
     def UpdateModelWithParameters(self):
         """
         Handles auto-updating of the model when a parameter is changed.
@@ -1227,14 +1979,20 @@ class OCCIWorkbench ( Workbench ):
 
         # Make sure the auto-update checkbox is checked
         if self.auto_update_chk.isChecked():
-            self.UpdateComponent()
+            # Restarting the timer means only the last change in a burst triggers an update
+            self.update_timer.start()
 
 
     def UpdateComponent(self):
         """
         Handles the task of updating a component that is already in the view.
+        Any update of the same component that is still in flight is superseded
+        by this one.
         """
 
+        # A pending auto update is covered by this update
+        self.update_timer.stop()
+
         # If there is no active document, there is nothing to update
         ad = FreeCAD.activeDocument()
         if ad == None:
@@ -1242,46 +2000,109 @@ class OCCIWorkbench ( Workbench ):
             return
 
         # Get the information for the selected component
-        namespace = self.FindSelectedComponent()
-        json_result = self.FindMatchingJSON(namespace)
+        key = self.FindSelectedComponent()
+        json_result = self.FindMatchingJSON(key)
 
         # Make sure there was a row selected
-        if namespace != None:
-            step_file_path = self.DownloadModel(json_result['url'] + '/' + json_result['version'])
+        if json_result != None:
+            base_url = json_result['url'] + '/' + json_result['version']
+            context = {'action': 'update', 'base_url': base_url, 'namespace': json_result['namespace'], 'version': json_result['version'], 'label': json_result['namespace'].replace('/', '_'), 'document': ad.Name}
 
-            # If we did not get a path back, it was a bad or long-running request
-            if step_file_path == None:
-                return
+            # Number the update so that an older update can never be applied over this one
+            self.update_sequence += 1
+            context['sequence'] = self.update_sequence
+            target = (context['document'], context['label'])
+            self.latest_updates[target] = context['sequence']
 
-            # Find the the matching object in the active document
-            feature = ad.getObjectsByLabel(namespace.replace('/', '_'))[0]
-            if feature != None:
-                import Part
-                new_shape = Part.Shape()
-                new_shape.read(step_file_path)
-                feature.Shape = new_shape
-                ad.recompute()
+            # Any update of the same component still in flight is now stale
+            for worker in self.downloads.keys():
+                if worker.context['action'] == 'update' and (worker.context['document'], worker.context['label']) == target:
+                    worker.Cancel()
 
+            self.DownloadModel(base_url, context)
 
-    def ClearResultsTableHighlights(self):
+
+    def IsStaleUpdate(self, context):
+        """
+        Returns True if the context is for an update that has been superseded by a newer one.
+        """
+        if context['action'] != 'update':
+            return False
+
+        target = (context['document'], context['label'])
+
+        return context['sequence'] < self.latest_updates.get(target, 0)
+
+
+    def ReplaceComponentShape(self, context, shape, model_url):
+        """
+        Replaces the shape of a component that is already in the active document.
+        The replacement is applied along with any others that arrive at about
+        the same time.
+        """
+
+        # A newer update of this component has been requested, so this shape is out of date
+        if self.IsStaleUpdate(context):
+            return
+
+        # The document may have been closed while the model was downloading
+        ad = FreeCAD.listDocuments().get(context['document'])
+        if ad == None:
+            return
+
+        # Find the the matching object in the active document
+        features = ad.getObjectsByLabel(context['label'])
+        if len(features) > 0:
+            identity = {'namespace': context['namespace'], 'version': context['version'], 'base_url': context['base_url'], 'model_url': model_url}
+            self.ScheduleRecompute(ad.Name)
+            self.pending_documents[ad.Name][features[0].Name] = (shape, identity)
+
+
+    def ScheduleRecompute(self, document_name):
+        """
+        Makes sure that a document is recomputed once the components that are
+        arriving at about the same time have all been applied.
+        """
+        if document_name not in self.pending_documents:
+            self.pending_documents[document_name] = {}
+
+        self.recompute_timer.start()
+
+
+    def ApplyPendingChanges(self):
         """
-        Clears the table of highlights because we use a manual highlight method
-        to avoid using a custom renderer.
+        Applies all of the shape replacements that are waiting, in one undo step
+        for each document, and recomputes each document once.
         """
+        from Utils import SetComponentIdentity, SetFeatureShape
+
+        pending_documents = self.pending_documents
+        self.pending_documents = {}
+
+        for document_name, changes in pending_documents.items():
+            # The document may have been closed in the meantime
+            ad = FreeCAD.listDocuments().get(document_name)
+            if ad == None:
+                continue
+
+            if len(changes) > 0:
+                ad.openTransaction("Update OCCI components")
+                for feature_name, (shape, identity) in changes.items():
+                    feature = ad.getObject(feature_name)
+                    if feature != None:
+                        SetFeatureShape(feature, shape)
+                        SetComponentIdentity(feature, identity)
+                ad.commitTransaction()
 
-        # Walk through all the cells
-        for row_index in range(0, self.results_tbl.rowCount()):
-            # Reset the first column's highlight
-            if self.results_tbl.cellWidget(row_index, 0) != None:
-                self.results_tbl.cellWidget(row_index, 0).setStyleSheet("background-color:#FFFFFF")
+            ad.recompute()
 
-            # Reset the second column's highlight
-            if self.results_tbl.cellWidget(row_index, 1) != None:
-                self.results_tbl.cellWidget(row_index, 1).setStyleSheet("background-color:#FFFFFF")
 
-            # Reset the third column's highlight
-            if self.results_tbl.cellWidget(row_index, 2) != None:
-                self.results_tbl.cellWidget(row_index, 2).setStyleSheet("background-color:#FFFFFF")
+    def ClearResultsTableHighlights(self):
+        """
+        Clears the table of highlights. The highlight is kept in the results
+        model so that it is drawn without a custom renderer.
+        """
+        self.results_model.SetHighlightedRow(None)
 
 
     def ResizeReposTable(self):
@@ -1318,34 +2139,26 @@ class OCCIWorkbench ( Workbench ):
         self.ToggleRepoWidgets()
 
 
-    def RemoveRepository(self, button):
+    def RemoveRepository(self, repo_id):
         """
         Handles the removal of a repository from the repositories table.
         """
-        from PySide.QtCore import QSettings
-
-        # Retrieve the row index
-        if button.objectName() != None:
-            library = button.objectName().split("~")[0]
-            maintainer = button.objectName().split("~")[1]
+        from Repositories import GetRegistry
 
-            # Try to find the matching row index
-            row_index = self.FindRepositoryRow(library, maintainer)
-
-            # Remove the row from the table and the array of buttons
-            if row_index != None:
-                self.repos_tbl.removeRow(row_index)
-                self.remove_buttons.pop(row_index)
-
-                # Remove the matching setting
-                settings = QSettings("OCCI", "occi-freecad-plugin")
-                repo_list = settings.value('data/repo_list')
-                repo_list['list'].pop(row_index)
-                settings.setValue('data/repo_list', repo_list)
-                settings.sync()
+        # Try to find the matching row index
+        row_index = self.FindRepositoryRow(repo_id)
 
-                # Make sure the table is the appropriate height
-                self.ResizeReposTable()
+        # Remove the row from the table, its controls and the registry
+        if row_index != None:
+            self.repos_tbl.removeRow(row_index)
+            self.use_checks.pop(repo_id)
+            self.status_labels.pop(repo_id)
+            self.remove_buttons.pop(repo_id)
+            GetRegistry().Remove(repo_id)
+            self.UpdateProberRepositories()
+
+            # Make sure the table is the appropriate height
+            self.ResizeReposTable()
 
 
     def RemovePreviousPresets(self):
@@ -1368,14 +2181,19 @@ class OCCIWorkbench ( Workbench ):
         conducted or new parameter selected.
         """
         self.ClearResultsTableHighlights()
-        self.selected_comp_lbl.setText("No component selected")
-        self.model_info_lbl.setText("No model loaded")
-        self.source_info_lbl.setText("No model loaded")
-        self.presets_info_lbl.setVisible(True)
-        self.params_tbl.clearContents()  # Clear any previous parameter table contents
-        self.RemovePreviousPresets()  # Clear any previous parameters from the table
+
+        # Nothing has been shown yet if the configuration section has not been built
+        if self.params_tbl != None:
+            self.selected_comp_lbl.setText("No component selected")
+            self.model_info_lbl.setText("No model loaded")
+            self.source_info_lbl.setText("No model loaded")
+            self.presets_info_lbl.setVisible(True)
+            self.params_tbl.clearContents()  # Clear any previous parameter table contents
+            self.RemovePreviousPresets()  # Clear any previous parameters from the table
+
         self.presets_controls.clear()
         self.presets.clear()
+        self.param_rows.clear()
 
 
     def HandlePresetButton(self, button):
@@ -1386,41 +2204,46 @@ class OCCIWorkbench ( Workbench ):
         # We stored the key to the preset in the object name of the button
         preset_key = button.objectName()
 
-        # Get the preset values back out of global storage and step through each one
-        for key in self.presets[preset_key].keys():
-            # Search the parameters table to look for a matching name
-            for row_index in range(0, self.params_tbl.rowCount()):
-                # Get the widget and protect against a blank row
-                widget = self.params_tbl.cellWidget(row_index, 0)
-                if widget == None:
-                    break
-
-                # The parameter name
-                param_name = widget.text().split("(")[0].strip()
-
-                # If there is a match, set the corresponding value control
-                if param_name == key:
-                    # We have to pull find the parameter type data so we know how to handle the control
-                    namespace = self.FindSelectedComponent()
-                    result = self.FindMatchingJSON(namespace)
-                    if result != None:
-                        param_type = result['params'][param_name]['type']
-
-                    # The value widget should be in the third column (index starts at 0)
-                    value_widget = self.params_tbl.cellWidget(row_index, 2)
-
-                    # Set the value differently for text vs a number
-                    if param_type == "text":
-                        value_widget.setText(self.presets[preset_key][key])
-                    elif param_type == "boolean":
-                        value_widget.setChecked(self.presets[preset_key][key])
-                    elif param_type == "options":
-                        value_widget.setCurrentText(self.presets[preset_key][key])
-                    else:
-                        value_widget.setValue(self.presets[preset_key][key])
-
-                    # We found what we need, exit the loop
-                    break
+        self.ApplyParameterValues(self.presets[preset_key])
+
+
+    def ApplyParameterValues(self, values):
+        """
+        Sets any number of parameter controls at once from a dict of values keyed
+        by parameter. The controls do not signal while they are being set, so
+        only one update happens for the whole set instead of one per parameter.
+        """
+        from PySide import QtGui
+
+        changed = False
+        for key, value in values.items():
+            if key not in self.param_rows:
+                continue
+
+            row_index, value_widget, param_info = self.param_rows[key]
+            previous_value = self.WidgetValue(value_widget)
+
+            value_widget.blockSignals(True)
+            try:
+                # Set the value differently for each kind of control
+                if isinstance(value_widget, QtGui.QSpinBox):
+                    value_widget.setValue(int(value))
+                elif isinstance(value_widget, QtGui.QDoubleSpinBox):
+                    value_widget.setValue(float(value))
+                elif isinstance(value_widget, QtGui.QCheckBox):
+                    value_widget.setChecked(value)
+                elif isinstance(value_widget, QtGui.QComboBox):
+                    value_widget.setCurrentText(str(value))
+                else:
+                    value_widget.setText(str(value) if value != None else "")
+            finally:
+                value_widget.blockSignals(False)
+
+            changed = changed or self.WidgetValue(value_widget) != previous_value
+
+        # The whole set of values is a single change to the model
+        if changed:
+            self.UpdateModelWithParameters()
 
 
     def ResizeParamsTable(self):
@@ -1469,8 +2292,8 @@ class OCCIWorkbench ( Workbench ):
         from functools import partial
         from PySide import QtGui, QtCore
 
-        # The stylesheet of the highlighted row
-        highlighted_row_style = "background-color:#AAAAAA;"
+        # The parameters are shown in the configuration section, even while it is collapsed
+        self.EnsureConfigSection()
 
         # Reset the table to only having one row
         self.params_tbl.setRowCount(1)
@@ -1479,22 +2302,15 @@ class OCCIWorkbench ( Workbench ):
         self.ClearPreviousComponentResults()
 
         # Make sure there really is some sort of selection
-        if len(self.results_tbl.selectedRanges()) > 0:
-            # Get the selected row so we can highlight/use it
-            row_index = self.results_tbl.selectedRanges()[0].topRow()
-
-            # Highlight rows manually only if they have widgets in them
-            if self.results_tbl.cellWidget(row_index, 0) != None:
-                self.results_tbl.cellWidget(row_index, 0).setStyleSheet(highlighted_row_style)
-            if self.results_tbl.cellWidget(row_index, 1) != None:
-                self.results_tbl.cellWidget(row_index, 1).setStyleSheet(highlighted_row_style)
-            if self.results_tbl.cellWidget(row_index, 2) != None:
-                self.results_tbl.cellWidget(row_index, 2).setStyleSheet(highlighted_row_style)
+        selected_rows = self.results_tbl.selectionModel().selectedRows()
+        if len(selected_rows) > 0:
+            # Highlight the selected row in the model
+            self.results_model.SetHighlightedRow(selected_rows[0].row())
 
         # Make sure we have some search results loaded
         # If there are search results, look for the matching object in them
-        namespace = self.FindSelectedComponent()
-        result = self.FindMatchingJSON(namespace)
+        key = self.FindSelectedComponent()
+        result = self.FindMatchingJSON(key)
         if result != None:
             units_used = ""
             default_preset = {}
@@ -1533,16 +2349,16 @@ class OCCIWorkbench ( Workbench ):
                 if result['params'][param]['type'] == 'number' and isinstance(result['params'][param]['default'], int):
                     # An integer spin number box
                     value_widget = QtGui.QSpinBox()
-                    value_widget.setValue(int(result['params'][param]['default']))
                     value_widget.setRange(int(result['params'][param]['start']), int(result['params'][param]['end']))
+                    value_widget.setValue(int(result['params'][param]['default']))
                     value_widget.setSingleStep(int(result['params'][param]['step']))
                     value_widget.textChanged.connect(self.UpdateModelWithParameters)
                     self.params_tbl.setCellWidget(row_index, 2, value_widget)
                 elif result['params'][param]['type'] == 'number' and isinstance(result['params'][param]['default'], float):
                     # A float spin number box
                     value_widget = QtGui.QDoubleSpinBox()
-                    value_widget.setValue(float(result['params'][param]['default']))
                     value_widget.setRange(float(result['params'][param]['start']), float(result['params'][param]['end']))
+                    value_widget.setValue(float(result['params'][param]['default']))
                     value_widget.setSingleStep(float(result['params'][param]['step']))
                     value_widget.textChanged.connect(self.UpdateModelWithParameters)
                     self.params_tbl.setCellWidget(row_index, 2, value_widget)
@@ -1559,6 +2375,11 @@ class OCCIWorkbench ( Workbench ):
                     value_widget = QtGui.QComboBox()
                     for option in result['params'][param]['options']:
                         value_widget.addItem(option)
+
+                    # Start on the default option, the same as the presets and batch inserts assume
+                    default_index = value_widget.findText(str(result['params'][param].get('default')))
+                    if default_index >= 0:
+                        value_widget.setCurrentIndex(default_index)
                     value_widget.currentIndexChanged.connect(self.UpdateModelWithParameters)
                     self.params_tbl.setCellWidget(row_index, 2, value_widget)
                 elif result['params'][param]['type'] == 'boolean':
@@ -1568,6 +2389,12 @@ class OCCIWorkbench ( Workbench ):
                 else:
                     FreeCAD.Console.PrintError("OCCI ERROR: Parameter type " + result['params'][param]['type'] + " not recognized")
 
+                # Index the control by both the parameter key and its name so that presets can find it directly
+                value_widget = self.params_tbl.cellWidget(row_index, 2)
+                if value_widget != None:
+                    self.param_rows[param] = (row_index, value_widget, result['params'][param])
+                    self.param_rows[result['params'][param]['name'].strip()] = (row_index, value_widget, result['params'][param])
+
                 row_index += 1
 
             # Let the user know what was selected
@@ -1604,6 +2431,9 @@ class OCCIWorkbench ( Workbench ):
 
                 self.presets_layout.addWidget(self.presets_controls[-1], row, col, 1, 1, QtCore.Qt.AlignCenter)
 
+            # Warm the cache with the presets so that switching between them is instant
+            self.StartPrefetch(result)
+
         # Resize the params table to the correct height
         self.ResizeParamsTable()
 
@@ -8,12 +8,10 @@ import FreeCAD, FreeCADGui
 class CmdReset:
     def Activated(self):
         from PySide import QtGui
-        from PySide.QtCore import QSettings
+        from Repositories import GetRegistry
 
-        # Reset the dictionary of repos in the settings
-        settings = QSettings("OCCI", "occi-freecad-plugin")
-        settings.setValue('data/repo_list', {'list': [{'use': True, 'library': 'OCCI test', 'maintainer': 'Mark van der Net', 'models_url': 'https://occi.archiyou.nl'}]})
-        settings.sync()
+        # Reset the list of repos, which is saved straight away
+        GetRegistry().Reset()
 
         QtGui.QMessageBox.information(None, "OCCI Repository Reset", "The list of OCCI repositories has been reset. Please restart this workbench to have the changes take effect.")
 
@@ -27,3 +25,90 @@ class CmdReset:
 
 
 FreeCADGui.addCommand('OCCI_Reset_Repos', CmdReset())
+
+
+class CmdBatchInsert:
+    def Activated(self):
+        from PySide import QtGui
+        from Batch import ReadManifest, ManifestError, BatchInserter
+
+        # Let the user pick the bill of materials to insert
+        path = QtGui.QFileDialog.getOpenFileName(None, "Open OCCI Manifest", "", "Manifests (*.csv *.json)")[0]
+        if path == "":
+            return
+
+        try:
+            entries = ReadManifest(path)
+        except ManifestError as error:
+            QtGui.QMessageBox.warning(None, "OCCI Batch Insert", str(error))
+            return
+
+        BatchInserter(entries).Start()
+
+
+    def IsActive(self):
+        return True
+
+
+    def GetResources(self):
+        return {'Pixmap': 'freecad', 'MenuText': 'Batch Insert...', 'ToolTip': 'Inserts all of the components listed in a CSV or JSON bill of materials'}
+
+
+FreeCADGui.addCommand('OCCI_Batch_Insert', CmdBatchInsert())
+
+
+class CmdUpdateAll:
+    def Activated(self):
+        from PySide import QtGui
+        from Batch import OCCIFeatures, ComponentUpdater
+
+        ad = FreeCAD.activeDocument()
+        features = OCCIFeatures(ad)
+        if len(features) == 0:
+            QtGui.QMessageBox.information(None, "OCCI Update All Components", "There are no OCCI components in the active document.")
+            return
+
+        ComponentUpdater(ad, features).Start()
+
+
+    def IsActive(self):
+        return FreeCAD.activeDocument() != None
+
+
+    def GetResources(self):
+        return {'Pixmap': 'freecad', 'MenuText': 'Update All Components', 'ToolTip': 'Refreshes every OCCI component in the active document in one pass'}
+
+
+FreeCADGui.addCommand('OCCI_Update_All', CmdUpdateAll())
+
+
+class CmdModelCache:
+    def Activated(self):
+        from PySide import QtGui
+        from Cache import GetStepCache, GetShapeCache
+
+        # Let the user know how well the cache is working before offering to clear it
+        step_cache = GetStepCache()
+        stats = step_cache.Stats()
+        ret = QtGui.QMessageBox.question(None, "OCCI Model Cache",
+            "Cached models: " + str(stats['entries']) + "\n" +
+            "Cache size: " + "{:.1f}".format(stats['size'] / (1024 * 1024)) + " MB\n" +
+            "Cache hits this session: " + str(stats['hits']) + "\n" +
+            "Cache misses this session: " + str(stats['misses']) + "\n\n" +
+            "Do you want to clear the model cache?",
+            QtGui.QMessageBox.Yes | QtGui.QMessageBox.No, QtGui.QMessageBox.No)
+
+        if ret == QtGui.QMessageBox.Yes:
+            step_cache.Clear()
+            GetShapeCache().Clear()
+
+
+    def IsActive(self):
+        return True
+
+
+    def GetResources(self):
+        return {'Pixmap': 'freecad', 'MenuText': 'Model Cache', 'ToolTip': 'Shows the model cache statistics and allows the cache to be cleared'}
+
+
+FreeCADGui.addCommand('OCCI_Model_Cache', CmdModelCache())
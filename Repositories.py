@@ -0,0 +1,229 @@
+from collections import OrderedDict
+
+# The repositories the plugin starts out with, and goes back to when the list is reset
+DEFAULT_REPOSITORIES = [{'use': True, 'library': 'OCCI test', 'maintainer': 'Mark van der Net', 'models_url': 'https://occi.archiyou.nl'}]
+
+# How long changes are collected before they are written to the settings
+SAVE_DELAY_MS = 500
+
+# The plugin-wide registry, created on first use
+registry = None
+
+
+class Repository:
+    """
+    A single OCCI repository the user has added.
+    """
+
+    def __init__(self, repo_id, library, maintainer, models_url, use=True):
+        self.repo_id = repo_id  # Stays the same for as long as the repository is in the list
+        self.library = library  # The name of the library the repository serves
+        self.maintainer = maintainer  # Who curates the library
+        self.models_url = models_url  # The base URL of the repository's API
+        self.use = use  # Whether the repository is included in searches
+
+    def ToSetting(self):
+        """
+        Returns the repository in the form it is stored in the settings.
+        """
+        return {'id': self.repo_id, 'use': self.use, 'library': self.library, 'maintainer': self.maintainer, 'models_url': self.models_url}
+
+
+class RepositoryRegistry:
+    """
+    The list of repositories the user has added. The copy in memory is the
+    one that is used, and changes to it are written to the settings a short
+    time later, so that a burst of changes is saved all at once. Must only be
+    used from the GUI thread.
+    """
+
+    def __init__(self):
+        from PySide import QtCore
+
+        self.repositories = OrderedDict()  # Maps each repository ID to its repository, in the order they were added
+        self.names = {}  # Maps each (library, maintainer) to its repository ID
+        self.urls = {}  # Maps each models URL to its repository ID
+        self.next_id = 1  # The ID given to the next repository that is added
+
+        # Saving waits for changes to settle down
+        self.save_timer = QtCore.QTimer()
+        self.save_timer.setSingleShot(True)
+        self.save_timer.setInterval(SAVE_DELAY_MS)
+        self.save_timer.timeout.connect(self.Save)
+
+        # Anything still waiting is saved before FreeCAD closes
+        app = QtCore.QCoreApplication.instance()
+        if app != None:
+            app.aboutToQuit.connect(self.Flush)
+
+        self.Load()
+
+    def Load(self):
+        """
+        Reads the list of repositories from the settings, replacing the one in memory.
+        """
+        from PySide.QtCore import QSettings
+
+        settings = QSettings("OCCI", "occi-freecad-plugin")
+        repo_list = settings.value('data/repo_list')
+        if repo_list == None:
+            repo_list = {'list': DEFAULT_REPOSITORIES}
+
+        self.repositories.clear()
+        self.names.clear()
+        self.urls.clear()
+        self.next_id = int(repo_list.get('next_id', 1))
+
+        # Lists saved before repositories had IDs are given them now
+        needs_ids = False
+        for entry in repo_list['list']:
+            if 'id' in entry:
+                repo_id = int(entry['id'])
+            else:
+                repo_id = None
+                needs_ids = True
+
+            self.Insert(repo_id, entry['library'], entry['maintainer'], entry['models_url'], entry['use'] in [True, 'true'])
+
+        if needs_ids:
+            self.Changed()
+
+    def Insert(self, repo_id, library, maintainer, models_url, use):
+        """
+        Adds a repository to the lookups, giving it a new ID if it does not have one.
+        """
+        if repo_id == None or repo_id in self.repositories:
+            repo_id = self.next_id
+
+        self.next_id = max(self.next_id, repo_id + 1)
+
+        repository = Repository(repo_id, library, maintainer, models_url, use)
+        self.repositories[repo_id] = repository
+        self.names[(library, maintainer)] = repo_id
+        self.urls[models_url] = repo_id
+
+        return repository
+
+    def Get(self, repo_id):
+        """
+        Returns the repository with the given ID, or None if there is none.
+        """
+        return self.repositories.get(repo_id)
+
+    def Find(self, library, maintainer):
+        """
+        Returns the repository serving the library from the maintainer, or None if there is none.
+        """
+        repo_id = self.names.get((library, maintainer))
+
+        return self.repositories[repo_id] if repo_id != None else None
+
+    def FindURL(self, models_url):
+        """
+        Returns the repository at the models URL, or None if there is none.
+        """
+        repo_id = self.urls.get(models_url)
+
+        return self.repositories[repo_id] if repo_id != None else None
+
+    def All(self):
+        """
+        Returns all of the repositories, in the order they were added.
+        """
+        return list(self.repositories.values())
+
+    def Index(self, repo_id):
+        """
+        Returns the position of a repository in the list, or None if it is not in it.
+        """
+        if repo_id not in self.repositories:
+            return None
+
+        return list(self.repositories.keys()).index(repo_id)
+
+    def EnabledURLs(self):
+        """
+        Returns the models URLs of all the repositories the user wants to search.
+        """
+        return [repository.models_url for repository in self.repositories.values() if repository.use]
+
+    def Add(self, library, maintainer, models_url):
+        """
+        Adds a repository and returns it, or returns None if the library from
+        the maintainer is already in the list.
+        """
+        if (library, maintainer) in self.names:
+            return None
+
+        repository = self.Insert(None, library, maintainer, models_url, True)
+        self.Changed()
+
+        return repository
+
+    def Remove(self, repo_id):
+        """
+        Removes a repository from the list.
+        """
+        repository = self.repositories.pop(repo_id, None)
+        if repository != None:
+            del self.names[(repository.library, repository.maintainer)]
+            self.urls.pop(repository.models_url, None)
+            self.Changed()
+
+    def SetUse(self, repo_id, use):
+        """
+        Sets whether a repository is included in searches.
+        """
+        repository = self.repositories.get(repo_id)
+        if repository != None and repository.use != use:
+            repository.use = use
+            self.Changed()
+
+    def Reset(self):
+        """
+        Replaces the list with the default repositories and saves it straight away.
+        """
+        self.repositories.clear()
+        self.names.clear()
+        self.urls.clear()
+        for entry in DEFAULT_REPOSITORIES:
+            self.Insert(None, entry['library'], entry['maintainer'], entry['models_url'], entry['use'])
+
+        self.Changed()
+        self.Flush()
+
+    def Changed(self):
+        """
+        Schedules the list to be saved once the changes settle down.
+        """
+        self.save_timer.start()
+
+    def Flush(self):
+        """
+        Saves the list now if there are changes waiting to be saved.
+        """
+        if self.save_timer.isActive():
+            self.save_timer.stop()
+            self.Save()
+
+    def Save(self):
+        """
+        Writes the whole list to the settings.
+        """
+        from PySide.QtCore import QSettings
+
+        settings = QSettings("OCCI", "occi-freecad-plugin")
+        settings.setValue('data/repo_list', {'list': [repository.ToSetting() for repository in self.repositories.values()], 'next_id': self.next_id})
+        settings.sync()
+
+
+def GetRegistry():
+    """
+    Returns the plugin-wide repository registry, loading it the first time.
+    """
+    global registry
+
+    if registry == None:
+        registry = RepositoryRegistry()
+
+    return registry
@@ -0,0 +1,161 @@
+from PySide import QtCore, QtGui
+
+
+class ResultStore:
+    """
+    Holds the search results from every repository that was searched, keyed by
+    (repository, namespace, version) so that a result can be found directly
+    instead of scanning the whole list.
+    """
+
+    def __init__(self):
+        self.results = {}  # Maps each result key to the JSON result from the server
+        self.row_keys = []  # The key of each row in the results table, in display order
+
+    def Clear(self):
+        """
+        Removes all of the results so that a new search can be started.
+        """
+        self.results.clear()
+        self.row_keys.clear()
+
+    def Key(self, repository, json_result):
+        """
+        Returns the key that a result from the given repository is stored under.
+        """
+        return (repository, json_result['namespace'], json_result.get('version'))
+
+    def Contains(self, key):
+        """
+        Returns whether a result with the given key has already been added.
+        """
+        return key in self.results
+
+    def Add(self, repository, json_result):
+        """
+        Adds a result from the given repository and returns its key. None is
+        returned if the same component has already been added.
+        """
+        key = self.Key(repository, json_result)
+
+        # A repository can return the same component more than once, but it should only be listed once
+        if key in self.results:
+            return None
+
+        self.results[key] = json_result
+        self.row_keys.append(key)
+
+        return key
+
+    def Get(self, key):
+        """
+        Returns the JSON result matching the key, or None if there is no match.
+        """
+        return self.results.get(key)
+
+    def KeyForRow(self, row):
+        """
+        Returns the key of the result displayed in the given results table row.
+        """
+        if row < 0 or row >= len(self.row_keys):
+            return None
+
+        return self.row_keys[row]
+
+    def __len__(self):
+        return len(self.row_keys)
+
+
+class ResultsTableModel(QtCore.QAbstractTableModel):
+    """
+    Table model that displays the results held in a ResultStore. The view only
+    asks for the rows that are visible, so no widgets need to be created per
+    result, and the highlighted row is kept here rather than in stylesheets.
+    """
+
+    columns = ['name', 'author', 'description']  # The result fields shown in each column
+    highlight_color = "#AAAAAA"  # The background color of the highlighted row
+
+    def __init__(self, store):
+        QtCore.QAbstractTableModel.__init__(self)
+
+        self.store = store  # The results being displayed
+        self.highlighted_row = None  # The row of the selected component, if there is one
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        # This is a flat table, so only the root has rows
+        if parent.isValid():
+            return 0
+
+        return len(self.store)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+
+        return len(self.columns)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        if role == QtCore.Qt.DisplayRole or role == QtCore.Qt.ToolTipRole:
+            json_result = self.store.Get(self.store.KeyForRow(index.row()))
+            return str(json_result.get(self.columns[index.column()], ""))
+        elif role == QtCore.Qt.BackgroundRole and index.row() == self.highlighted_row:
+            return QtGui.QBrush(QtGui.QColor(self.highlight_color))
+
+        return None
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return self.columns[section]
+
+        return QtCore.QAbstractTableModel.headerData(self, section, orientation, role)
+
+    def AppendResults(self, repository, json_results):
+        """
+        Adds a repository's results to the end of the table, skipping any that
+        are already listed, and returns the number of rows that were added.
+        """
+
+        # The view has to be told how many rows are coming before they are added
+        new_results = []
+        new_keys = set()
+        for json_result in json_results:
+            key = self.store.Key(repository, json_result)
+            if not self.store.Contains(key) and key not in new_keys:
+                new_keys.add(key)
+                new_results.append(json_result)
+
+        if len(new_results) == 0:
+            return 0
+
+        first_row = len(self.store)
+        self.beginInsertRows(QtCore.QModelIndex(), first_row, first_row + len(new_results) - 1)
+        for json_result in new_results:
+            self.store.Add(repository, json_result)
+        self.endInsertRows()
+
+        return len(new_results)
+
+    def Clear(self):
+        """
+        Removes all of the results from the table.
+        """
+        self.beginResetModel()
+        self.store.Clear()
+        self.highlighted_row = None
+        self.endResetModel()
+
+    def SetHighlightedRow(self, row):
+        """
+        Highlights the given row, or removes the highlight if row is None.
+        """
+        previous_row = self.highlighted_row
+        self.highlighted_row = row
+
+        # Only the rows whose highlight changed need to be redrawn
+        for changed_row in [previous_row, row]:
+            if changed_row != None and changed_row < len(self.store):
+                self.dataChanged.emit(self.index(changed_row, 0), self.index(changed_row, len(self.columns) - 1))
@@ -1,57 +1,1313 @@
+import os
+import re
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from PySide import QtCore
-import requests
 
-class Worker(QtCore.QThread):
+
+# The feature properties that record which component a feature was made from, and the identity keys they hold
+IDENTITY_PROPERTIES = [('OCCI_Namespace', 'namespace'), ('OCCI_Version', 'version'), ('OCCI_BaseURL', 'base_url'), ('OCCI_ModelURL', 'model_url')]
+
+
+def RetryAfterSeconds(response):
     """
-    Threaded worker for handling long-running model generation.
+    Returns the number of seconds the server asked the client to wait in a
+    Retry-After header, or None if it did not ask.
     """
+    from email.utils import parsedate_to_datetime
+    from datetime import datetime, timezone
+
+    retry_after = response.headers.get('Retry-After')
+    if retry_after == None:
+        return None
+
+    # The header can either be a number of seconds or an HTTP date
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+
+    try:
+        retry_date = parsedate_to_datetime(retry_after)
+        return max(0.0, (retry_date - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def JobProgress(response):
+    """
+    Returns the percentage complete that the server reported for a job, or
+    None if the server did not report any progress.
+    """
+    try:
+        job_info = response.json()
+    except ValueError:
+        return None
+
+    if not isinstance(job_info, dict):
+        return None
+
+    # Servers can report progress either as a fraction or as a percentage
+    for field in ['progress', 'percent', 'percentage']:
+        if field in job_info:
+            try:
+                progress = float(job_info[field])
+            except (TypeError, ValueError):
+                continue
+
+            if progress <= 1.0:
+                progress *= 100.0
 
-    job_url = ""  # The URL of the job to watch for completion
-    model_url = ""  # The URL to pass to the slot when the processing is done
+            return int(min(max(progress, 0.0), 100.0))
 
-    #This is the signal that will be emitted during the processing.
-    updateProgress = QtCore.Signal(int)
+    return None
+
+
+class JobManager(QtCore.QThread):
+    """
+    Threaded scheduler that tracks all of the long-running model generation jobs
+    at once. Each job is polled on its own adaptive schedule, starting out fast
+    so that short jobs are picked up quickly and backing off for jobs that take
+    longer. All of the jobs that are due are polled together in one batch.
+    """
+
+    initial_interval = 0.25  # The number of seconds to wait before the first poll of a job
+    max_interval = 10.0  # The longest a job will wait between polls
+    backoff = 1.5  # How much longer to wait after each poll that finds the job still running
+    batch_size = 8  # The number of jobs that can be polled at the same time
+
+    # All signals pass the model URL of the job so that the UI can tell them apart
+    jobProgress = QtCore.Signal(str, int)
     modelReady = QtCore.Signal(str)
-    modelTimedOut = QtCore.Signal()
+    modelTimedOut = QtCore.Signal(str)
+    jobWarning = QtCore.Signal(str, str)  # Also passes a message for the user about a poll that went wrong
 
     def __init__(self):
+        import threading
         from PySide import QtCore
         QtCore.QThread.__init__(self)
 
+        self.jobs = {}  # Maps the model URL of each job to its polling state
+        self.lock = threading.Lock()
+        self.wake = threading.Event()  # Set when a new job needs to be polled right away
+        self.active = False  # Whether the scheduler loop has jobs to work on
+
+    def AddJob(self, job_url, model_url, deadline):
+        """
+        Starts tracking a job, and returns False if a job for the same model is already tracked.
+        """
+        now = time.monotonic()
+
+        with self.lock:
+            if model_url in self.jobs:
+                return False
+
+            self.jobs[model_url] = {'job_url': job_url, 'start_time': now, 'deadline': deadline,
+                                    'interval': self.initial_interval, 'next_poll': now + self.initial_interval}
+
+            needs_start = not self.active
+            self.active = True
+
+        if needs_start:
+            # Make sure a scheduler loop that just ran out of jobs has completely finished
+            self.wait()
+            self.start()
+        else:
+            self.wake.set()
+
+        return True
+
+    def RemoveJob(self, model_url):
+        """
+        Stops tracking the job for a model, so that it is not polled again and
+        the model can be tracked again straight away.
+        """
+        with self.lock:
+            self.jobs.pop(model_url, None)
+
+    def PollJob(self, model_url, job_url):
+        """
+        Polls a single job and returns the response, or None if the server could not be reached.
+        """
+        import requests
+        from Http import GetSession
+
+        try:
+            return GetSession().get(job_url, allow_redirects=False)
+        except requests.exceptions.RequestException:
+            return None
+
+    def HandleResponse(self, model_url, job, response):
+        """
+        Works out what to do with a job based on the response to a poll. Returns
+        True if the job is finished, one way or another.
+        """
+        import random
+
+        elapsed = time.monotonic() - job['start_time']
+
+        # Spread the polls out a little so that many clients do not poll in lock step
+        wait_time = job['interval'] * random.uniform(0.8, 1.2)
+
+        if response == None:
+            self.jobWarning.emit(model_url, "OCCI: Unable to reach the job URL " + job['job_url'] + ", it will be tried again.\r\n")
+        elif response.status_code == 200:
+            # Let the caller know that we are done, once the job can be tracked again
+            self.RemoveJob(model_url)
+            self.modelReady.emit(model_url)
+            return True
+        elif response.status_code == 202:
+            # Use the server's own progress if it gives one, otherwise estimate it from the deadline
+            status = JobProgress(response)
+            if status == None:
+                status = min(99, int(100 * elapsed / job['deadline']))
+
+            # Let the UI know about progress any progress being made
+            self.jobProgress.emit(model_url, status)
+
+            # The server knows best how long the job will take
+            retry_after = RetryAfterSeconds(response)
+            if retry_after != None:
+                wait_time = retry_after
+        else:
+            self.jobWarning.emit(model_url, "OCCI: Unknown status code " + str(response.status_code) + " from the job URL " + job['job_url'] + ".\r\n")
+
+        # Trap door to keep execution from going on forever
+        if elapsed + wait_time >= job['deadline']:
+            self.RemoveJob(model_url)
+            self.modelTimedOut.emit(model_url)
+            return True
+
+        job['next_poll'] = time.monotonic() + wait_time
+        job['interval'] = min(job['interval'] * self.backoff, self.max_interval)
+
+        return False
+
     def run(self):
         """
-        Starts this thread so that it can poll the job URL and pass the model URL
-        back to the UI when it is ready.
+        Polls every job that is due, then sleeps until the next job is due or a
+        new job is added. Runs until there are no jobs left.
         """
+        pool = ThreadPoolExecutor(max_workers=self.batch_size)
 
-        # Poll the job URL until the model is finished and ready for download
-        i = 0
         while True:
-            i += 1
+            now = time.monotonic()
+
+            with self.lock:
+                # There is nothing left to do once all the jobs have finished
+                if len(self.jobs) == 0:
+                    self.active = False
+                    break
+
+                due_jobs = [(model_url, job) for model_url, job in self.jobs.items() if job['next_poll'] <= now]
+                next_poll = min(job['next_poll'] for job in self.jobs.values())
+
+            # Nothing is due yet, so sleep until something is
+            if len(due_jobs) == 0:
+                self.wake.wait(max(0.0, next_poll - now))
+                self.wake.clear()
+                continue
+
+            # Poll the whole batch of due jobs at the same time
+            futures = {}
+            for model_url, job in due_jobs:
+                futures[pool.submit(self.PollJob, model_url, job['job_url'])] = (model_url, job)
+
+            for future in as_completed(futures):
+                model_url, job = futures[future]
+
+                # A job that has been removed while it was being polled is no longer wanted
+                with self.lock:
+                    if self.jobs.get(model_url) is not job:
+                        continue
+
+                self.HandleResponse(model_url, job, future.result())
+
+        pool.shutdown(wait=False)
+
+
+def WaitForJob(job_url, deadline, is_cancelled=None):
+    """
+    Polls a long-running model generation job until the model is ready, backing
+    off the same way the JobManager does. Returns True once the model can be
+    downloaded, or False if the job did not finish within the deadline.
+    """
+    import requests
+    from Http import GetSession
+
+    start_time = time.monotonic()
+    interval = JobManager.initial_interval
+
+    while time.monotonic() - start_time < deadline:
+        if is_cancelled != None and is_cancelled():
+            return False
+
+        wait_time = interval
+        try:
+            response = GetSession().get(job_url, allow_redirects=False)
+            if response.status_code == 200:
+                return True
+
+            # The server knows best how long the job will take
+            retry_after = RetryAfterSeconds(response)
+            if retry_after != None:
+                wait_time = retry_after
+        except requests.exceptions.RequestException:
+            pass
+
+        time.sleep(min(wait_time, max(0.0, deadline - (time.monotonic() - start_time))))
+        interval = min(interval * JobManager.backoff, JobManager.max_interval)
+
+    return False
+
+
+def ParameterValues(result, values):
+    """
+    Works out the (name, value) pairs for the parameters of a component, with
+    the given values, keyed by parameter, in place of the defaults. Values are
+    formatted the same way the parameter controls would format them.
+    """
+    param_values = []
+
+    for param in result['params'].keys():
+        param_info = result['params'][param]
+        value = values.get(param, param_info.get('default'))
+
+        if param_info['type'] == 'number' and isinstance(param_info['default'], int):
+            value = int(float(value))
+        elif param_info['type'] == 'number' and isinstance(param_info['default'], float):
+            # Float spin boxes hold two decimal places
+            value = round(float(value), 2)
+        elif param_info['type'] == 'text':
+            value = str(value) if value != None else ""
+        elif param_info['type'] == 'options':
+            # An option box without a default starts on its first option
+            if value == None and len(param_info.get('options', [])) > 0:
+                value = param_info['options'][0]
+            value = str(value)
+        elif param_info['type'] == 'boolean':
+            # Values read from a file are text, and any text would otherwise count as true
+            if isinstance(value, str):
+                value = value.strip().lower() in ['true', 'yes', '1']
+            value = str(bool(value))
+        else:
+            continue
+
+        param_values.append((param_info['name'].strip(), value))
+
+    return param_values
+
+
+def BuildModelURL(base_url, param_values):
+    """
+    Builds the URL to grab an OCCI component STEP file from a list of
+    (name, value) parameter pairs.
+    """
+    download_url = base_url
+
+    for index, (name, value) in enumerate(param_values):
+        # If this is the first parameter, add the question mark
+        if index == 0:
+            download_url += "?"
+        else:
+            download_url += "&"
+
+        download_url += name.replace(" ", "+") + "=" + str(value)
+
+    return download_url
+
+
+def AddComponentFeature(document, identity, shape):
+    """
+    Adds a feature object holding the shape of a component to the document and
+    returns it. The identity is a dict with the namespace, version, base_url
+    and model_url of the component, which are stored on the feature.
+    """
+    name = identity['namespace'].replace('/', "_")
+    new_feature = document.addObject("Part::Feature", name)
+    new_feature.Label = name
+    new_feature.ViewObject.ShapeColor = (0.0, 1.0, 0.5)
+    new_feature.ViewObject.Transparency = 0
+    new_feature.Shape = shape
+    SetComponentIdentity(new_feature, identity)
+
+    return new_feature
+
+
+def SetComponentIdentity(feature, identity):
+    """
+    Stores which component, version and parameters a feature was made from in
+    read-only properties, so that it can be found and updated later.
+    """
+    for property_name, key in IDENTITY_PROPERTIES:
+        if property_name not in feature.PropertiesList:
+            feature.addProperty("App::PropertyString", property_name, "OCCI", "The OCCI component this feature was made from")
+            feature.setEditorMode(property_name, 1)
+
+        setattr(feature, property_name, str(identity.get(key) or ""))
+
+
+def ComponentIdentity(feature):
+    """
+    Returns the identity stored on a feature by SetComponentIdentity, or None
+    if the feature was not made by the plugin.
+    """
+    if 'OCCI_ModelURL' not in feature.PropertiesList or feature.OCCI_ModelURL == "":
+        return None
+
+    identity = {}
+    for property_name, key in IDENTITY_PROPERTIES:
+        identity[key] = getattr(feature, property_name)
+
+    return identity
+
+
+def MasterFeatures(document):
+    """
+    Returns a dict mapping the canonical model URL of every component feature
+    in the document to the feature that holds its shape, which App::Link
+    instances of the same component can point to.
+    """
+    from Cache import CanonicalURL
+
+    masters = {}
+    for feature in document.Objects:
+        if feature.TypeId != 'Part::Feature':
+            continue
+
+        identity = ComponentIdentity(feature)
+        if identity != None:
+            masters.setdefault(CanonicalURL(identity['model_url']), feature)
+
+    return masters
+
+
+def AddComponentLink(document, master):
+    """
+    Adds an App::Link instance of a component feature to the document and
+    returns it. The link shares the master's shape instead of holding a copy.
+    """
+    name = master.OCCI_Namespace.replace('/', "_")
+    new_link = document.addObject("App::Link", name)
+    new_link.setLink(master)
+    new_link.Label = name
+
+    return new_link
+
+
+def IsInstancingEnabled():
+    """
+    Returns whether identical components should be inserted as links to a single feature.
+    """
+    settings = QtCore.QSettings("OCCI", "occi-freecad-plugin")
+
+    return settings.value('ui/instancing', 'no') == 'yes'
+
+
+def SetFeatureShape(feature, shape):
+    """
+    Gives a feature a new shape without moving it, since assigning a shape also
+    assigns the shape's placement.
+    """
+    placement = feature.Placement
+    feature.Shape = shape
+    feature.Placement = placement
+
+
+class SearchWorker(QtCore.QThread):
+    """
+    Threaded worker that searches all of the enabled repositories at the same time.
+    """
+
+    # Status codes passed to searchFailed that do not come from the server
+    CONNECTION_ERROR = 0
+    TIMED_OUT = -1
+
+    repo_urls = []  # The models URLs of the repositories to search
+    search_text = ""  # The text the user is searching for
+    deadline = 10.0  # The number of seconds each repository has to answer
+    cancelled = False  # Set when a newer search has superseded this one
+    stale_results = {}  # Maps models URLs to expired (results, validators) the server can confirm are current
+    adapter = None  # Cuts off the worker's requests when it is cancelled, once it has started
+
+    # Emitted once for each repository as its results arrive, along with their validators
+    resultsReady = QtCore.Signal(str, object, object)
+    searchFailed = QtCore.Signal(str, int)
+    searchFinished = QtCore.Signal()
+
+    def __init__(self):
+        from PySide import QtCore
+        QtCore.QThread.__init__(self)
+
+    def Cancel(self):
+        """
+        Asks the worker to stop passing results back, and aborts the searches
+        that are still waiting for a repository to answer.
+        """
+        self.cancelled = True
+
+        adapter = self.adapter
+        if adapter != None:
+            adapter.Cancel()
+
+    def SearchRepository(self, session, models_url):
+        """
+        Runs the search against a single repository and returns the status code
+        along with the results and their validators, which are None unless the
+        search succeeded. Results are put in the query cache as soon as they
+        arrive, even if the worker has stopped waiting for them.
+        """
+        import requests
+        from Http import ConditionalHeaders, ResponseValidators
+        from Health import GetHealthMonitor
+        from Cache import GetQueryCache
+
+        headers = {}
+        if models_url in self.stale_results:
+            headers = ConditionalHeaders(self.stale_results[models_url][1])
+
+        # Every search also tells the health monitor how the repository is doing. The request is not
+        # limited to the search deadline, so that a repository that misses it still fills the query cache.
+        start_time = time.monotonic()
+        try:
+            response = session.get(models_url + '/search', params={'q': self.search_text}, headers=headers)
+        except requests.exceptions.RequestException:
+            # A search that was cut off says nothing about the repository
+            if not self.cancelled:
+                GetHealthMonitor().RecordFailure(models_url)
+            raise
+        GetHealthMonitor().RecordResponse(models_url, response.status_code, time.monotonic() - start_time)
+
+        if response.status_code == 304 and models_url in self.stale_results:
+            # The results we already have are still current
+            results, validators = self.stale_results[models_url]
+        elif response.status_code == 200:
+            results, validators = response.json(), ResponseValidators(response)
+        else:
+            return response.status_code, None, None
+
+        GetQueryCache().Put(models_url, self.search_text, results, validators)
+
+        return response.status_code, results, validators
+
+    def run(self):
+        """
+        Fans the search out to every repository and passes each repository's
+        results back to the UI as soon as they are available.
+        """
+        import requests
+        from Http import NewSession, CancellableAdapter
+
+        # There is no point starting a pool with nothing to do
+        if len(self.repo_urls) == 0:
+            self.searchFinished.emit()
+            return
+
+        # The worker has a session of its own so that cancelling it cannot cut off anyone else's requests
+        session = NewSession(CancellableAdapter)
+        self.adapter = session.get_adapter('https://')
+        if self.cancelled:
+            self.adapter.Cancel()
+
+        # One thread per repository so that a slow server does not delay the others
+        pool = ThreadPoolExecutor(max_workers=len(self.repo_urls))
+        futures = {}
+        for models_url in self.repo_urls:
+            futures[pool.submit(self.SearchRepository, session, models_url)] = models_url
+
+        try:
+            # Hand the results back in the order that the servers answer
+            for future in as_completed(futures, timeout=self.deadline):
+                # A superseded search does not need to hear from the rest of the repositories
+                if self.cancelled:
+                    break
+
+                models_url = futures[future]
+
+                try:
+                    status_code, results, validators = future.result()
+                except requests.exceptions.Timeout:
+                    self.searchFailed.emit(models_url, self.TIMED_OUT)
+                    continue
+                except Exception:
+                    self.searchFailed.emit(models_url, self.CONNECTION_ERROR)
+                    continue
+
+                if results != None:
+                    self.resultsReady.emit(models_url, results, validators)
+                else:
+                    self.searchFailed.emit(models_url, status_code)
+        except FuturesTimeoutError:
+            # Any repository that has not answered by now has missed the deadline
+            for future in futures.keys():
+                if not future.done() and not self.cancelled:
+                    self.searchFailed.emit(futures[future], self.TIMED_OUT)
+
+        self.searchFinished.emit()
+
+        # Repositories that missed the deadline can still answer into the query cache, unless the search was superseded
+        if self.cancelled:
+            self.adapter.Cancel()
+        pool.shutdown(wait=True)
+        session.close()
+
+
+class IntegrityError(Exception):
+    """
+    Raised when a downloaded model is not the complete STEP file the server said it would be.
+    """
+    pass
+
+
+class StepInspector:
+    """
+    Checks a STEP file as it is being downloaded, so that a response that is
+    not a STEP file at all is rejected from its first bytes instead of after
+    all of it has arrived, and counts the entities in it so that the import
+    can be planned before the download finishes.
+    """
+
+    # An entity instance is a name like #12 being assigned, references to other entities have no =
+    ENTITY_PATTERN = re.compile(rb'#\d+\s*=')
+
+    # The most that is held back while waiting for the end of a statement
+    MAX_PENDING = 1024 * 1024
+
+    def __init__(self):
+        self.head = b''  # The start of the file, until the header has been checked
+        self.checked = False  # Set once the header has been checked
+        self.pending = b''  # Data after the last complete statement, which may hold a partial entity name
+        self.entities = 0  # The number of entity instances seen so far
+
+    def Feed(self, data):
+        """
+        Inspects the next block of the file. Raises IntegrityError as soon as
+        it is clear that the file is not a STEP file.
+        """
+        if not self.checked:
+            self.head += data
+
+            # Allow for a byte order mark and whitespace before the STEP data
+            head = self.head.lstrip(b'\xef\xbb\xbf \t\r\n')
+            if len(head) >= len(b'ISO-10303-21;'):
+                if not head.startswith(b'ISO-10303-21;'):
+                    raise IntegrityError("the server did not send a STEP file")
+
+                self.checked = True
+                self.head = b''
+
+        # Statements end with a semicolon, so only complete statements are counted to avoid splitting an entity name
+        data = self.pending + data
+        end = data.rfind(b';') + 1
+        self.entities += len(self.ENTITY_PATTERN.findall(data, 0, end))
+        self.pending = data[end:][-self.MAX_PENDING:]
+
+
+def VerifyModel(path, expected_size=None, digests=None):
+    """
+    Checks a downloaded STEP file before it is allowed into the cache. The file
+    has to have the size and checksums the server gave, if it gave any, and
+    has to have both the header and the footer of a STEP file, which catches
+    truncated downloads even when the server gave nothing to check against.
+    """
+    import hashlib
+
+    size = os.path.getsize(path)
+    if expected_size != None and size != expected_size:
+        raise IntegrityError("expected " + str(expected_size) + " bytes but received " + str(size))
+
+    with open(path, 'rb') as step_file:
+        head = step_file.read(64)
+        step_file.seek(max(0, size - 256))
+        tail = step_file.read()
+
+    # Allow for a byte order mark and whitespace around the STEP data
+    if not head.lstrip(b'\xef\xbb\xbf \t\r\n').startswith(b'ISO-10303-21;'):
+        raise IntegrityError("the file does not start with a STEP header")
+    if not tail.rstrip().endswith(b'END-ISO-10303-21;'):
+        raise IntegrityError("the file does not end with a STEP footer")
+
+    for algorithm, expected_digest in digests or []:
+        hasher = hashlib.new(algorithm)
+        with open(path, 'rb') as step_file:
+            for block in iter(lambda: step_file.read(1024 * 1024), b''):
+                hasher.update(block)
+
+        if hasher.digest() != expected_digest:
+            raise IntegrityError("the " + algorithm + " checksum does not match")
+
+
+def DownloadSettings():
+    """
+    Returns the number of parallel segments large models are split into, and
+    the size in bytes a model has to be before it is split.
+    """
+    settings = QtCore.QSettings("OCCI", "occi-freecad-plugin")
+
+    return int(settings.value('download/segments', 1)), int(float(settings.value('download/segment_min_mb', 32)) * 1024 * 1024)
+
+
+def DownloadToCache(download_url, step_cache, on_chunk=None, is_cancelled=None, validators=None):
+    """
+    Streams a model from the server into the STEP cache. Returns the response so
+    that the caller can check the status code and headers, along with the path
+    of the cached STEP file, which is None unless the download completed.
+    on_chunk is called with the bytes received so far and the total expected,
+    which only count the rest of the model when a download is resumed.
+    If validators are given, the server can answer 304 instead of sending a
+    model that has not changed. Compressed models are decompressed as they
+    arrive, so the cache always holds plain STEP files. Interrupted downloads
+    are resumed where they left off, and large models can be downloaded in
+    parallel segments. Raises IntegrityError if the model is not complete.
+    """
+
+    # The partial file can only be used by one download at a time, any others start from scratch
+    partial_path = step_cache.ClaimPartial(download_url)
+    if partial_path == None:
+        temp_file = step_cache.NewTempFile()
+        temp_file.close()
+        return StreamToCache(download_url, step_cache, temp_file.name, None, on_chunk, is_cancelled, validators)
+
+    try:
+        # A revalidation asks for the whole model, so there is nothing to resume
+        resume_validators = step_cache.PartialValidators(download_url) if validators == None else None
+        if resume_validators != None:
+            return StreamToCache(download_url, step_cache, partial_path, resume_validators, on_chunk, is_cancelled, None)
+
+        step_cache.DiscardPartial(download_url)
 
-            # Poll the job URL
-            response = requests.get(self.job_url, allow_redirects=False)
+        segments, segment_min_size = DownloadSettings()
+        if segments > 1 and validators == None:
+            response, step_file_path = SegmentedDownload(download_url, step_cache, partial_path, segments, segment_min_size, on_chunk, is_cancelled)
+            if response != None:
+                return response, step_file_path
+
+        return StreamToCache(download_url, step_cache, partial_path, None, on_chunk, is_cancelled, validators)
+    finally:
+        step_cache.ReleasePartial(download_url)
+
+
+def StreamToCache(download_url, step_cache, path, resume_validators, on_chunk, is_cancelled, validators):
+    """
+    Downloads a model in a single stream into the file at path, then verifies
+    it and moves it into the cache. If resume_validators are given, the
+    download continues from the end of the file as long as the model has not
+    changed on the server. If the download is interrupted and the server
+    supports ranges, the file is kept so that it can be resumed later.
+    """
+    import zlib
+    import requests
+    from Http import GetSession, ConditionalHeaders, ResponseValidators, ModelAcceptEncoding, Decompressor, RangeValidator, ResponseDigests
+
+    headers = ConditionalHeaders(validators)
+    offset = 0
+    if resume_validators != None:
+        offset = os.path.getsize(path)
+
+        # Ranges count the bytes as they are stored, so a resumed download cannot be compressed in transit
+        headers['Range'] = 'bytes=' + str(offset) + '-'
+        headers['If-Range'] = RangeValidator(resume_validators)
+        headers['Accept-Encoding'] = 'identity'
+    else:
+        # STEP compresses very well, so ask for it compressed
+        headers['Accept-Encoding'] = ModelAcceptEncoding()
+
+    # Only the partial file of this model can be kept to be resumed, not a temporary file
+    can_keep = path == step_cache.PartialPath(download_url)
+
+    is_complete = False
+    is_resumable = can_keep and resume_validators != None
+    range_validators = resume_validators
+    decompressor = None
+
+    # Only a download that starts at the beginning can be checked and counted as it arrives
+    inspector = StepInspector() if resume_validators == None else None
+
+    try:
+        with GetSession().get(download_url, headers=headers, stream=True, allow_redirects=False) as response:
+            # The server sends the whole model instead of the rest of it if it has changed
+            if response.status_code == 200:
+                offset = 0
+                inspector = StepInspector()
+            elif response.status_code != 206 or offset == 0 or not response.headers.get('Content-Range', '').startswith('bytes ' + str(offset) + '-'):
+                # The partial file is still good unless the server says the range makes no sense for it
+                is_resumable = is_resumable and response.status_code != 416 and response.status_code != 206
+                return response, None
+
+            # Only a download that is stored exactly as it is sent can be resumed
+            is_encoded = response.headers.get('Content-Encoding', 'identity') != 'identity'
             if response.status_code == 200:
-                # Let the caller know that we are done
-                self.modelReady.emit(self.model_url)
-                break
-            elif response.status_code == 202:
-                # Clamp the status update to 100%
-                if i > 100:
-                    status = 100
+                range_validators = ResponseValidators(response)
+            is_resumable = can_keep and not is_encoded and RangeValidator(range_validators) != None and \
+                           (response.status_code == 206 or response.headers.get('Accept-Ranges') == 'bytes')
+
+            # The total is 0 if the server does not say how big the file is, and is the compressed size if it is compressed
+            total_bytes = int(response.headers.get('Content-Length', 0))
+
+            with open(path, 'ab' if offset > 0 else 'wb') as step_file:
+                for chunk in response.iter_content(chunk_size=65536):
+                    if is_cancelled != None and is_cancelled():
+                        break
+
+                    # Compressed models are recognised by their first bytes
+                    if offset == 0 and step_file.tell() == 0 and decompressor == None:
+                        decompressor = Decompressor(chunk)
+                        is_resumable = is_resumable and decompressor == None
+
+                    try:
+                        data = decompressor.decompress(chunk) if decompressor != None else chunk
+                    except zlib.error:
+                        raise IntegrityError("the model could not be decompressed")
+
+                    if inspector != None:
+                        inspector.Feed(data)
+                    step_file.write(data)
+
+                    # Progress is measured in bytes on the wire, before any decompression, and only counts what this request receives
+                    if on_chunk != None:
+                        on_chunk(response.raw.tell(), total_bytes)
                 else:
-                    status = i
+                    if decompressor != None:
+                        data = decompressor.flush()
+                        if inspector != None:
+                            inspector.Feed(data)
+                        step_file.write(data)
 
-                # Let the UI know about progress any progress being made
-                self.updateProgress.emit(status)
+                    # A connection that closes early looks like the end of the download, and what did arrive can be resumed
+                    if total_bytes > 0 and response.raw.tell() < total_bytes:
+                        raise requests.exceptions.ConnectionError("The connection closed before the whole model was received")
+                    if decompressor != None and not getattr(decompressor, 'eof', True):
+                        raise IntegrityError("the compressed model was cut short")
+
+                    is_complete = True
+    except IntegrityError:
+        is_resumable = False
+        raise
+    finally:
+        # Interrupted downloads are kept if they can be resumed, and thrown away otherwise
+        if not is_complete:
+            if is_resumable and os.path.isfile(path):
+                step_cache.KeepPartial(download_url, range_validators)
             else:
-                print("Unknown status code: " + str(response.status_code))
+                step_cache.Discard(path)
+
+    if not is_complete:
+        return response, None
+
+    # Checksums describe the model as the server stores it, so they cannot be checked after decompression
+    digests = ResponseDigests(response) if not is_encoded and decompressor == None else []
+    expected_size = offset + total_bytes if not is_encoded and decompressor == None and total_bytes > 0 else None
+
+    try:
+        VerifyModel(path, expected_size, digests)
+    except IntegrityError:
+        step_cache.Discard(path)
+        raise
+
+    # Keep the model so that it does not need to be downloaded again
+    return response, step_cache.Store(download_url, path, ResponseValidators(response), inspector.entities if inspector != None else None)
+
+
+def DownloadSegment(download_url, path, start, end, range_validator, on_bytes, is_cancelled):
+    """
+    Downloads the bytes from start to end, inclusive, of a model into their
+    place in the file at path. Returns False if the download was cancelled.
+    """
+    from Http import GetSession
+
+    headers = {'Range': 'bytes=' + str(start) + '-' + str(end), 'If-Range': range_validator, 'Accept-Encoding': 'identity'}
+
+    with GetSession().get(download_url, headers=headers, stream=True, allow_redirects=False) as response:
+        # Anything other than the range means that the model changed while it was being downloaded
+        if response.status_code != 206:
+            raise IntegrityError("the server did not send the requested range")
+
+        with open(path, 'r+b') as step_file:
+            step_file.seek(start)
+
+            for chunk in response.iter_content(chunk_size=65536):
+                if is_cancelled != None and is_cancelled():
+                    return False
+
+                step_file.write(chunk)
+                on_bytes(len(chunk))
+
+            if step_file.tell() != end + 1:
+                raise IntegrityError("the connection closed before the whole segment was received")
+
+    return True
+
+
+def SegmentedDownload(download_url, step_cache, path, segments, segment_min_size, on_chunk, is_cancelled):
+    """
+    Downloads a large model as several byte ranges at the same time, each
+    written straight into its place in the file at path. Returns (None, None)
+    if the model is too small, the server does not support ranges or its size
+    could not be asked for, so that the caller can fall back to a single stream.
+    """
+    import threading
+    import requests
+    from Http import GetSession, ResponseValidators, RangeValidator, ResponseDigests
+
+    # Ask for the size without a compressed encoding so that the ranges line up with the file
+    try:
+        response = GetSession().head(download_url, headers={'Accept-Encoding': 'identity'}, allow_redirects=False)
+    except requests.exceptions.RequestException:
+        return None, None
+    if response.status_code != 200 or response.headers.get('Accept-Ranges') != 'bytes' or \
+       response.headers.get('Content-Encoding', 'identity') != 'identity':
+        return None, None
+
+    total_bytes = int(response.headers.get('Content-Length', 0))
+    range_validator = RangeValidator(ResponseValidators(response))
+    if total_bytes < segment_min_size or range_validator == None:
+        return None, None
+
+    # Make the file its full size up front so that every segment can be written in place
+    with open(path, 'wb') as step_file:
+        step_file.truncate(total_bytes)
+
+    lock = threading.Lock()
+    failed = [False]
+    def is_stopped():
+        return failed[0] or (is_cancelled != None and is_cancelled())
+
+    received_bytes = [0]
+    def on_bytes(chunk_bytes):
+        with lock:
+            received_bytes[0] += chunk_bytes
+            if on_chunk != None:
+                on_chunk(received_bytes[0], total_bytes)
+
+    segment_size = -(-total_bytes // segments)
+    pool = ThreadPoolExecutor(max_workers=segments)
+    futures = []
+    for start in range(0, total_bytes, segment_size):
+        end = min(start + segment_size, total_bytes) - 1
+        futures.append(pool.submit(DownloadSegment, download_url, path, start, end, range_validator, on_bytes, is_stopped))
+
+    try:
+        is_complete = True
+        for future in futures:
+            is_complete = future.result() and is_complete
+    except Exception:
+        # Stop the other segments before the file is thrown away
+        failed[0] = True
+        pool.shutdown(wait=True)
+        step_cache.Discard(path)
+        raise
+
+    pool.shutdown(wait=True)
+
+    if not is_complete:
+        step_cache.Discard(path)
+        return response, None
+
+    try:
+        VerifyModel(path, total_bytes, ResponseDigests(response))
+    except IntegrityError:
+        step_cache.Discard(path)
+        raise
+
+    return response, step_cache.Store(download_url, path, ResponseValidators(response))
+
+
+class DownloadWorker(QtCore.QThread):
+    """
+    Threaded worker that downloads a model into the STEP cache and parses it
+    into a shape, so that the UI stays responsive while this happens.
+    """
+
+    download_url = ""  # The URL of the STEP file with the parameters set
+    context = None  # Whatever the UI needs to know to use the shape once it is ready
+    cancelled = False  # Set when the user no longer wants this download
+
+    # Progress is a percentage based on the number of bytes received
+    downloadProgress = QtCore.Signal(int)
+    downloadFinished = QtCore.Signal(object)
+    downloadFailed = QtCore.Signal(str)
+    jobStarted = QtCore.Signal(str)
+
+    def __init__(self):
+        from PySide import QtCore
+        QtCore.QThread.__init__(self)
+
+    def Cancel(self):
+        """
+        Asks the worker to stop at the next opportunity.
+        """
+        self.cancelled = True
+
+    def ReportProgress(self, received_bytes, total_bytes):
+        """
+        Turns the number of bytes received into download progress for the UI.
+        """
+
+        # Progress can only be measured if the server says how big the file is
+        if total_bytes > 0:
+            self.downloadProgress.emit(10 + int(80 * min(received_bytes, total_bytes) / total_bytes))
+
+    def Fetch(self, step_cache):
+        """
+        Downloads the STEP file into the cache and returns its path, or None if the
+        model could not be downloaded.
+        """
+        import requests
+
+        try:
+            response, step_file_path = DownloadToCache(self.download_url, step_cache, self.ReportProgress, lambda: self.cancelled)
+        except requests.exceptions.RequestException:
+            self.downloadFailed.emit("OCCI ERROR: There was a problem connecting to the server to download the model.\r\n")
+            return None
+        except IntegrityError as error:
+            self.downloadFailed.emit("OCCI ERROR: The downloaded model was incomplete or corrupted (" + str(error) + ").\r\n")
+            return None
+
+        if response.status_code == 200:
+            # The path is None if the download was cancelled
+            return step_file_path
+        elif response.status_code == 307:
+            # Distinguish between a model version redirect and a long-running redirect
+            if 'location' in response.headers and '/job/' in response.headers['location']:
+                self.jobStarted.emit(response.headers['location'])
+            else:
+                self.downloadFailed.emit("OCCI ERROR: The server redirected the model request to an unexpected location.\r\n")
+        elif response.status_code == 404:
+            self.downloadFailed.emit("OCCI ERROR: The model you have requested does not seem to exist on the server.\r\n")
+        elif response.status_code == 500:
+            self.downloadFailed.emit("OCCI ERROR: There was an error on the server that prevented the model from being downloaded. Please contact the server administrator.\r\n")
+        else:
+            self.downloadFailed.emit("OCCI ERROR: Status code unknown: " + str(response.status_code) + "\r\n")
+
+        return None
+
+    def Revalidate(self, step_cache, step_file_path):
+        """
+        Asks the server whether the cached model has changed, downloading it again
+        only if it has. Returns the path of the STEP file to use, which is the
+        cached one if the server cannot be reached.
+        """
+        import requests
+
+        try:
+            response, new_file_path = DownloadToCache(self.download_url, step_cache, self.ReportProgress, lambda: self.cancelled,
+                                                      step_cache.Validators(self.download_url))
+        except (requests.exceptions.RequestException, IntegrityError):
+            return step_file_path
+
+        if response.status_code == 304:
+            step_cache.MarkValidated(self.download_url)
+        elif new_file_path != None:
+            return new_file_path
+
+        return step_file_path
+
+    def run(self):
+        """
+        Runs the whole fetch, write and parse pipeline for the model.
+        """
+        from Cache import GetStepCache, IsOffline, ReadShape, RevalidateAfter
+
+        self.downloadProgress.emit(5)
+
+        # There is no need to go to the server if this exact model has been downloaded before
+        step_cache = GetStepCache()
+        step_file_path = step_cache.Lookup(self.download_url)
+        if step_file_path == None:
+            # In offline mode only the cache can be used
+            if IsOffline():
+                self.downloadFailed.emit("OCCI ERROR: The model with these parameters has not been cached and offline mode is enabled.\r\n")
+                return
+
+            self.downloadProgress.emit(10)
+
+            step_file_path = self.Fetch(step_cache)
+            if step_file_path == None:
+                return
+        elif not IsOffline() and step_cache.NeedsRevalidation(self.download_url, RevalidateAfter()):
+            # Older copies are checked with the server, which only costs a header exchange if they have not changed
+            self.downloadProgress.emit(10)
+            step_file_path = self.Revalidate(step_cache, step_file_path)
+
+        # Parse the model into a shape here so that the UI only has to attach it
+        self.downloadProgress.emit(90)
+        try:
+            shape = ReadShape(step_file_path)
+        except Exception:
+            self.downloadFailed.emit("OCCI ERROR: The downloaded model could not be read.\r\n")
+            return
+
+        if self.cancelled:
+            return
+
+        self.downloadProgress.emit(100)
+        self.downloadFinished.emit(shape)
+
+
+class PrefetchSlot(QtCore.QThread):
+    """
+    Low priority threaded worker that downloads a prefetcher's variants one
+    after another, until there are none left.
+    """
+
+    def __init__(self, prefetcher, step_cache):
+        from PySide import QtCore
+        QtCore.QThread.__init__(self)
+
+        self.prefetcher = prefetcher  # The prefetcher that hands out the variants
+        self.step_cache = step_cache
+
+    def run(self):
+        """
+        Downloads variants until the prefetcher has no more to give out.
+        """
+        while True:
+            download_url = self.prefetcher.NextURL()
+            if download_url == None:
+                return
+
+            self.prefetcher.Prefetch(download_url, self.step_cache)
+
+
+class Prefetcher(QtCore.QThread):
+    """
+    Threaded worker that downloads model variants the user is likely to ask
+    for next into the STEP cache, within a concurrency and bandwidth budget,
+    so that switching to them is instant. The downloads run on low priority
+    threads of their own.
+    """
+
+    download_urls = []  # The URLs of the model variants to prefetch, most likely first
+    server_url = None  # The URL that the locations of model generation jobs are relative to
+    max_concurrent = 2  # The number of variants that can be downloaded at the same time
+    max_bytes = 50 * 1024 * 1024  # The total number of bytes this prefetcher is allowed to download
+    max_rate = 512 * 1024  # The number of bytes per second the prefetcher can use, or 0 for no limit
+    deadline = 600.0  # The number of seconds to wait for a variant that has to be generated first
+    cancelled = False  # Set when the prefetched variants are no longer wanted
+
+    def __init__(self):
+        import threading
+        from PySide import QtCore
+        QtCore.QThread.__init__(self)
+
+        self.lock = threading.Lock()
+        self.received_bytes = 0  # The number of bytes downloaded by all of the prefetches so far
+        self.start_time = time.monotonic()
+        self.next_index = 0  # The position in download_urls of the next variant to hand out
+
+    def Cancel(self):
+        """
+        Asks the prefetcher to stop at the next opportunity.
+        """
+        self.cancelled = True
+
+    def IsStopped(self):
+        """
+        Returns True once the prefetcher has been cancelled or has used up its budget.
+        """
+        return self.cancelled or self.received_bytes >= self.max_bytes
+
+    def NextURL(self):
+        """
+        Returns the next variant to download, or None if there are no more or the prefetcher has stopped.
+        """
+        with self.lock:
+            if self.IsStopped() or self.next_index >= len(self.download_urls):
+                return None
+
+            self.next_index += 1
+
+            return self.download_urls[self.next_index - 1]
+
+    def Throttle(self, chunk_bytes):
+        """
+        Counts the bytes received against the budget and sleeps if the prefetcher
+        is using more than its share of the bandwidth.
+        """
+        with self.lock:
+            self.received_bytes += chunk_bytes
+            received_bytes = self.received_bytes
+
+        if self.max_rate > 0:
+            ahead_by = received_bytes / self.max_rate - (time.monotonic() - self.start_time)
+            if ahead_by > 0:
+                time.sleep(ahead_by)
+
+    def Prefetch(self, download_url, step_cache):
+        """
+        Downloads a single model variant into the cache, unless it is already there.
+        """
+        import requests
+
+        if self.IsStopped() or step_cache.Contains(download_url):
+            return
+
+        last_received = [0]
+        def on_chunk(received_bytes, total_bytes):
+            self.Throttle(received_bytes - last_received[0])
+            last_received[0] = received_bytes
+
+        try:
+            response, step_file_path = DownloadToCache(download_url, step_cache, on_chunk, self.IsStopped)
+
+            # The request has already started a job to generate the variant, so wait for it and download the result
+            location = response.headers.get('location', '')
+            if response.status_code == 307 and '/job/' in location and self.server_url != None:
+                if WaitForJob(self.server_url + location, self.deadline, self.IsStopped):
+                    last_received[0] = 0
+                    DownloadToCache(download_url, step_cache, on_chunk, self.IsStopped)
+        except (requests.exceptions.RequestException, IntegrityError):
+            pass
+
+    def run(self):
+        """
+        Prefetches all of the model variants until they are cached or the budget runs out.
+        """
+        from PySide import QtCore
+        from Cache import GetStepCache
+
+        step_cache = GetStepCache()
+        self.start_time = time.monotonic()
+        self.next_index = 0
+
+        # Each download gets a low priority thread so that it does not compete with the rest of FreeCAD
+        slots = [PrefetchSlot(self, step_cache) for slot in range(min(self.max_concurrent, len(self.download_urls)))]
+        for slot in slots:
+            slot.start(QtCore.QThread.LowestPriority)
+        for slot in slots:
+            slot.wait()
+
+
+class CatalogueSyncWorker(QtCore.QThread):
+    """
+    Threaded worker that brings the local catalogue of each repository up to
+    date with the list of components on the server.
+    """
+
+    repo_urls = []  # The models URLs of the repositories to sync
+
+    # Both signals pass the models URL of the repository
+    syncFinished = QtCore.Signal(str)
+    syncFailed = QtCore.Signal(str)
+
+    def __init__(self):
+        from PySide import QtCore
+        QtCore.QThread.__init__(self)
+
+    def SyncRepository(self, models_url):
+        """
+        Downloads the full list of a repository's components and stores it in the catalogue.
+        """
+        import requests
+        from Http import GetSession, ConditionalHeaders, ResponseValidators
+        from Catalogue import GetCatalogue
+
+        catalogue = GetCatalogue()
+
+        # An empty search returns every component in the repository
+        try:
+            response = GetSession().get(models_url + '/search', params={'q': ''},
+                                        headers=ConditionalHeaders(catalogue.Validators(models_url)))
+        except requests.exceptions.RequestException:
+            self.syncFailed.emit(models_url)
+            return
+
+        # Nothing has changed on the server since the last sync
+        if response.status_code == 304:
+            catalogue.MarkSynced(models_url)
+            self.syncFinished.emit(models_url)
+            return
+
+        if response.status_code != 200:
+            self.syncFailed.emit(models_url)
+            return
+
+        try:
+            json_results = response.json()
+        except ValueError:
+            self.syncFailed.emit(models_url)
+            return
+
+        catalogue.SyncRepository(models_url, json_results, ResponseValidators(response))
+        self.syncFinished.emit(models_url)
+
+    def run(self):
+        """
+        Syncs all of the repositories, a few at a time.
+        """
+        pool = ThreadPoolExecutor(max_workers=4)
+        for models_url in self.repo_urls:
+            pool.submit(self.SyncRepository, models_url)
+        pool.shutdown(wait=True)
+
+
+class HealthProber(QtCore.QThread):
+    """
+    Background worker that checks how each repository is responding every so
+    often, so that searches can skip the ones that are down and try the slow
+    ones last.
+    """
+
+    repo_urls = []  # The models URLs of the repositories to probe, which can be replaced while the prober runs
+    interval = 60.0  # The number of seconds between rounds of probes
+    timeout = 5.0  # The number of seconds a repository has to answer a probe
+    cancelled = False  # Set when the prober should stop
+
+    # Passes the models URL of each repository after it has been probed
+    repositoryProbed = QtCore.Signal(str)
+
+    def __init__(self):
+        import threading
+        from PySide import QtCore
+        QtCore.QThread.__init__(self)
+
+        self.wake = threading.Event()  # Set to cut the wait before the next round short
+
+    def Cancel(self):
+        """
+        Asks the prober to stop, without waiting for the next round.
+        """
+        self.cancelled = True
+        self.wake.set()
+
+    def ProbeNow(self):
+        """
+        Starts the next round of probes straight away, such as after a repository has been added.
+        """
+        self.wake.set()
+
+    def ProbeRepository(self, models_url):
+        """
+        Times how long a repository takes to answer a request for its information.
+        """
+        import requests
+        from Http import GetSession
+        from Health import GetHealthMonitor
+
+        # Only the headers are needed to know the repository is answering
+        start_time = time.monotonic()
+        try:
+            with GetSession().get(models_url, stream=True, timeout=self.timeout) as response:
+                GetHealthMonitor().RecordResponse(models_url, response.status_code, time.monotonic() - start_time)
+        except requests.exceptions.RequestException:
+            GetHealthMonitor().RecordFailure(models_url)
+
+        if not self.cancelled:
+            self.repositoryProbed.emit(models_url)
+
+    def run(self):
+        """
+        Probes all of the repositories at the same time, then waits for the next round.
+        """
+        while not self.cancelled:
+            repo_urls = self.repo_urls
 
-            # Trap door to keep execution from going on forever
-            # Capped at 10 minutes
-            if i >= 120:
-                self.modelTimedOut.emit()
-                break
+            if len(repo_urls) > 0:
+                pool = ThreadPoolExecutor(max_workers=min(len(repo_urls), 8))
+                for models_url in repo_urls:
+                    pool.submit(self.ProbeRepository, models_url)
+                pool.shutdown(wait=True)
 
-            time.sleep(5.0)
+            self.wake.wait(self.interval)
+            self.wake.clear()
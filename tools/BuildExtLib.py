@@ -0,0 +1,177 @@
+# Packs the vendored libraries in ext_lib into a single zip archive of
+# precompiled bytecode, which Python can import from with zipimport. Importing
+# from one archive takes a few file system calls instead of the thousands that
+# the loose source trees need, which matters most when the FreeCAD user
+# directory is on a network share.
+#
+# The bytecode only works with the Python version that compiled it, so run
+# this with FreeCAD's own Python, for example:
+#
+#   <FreeCAD>/bin/python tools/BuildExtLib.py
+#
+# The archive is written next to ext_lib, named after the Python version
+# (ext_lib-cpython-38.zip, for example), and InitGui picks it up from there.
+# It has to be built again whenever anything in ext_lib changes. Add
+# --measure to compare import times from the archive and from ext_lib.
+import argparse
+import importlib.util
+import marshal
+import os
+import statistics
+import subprocess
+import sys
+import zipfile
+
+# The top level of the plugin, where ext_lib lives
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Anything in ext_lib that starts with one of these paths is left out of the archive.
+# certifi stays in ext_lib because it hands out the path of its certificate
+# bundle, which would have to be extracted from the archive on every start.
+EXCLUDED_PATHS = [
+    'bin/',
+    'certifi/',
+    'charset_normalizer/cli/',
+    'urllib3/contrib/_securetransport/',
+    'urllib3/contrib/securetransport.py',
+    'urllib3/contrib/pyopenssl.py',
+]
+
+# Directories and files that are never needed at run time
+EXCLUDED_NAMES = ['__pycache__', 'py.typed']
+
+
+def ArchivePath(ext_lib_dir):
+    """
+    Returns where the archive of ext_lib for the running Python is kept.
+    """
+    return ext_lib_dir + "-" + sys.implementation.cache_tag + ".zip"
+
+
+def IsExcluded(relative_path):
+    """
+    Returns whether a file in ext_lib is left out of the archive.
+    """
+    parts = relative_path.split('/')
+    if any(part in EXCLUDED_NAMES or part.endswith('.dist-info') for part in parts):
+        return True
+
+    return any(relative_path.startswith(path) for path in EXCLUDED_PATHS)
+
+
+def CompileSource(source_path, archive_name, optimize):
+    """
+    Compiles a source file into the contents of a .pyc file. The bytecode is
+    marked as unchecked, since the archive does not hold the source to check
+    it against.
+    """
+    with open(source_path, 'rb') as source_file:
+        source = source_file.read()
+
+    # Tracebacks show where the module came from in the archive
+    code = compile(source, archive_name, 'exec', dont_inherit=True, optimize=optimize)
+
+    # The header is the magic number, the flags (hash based and unchecked) and an 8 byte hash that is never used
+    return importlib.util.MAGIC_NUMBER + (1).to_bytes(4, 'little') + bytes(8) + marshal.dumps(code)
+
+
+def BuildArchive(ext_lib_dir, archive_path, include_source=False, optimize=-1):
+    """
+    Writes the archive of ext_lib and returns the number of files in it.
+    """
+    count = 0
+
+    # Write under a temporary name so that a half written archive is never imported from
+    temp_path = archive_path + ".part"
+    # The files are stored without compression so that importing does not have to inflate them
+    with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_STORED) as archive:
+        for dir_path, dir_names, file_names in os.walk(ext_lib_dir):
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                path = os.path.join(dir_path, file_name)
+                relative_path = os.path.relpath(path, ext_lib_dir).replace(os.sep, '/')
+                if IsExcluded(relative_path):
+                    continue
+
+                if file_name.endswith('.py'):
+                    archive_name = os.path.basename(archive_path) + "/" + relative_path
+                    archive.writestr(relative_path[:-3] + '.pyc', CompileSource(path, archive_name, optimize))
+
+                    # The source is only needed to show the lines in tracebacks
+                    if not include_source:
+                        count += 1
+                        continue
+
+                archive.write(path, relative_path)
+                count += 1
+
+    os.replace(temp_path, archive_path)
+
+    return count
+
+
+def ImportTime(library_paths):
+    """
+    Imports requests from library_paths in a new interpreter and returns how many milliseconds it took.
+    """
+    script = ("import sys, time\n"
+              "sys.path[0:0] = " + repr(library_paths) + "\n"
+              "start = time.perf_counter()\n"
+              "import requests\n"
+              "print((time.perf_counter() - start) * 1000.0)\n")
+
+    output = subprocess.run([sys.executable, '-I', '-c', script], stdout=subprocess.PIPE, check=True)
+
+    return float(output.stdout)
+
+
+def DropCaches():
+    """
+    Asks the operating system to forget the file contents it has cached,
+    which needs root on Linux. Returns whether it worked.
+    """
+    try:
+        subprocess.run(['sync'], check=True)
+        with open('/proc/sys/vm/drop_caches', 'w') as drop_file:
+            drop_file.write('3\n')
+        return True
+    except (OSError, subprocess.CalledProcessError):
+        return False
+
+
+def Measure(ext_lib_dir, archive_path, runs):
+    """
+    Prints the cold and warm times to import requests from the archive and from ext_lib.
+    """
+    # certifi is not in the archive, so ext_lib stays on the path behind it just like it does in the plugin
+    for label, library_paths in [('ext_lib', [ext_lib_dir]), ('archive', [archive_path, ext_lib_dir])]:
+        # Without dropping the caches, the first run is only as cold as the last use of the files allows
+        is_cold = DropCaches()
+        cold = ImportTime(library_paths)
+        warm = statistics.median(ImportTime(library_paths) for run in range(runs))
+
+        print(label + ": " + ("cold" if is_cold else "first") + " " + format(cold, '.1f') + " ms, warm " + format(warm, '.1f') + " ms (median of " + str(runs) + ")")
+
+
+def Main():
+    parser = argparse.ArgumentParser(description="Packs ext_lib into a zip archive of precompiled bytecode.")
+    parser.add_argument('--ext-lib', default=os.path.join(PLUGIN_DIR, 'ext_lib'), help="the directory of vendored libraries")
+    parser.add_argument('--output', default=None, help="where to write the archive, next to ext_lib by default")
+    parser.add_argument('--include-source', action='store_true', help="also store the sources, so that tracebacks show them")
+    parser.add_argument('--optimize', type=int, default=-1, help="the optimization level to compile with")
+    parser.add_argument('--measure', action='store_true', help="compare import times from the archive and from ext_lib")
+    parser.add_argument('--runs', type=int, default=10, help="how many warm imports to time with --measure")
+    args = parser.parse_args()
+
+    ext_lib_dir = os.path.abspath(args.ext_lib)
+    archive_path = args.output if args.output != None else ArchivePath(ext_lib_dir)
+
+    count = BuildArchive(ext_lib_dir, archive_path, args.include_source, args.optimize)
+    print("Wrote " + str(count) + " files to " + archive_path + " (" + format(os.path.getsize(archive_path) / 1024.0, '.0f') + " KB)")
+
+    if args.measure:
+        Measure(ext_lib_dir, archive_path, args.runs)
+
+
+if __name__ == '__main__':
+    Main()
@@ -0,0 +1,117 @@
+# Checks that a search that has been superseded lets go of its connections
+# straight away, instead of leaving them open until the repositories answer
+# or the search deadline runs out. Run it with FreeCAD's own Python so that
+# PySide is available, for example:
+#
+#   <FreeCAD>/bin/python tools/CheckSearchCancel.py
+#
+# A local server stands in for a few repositories that never answer. Once
+# every repository has been asked, the search is cancelled, and the check
+# passes if the server sees each of the connections close and the search
+# worker finishes within the time allowed.
+import argparse
+import http.server
+import os
+import select
+import sys
+import threading
+import time
+
+# The top level of the plugin, where ext_lib lives
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class StallingHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Answers nothing, and records when the client gives up on the connection.
+    """
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.waiting += 1
+
+        # The client closing or shutting down its end makes the socket readable with nothing to read
+        start = time.monotonic()
+        while time.monotonic() - start < self.server.stall_seconds:
+            readable, writable, failed = select.select([self.connection], [], [], 0.05)
+            if readable and self.connection.recv(1) == b'':
+                with self.server.lock:
+                    self.server.released += 1
+                return
+
+    def log_message(self, format, *args):
+        pass
+
+
+def StartServer(stall_seconds):
+    """
+    Starts the stand-in repository server on a free local port and returns it.
+    """
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StallingHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.stall_seconds = stall_seconds
+    server.waiting = 0  # The number of searches the server has received
+    server.released = 0  # The number of those the client has let go of
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def WaitFor(condition, timeout):
+    """
+    Waits up to timeout seconds for condition to be true, and returns whether it was.
+    """
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        if condition():
+            return True
+        time.sleep(0.01)
+
+    return condition()
+
+
+def Main():
+    parser = argparse.ArgumentParser(description="Checks that a superseded search releases its connections.")
+    parser.add_argument('--repositories', type=int, default=4, help="how many repositories the search is sent to")
+    parser.add_argument('--allowed', type=float, default=2.0, help="the seconds a cancelled search has to let go of its connections")
+    args = parser.parse_args()
+
+    sys.path[0:0] = [PLUGIN_DIR, os.path.join(PLUGIN_DIR, 'ext_lib')]
+    from Utils import SearchWorker
+
+    # The deadline is far longer than the time allowed, so only cancelling can end the search in time
+    deadline = 30.0
+    server = StartServer(deadline)
+    base_url = 'http://127.0.0.1:' + str(server.server_address[1])
+
+    worker = SearchWorker()
+    worker.repo_urls = [base_url + '/repository' + str(index) for index in range(args.repositories)]
+    worker.search_text = 'bolt'
+    worker.deadline = deadline
+    worker.start()
+
+    if not WaitFor(lambda: server.waiting == args.repositories, 10.0):
+        print("FAILED: only " + str(server.waiting) + " of " + str(args.repositories) + " repositories were asked")
+        sys.exit(1)
+
+    start = time.monotonic()
+    worker.Cancel()
+    is_released = WaitFor(lambda: server.released == args.repositories, args.allowed)
+    is_finished = worker.wait(int(args.allowed * 1000))
+    elapsed = time.monotonic() - start
+
+    print("Connections released: " + str(server.released) + " of " + str(args.repositories))
+    print("Connections still in use: " + str(worker.adapter.InFlight()))
+    print("Worker finished: " + ("yes" if is_finished else "no") + " (" + format(elapsed * 1000.0, '.0f') + " ms after cancelling)")
+
+    if not is_released or not is_finished or worker.adapter.InFlight() != 0:
+        print("FAILED")
+        sys.exit(1)
+
+    print("OK")
+
+
+if __name__ == '__main__':
+    Main()
@@ -0,0 +1,134 @@
+# Measures how much the OCCI workbench adds to FreeCAD's start up and to
+# switching workbenches. Run it with a normal Python interpreter:
+#
+#   python tools/StartupBenchmark.py --label before
+#   (check out or install the new version of the plugin)
+#   python tools/StartupBenchmark.py --label after
+#
+# Each run launches FreeCAD with this file as its startup macro. Inside
+# FreeCAD the macro times the first activation of the OCCI workbench, which
+# runs Initialize and builds the dock, and a switch away and back again, then
+# writes what it measured to the file named by OCCI_BENCHMARK_OUTPUT. The
+# medians of all the runs are appended to the results file as one JSON line,
+# and are compared with the first set of results recorded with another label.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# The workbench that FreeCAD is switched to and back from
+OTHER_WORKBENCH = "PartWorkbench"
+
+# The measurements that are reported, in the order they are printed
+METRICS = ['launch_s', 'first_activation_ms', 'switch_away_ms', 'switch_back_ms']
+
+
+def MeasureInFreeCAD(output_path, start_time):
+    """
+    Runs inside FreeCAD. Times the workbench switches and writes the results to output_path.
+    """
+    import FreeCADGui
+
+    results = {}
+
+    # Everything up to this point is FreeCAD starting up, including the InitGui files of all the workbenches
+    results['launch_s'] = time.time() - start_time
+
+    start = time.perf_counter()
+    FreeCADGui.activateWorkbench("OCCIWorkbench")
+    results['first_activation_ms'] = (time.perf_counter() - start) * 1000.0
+
+    start = time.perf_counter()
+    FreeCADGui.activateWorkbench(OTHER_WORKBENCH)
+    results['switch_away_ms'] = (time.perf_counter() - start) * 1000.0
+
+    start = time.perf_counter()
+    FreeCADGui.activateWorkbench("OCCIWorkbench")
+    results['switch_back_ms'] = (time.perf_counter() - start) * 1000.0
+
+    # Shows whether the network stack was loaded before it was needed
+    results['requests_imported'] = 'requests' in sys.modules
+
+    with open(output_path, 'w') as output_file:
+        json.dump(results, output_file)
+
+    # There is nothing to save, so FreeCAD does not need to shut down cleanly
+    os._exit(0)
+
+
+def RunOnce(freecad, timeout):
+    """
+    Launches FreeCAD once and returns the measurements it wrote.
+    """
+    fd, output_path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+
+    env = dict(os.environ)
+    env['OCCI_BENCHMARK_OUTPUT'] = output_path
+    env['OCCI_BENCHMARK_START'] = repr(time.time())
+
+    try:
+        subprocess.run([freecad, os.path.abspath(__file__)], env=env, timeout=timeout,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        with open(output_path) as output_file:
+            return json.load(output_file)
+    finally:
+        os.remove(output_path)
+
+
+def Compare(results_path, record):
+    """
+    Prints the change from the first recorded results with a different label.
+    """
+    if not os.path.exists(results_path):
+        return
+
+    with open(results_path) as results_file:
+        records = [json.loads(line) for line in results_file if line.strip() != ""]
+
+    baselines = [previous for previous in records if previous['label'] != record['label']]
+    if len(baselines) == 0:
+        return
+
+    baseline = baselines[0]
+    print("Compared with '" + baseline['label'] + "':")
+    for metric in METRICS:
+        change = record[metric] - baseline[metric]
+        print("  " + metric + ": " + format(baseline[metric], '.3f') + " -> " + format(record[metric], '.3f') + " (" + format(change, '+.3f') + ")")
+
+
+def Main():
+    parser = argparse.ArgumentParser(description="Measures the start up overhead of the OCCI workbench.")
+    parser.add_argument('--freecad', default='freecad', help="the FreeCAD executable to launch")
+    parser.add_argument('--runs', type=int, default=5, help="how many times to launch FreeCAD")
+    parser.add_argument('--label', default='current', help="the name the results are recorded under")
+    parser.add_argument('--results', default='startup_benchmark.jsonl', help="the file the results are appended to")
+    parser.add_argument('--timeout', type=float, default=120.0, help="the seconds to wait for each launch")
+    args = parser.parse_args()
+
+    runs = []
+    for run in range(args.runs):
+        runs.append(RunOnce(args.freecad, args.timeout))
+        print("Run " + str(run + 1) + ": " + ", ".join(metric + "=" + format(runs[-1][metric], '.3f') for metric in METRICS))
+
+    # The median keeps one slow launch, such as the first one with a cold disk cache, from skewing the results
+    record = {'label': args.label, 'runs': len(runs), 'requests_imported': any(run['requests_imported'] for run in runs)}
+    for metric in METRICS:
+        record[metric] = statistics.median(run[metric] for run in runs)
+
+    Compare(args.results, record)
+
+    with open(args.results, 'a') as results_file:
+        results_file.write(json.dumps(record) + "\n")
+
+
+if __name__ == '__main__':
+    if 'OCCI_BENCHMARK_OUTPUT' in os.environ:
+        MeasureInFreeCAD(os.environ['OCCI_BENCHMARK_OUTPUT'], float(os.environ['OCCI_BENCHMARK_START']))
+    else:
+        Main()